@@ -0,0 +1,59 @@
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.utils.cache import get_conditional_response
+from django.utils.functional import classproperty
+from django.utils.http import quote_etag
+
+
+# Async-обработчики во view DRF. APIView.dispatch синхронный, поэтому
+# AsyncAPIViewMixin подменяет его: аутентификация, права и throttling
+# (им нужна БД и кэш) выполняются в потоке через sync_to_async, а сам
+# обработчик - в event loop ASGI-сервера. Синхронные обработчики той же view
+# (put, delete) идут через обычный dispatch в потоке, так что async можно
+# делать только читающие методы.
+
+class AsyncAPIViewMixin:
+    @classproperty
+    def view_is_async(cls):
+        # Django требует, чтобы все обработчики были одного вида; dispatch ниже умеет оба
+        return True
+
+    async def dispatch(self, request, *args, **kwargs):
+        handler = getattr(self, request.method.lower(), None)
+        if handler is None or request.method.lower() not in self.http_method_names or not iscoroutinefunction(handler):
+            return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+def async_condition(etag_func):
+    """condition(etag_func=...) для async-обработчика: etag_func вызывается в потоке"""
+
+    def decorator(handler):
+        @wraps(handler)
+        async def inner(self, request, *args, **kwargs):
+            etag = await sync_to_async(etag_func)(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await handler(self, request, *args, **kwargs)
+            if etag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', etag)
+            return response
+
+        return inner
+
+    return decorator
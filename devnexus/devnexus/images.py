@@ -0,0 +1,244 @@
+import io
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal, receiver
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+
+# Загрузка и миниатюры изображений (User.avatar, Group.icon).
+# При загрузке файл проверяется и перекодируется без метаданных (EXIF, GPS и т.п.),
+# миниатюры SIZES в WebP и JPEG строятся после коммита в пуле потоков.
+# Пути миниатюр хранятся в JSON-поле модели (<поле>_variants), в ответы API
+# попадает только подходящая миниатюра, оригинал - никогда.
+
+logger = logging.getLogger('devnexus.images')
+
+FORMATS = ('webp', 'jpeg')
+
+# Формат хранения оригинала после перекодирования
+STORED_FORMATS = {'JPEG': 'JPEG', 'PNG': 'PNG', 'WEBP': 'WEBP', 'GIF': 'PNG'}
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+# Миниатюры изображения готовы: sender - модель, pk - объект
+variants_ready = Signal()
+
+
+def sanitize_image(upload):
+    """Проверяет загруженный файл и возвращает ContentFile без метаданных со случайным именем"""
+    config = settings.IMAGE_PIPELINE
+    if upload.size > config['MAX_UPLOAD_SIZE']:
+        raise serializers.ValidationError(f"Файл больше {config['MAX_UPLOAD_SIZE'] // (1024 * 1024)} МБ.")
+    try:
+        upload.seek(0)
+        image = Image.open(upload)
+        source_format = image.format
+        if source_format not in STORED_FORMATS:
+            raise serializers.ValidationError("Поддерживаются изображения JPEG, PNG, WebP и GIF.")
+        if image.width * image.height > config['MAX_PIXELS']:
+            raise serializers.ValidationError("Слишком большое разрешение изображения.")
+        image = ImageOps.exif_transpose(image)
+        target = STORED_FORMATS[source_format]
+        if target == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        # Пересохранение без exif/icc_profile отбрасывает все метаданные
+        image.save(output, target, **({'quality': 90} if target in ('JPEG', 'WEBP') else {'optimize': True}))
+    except (OSError, Image.DecompressionBombError, SyntaxError):
+        raise serializers.ValidationError("Файл не является корректным изображением.")
+    return ContentFile(output.getvalue(), name=f"{uuid.uuid4().hex}.{EXTENSIONS[target]}")
+
+
+def render_variants(name, sizes):
+    """Строит квадратные миниатюры оригинала name, возвращает {размер: {формат: путь}}"""
+    config = settings.IMAGE_PIPELINE
+    base = name.rsplit('/', 1)
+    directory, stem = (base[0] + '/', base[1]) if len(base) == 2 else ('', base[0])
+    stem = stem.rsplit('.', 1)[0]
+    with default_storage.open(name) as original:
+        image = Image.open(original)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+    variants = {}
+    for size in sizes:
+        thumbnail = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        flat = thumbnail
+        if thumbnail.mode == 'RGBA':
+            # В JPEG нет прозрачности: кладем на белый фон
+            flat = Image.new('RGB', thumbnail.size, (255, 255, 255))
+            flat.paste(thumbnail, mask=thumbnail.getchannel('A'))
+        paths = {}
+        for image_format, picture, options in (
+            ('webp', thumbnail, {'quality': config['WEBP_QUALITY'], 'method': 4}),
+            ('jpeg', flat, {'quality': config['JPEG_QUALITY'], 'optimize': True, 'progressive': True}),
+        ):
+            output = io.BytesIO()
+            picture.save(output, image_format.upper(), **options)
+            path = f"{directory}thumbs/{stem}_{size}.{'jpg' if image_format == 'jpeg' else image_format}"
+            paths[image_format] = default_storage.save(path, ContentFile(output.getvalue()))
+        variants[str(size)] = paths
+    return variants
+
+
+def variant_paths(variants):
+    return [path for paths in variants.values() for path in paths.values()]
+
+
+def delete_files(paths):
+    for path in paths:
+        try:
+            default_storage.delete(path)
+        except OSError:
+            logger.warning("Не удалось удалить %s", path, exc_info=True)
+
+
+def build_variants(model_label, pk, field_name, name, stale):
+    """
+    Задача пула: строит миниатюры и записывает их пути, только если
+    у объекта все еще тот же оригинал (его могли успеть заменить).
+    """
+    model = apps.get_model(model_label)
+    variants_field = f'{field_name}_variants'
+    try:
+        variants = render_variants(name, settings.IMAGE_PIPELINE['SIZES']) if name else {}
+        updated = model.objects.filter(pk=pk, **{field_name: name}).update(**{variants_field: variants})
+        if not updated:
+            delete_files(variant_paths(variants))
+        delete_files(stale)
+        if updated:
+            variants_ready.send(sender=model, pk=pk)
+    except Exception:
+        logger.exception("Не удалось построить миниатюры %s #%s", model_label, pk)
+    finally:
+        close_old_connections()
+
+
+class ThumbnailPipeline:
+    def __init__(self, workers=2):
+        # workers=0 - задачи выполняются сразу в вызывающем потоке
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnails') if workers else None
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    def submit(self, *args):
+        if self.executor is None:
+            build_variants(*args)
+            return
+        future = self.executor.submit(build_variants, *args)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def join(self, timeout=None):
+        """Ждет завершения уже поставленных задач"""
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.result(timeout)
+
+
+_pipeline = None
+
+
+def thumbnail_pipeline():
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = ThumbnailPipeline(workers=settings.IMAGE_PIPELINE['WORKERS'])
+    return _pipeline
+
+
+@receiver(setting_changed)
+def reset_thumbnail_pipeline(setting, **kwargs):
+    global _pipeline
+    if setting == 'IMAGE_PIPELINE':
+        _pipeline = None
+
+
+def schedule_variants(instance, field_name, stale=()):
+    """После коммита ставит в очередь построение миниатюр поля field_name"""
+    name = getattr(instance, field_name).name or ''
+    args = (instance._meta.label, instance.pk, field_name, name, list(stale))
+    transaction.on_commit(lambda: thumbnail_pipeline().submit(*args))
+
+
+def variant_url(instance, field_name, request=None, size=None, image_format=None):
+    """
+    URL наименьшей миниатюры не меньше size (по умолчанию DEFAULT_SIZE) в формате
+    image_format; пока миниатюр нет - None. Параметры берутся и из запроса:
+    ?image_size=64&image_format=jpeg.
+    URL всегда такой, как его дает хранилище (MEDIA_URL), без хоста запроса: снимок
+    доски собирается без запроса и общий для всех, профили должны совпадать с ним.
+    """
+    config = settings.IMAGE_PIPELINE
+    variants = getattr(instance, f'{field_name}_variants', None)
+    if not getattr(instance, field_name) or not variants:
+        return None
+    if request is not None:
+        try:
+            size = size or int(request.query_params.get('image_size', 0)) or None
+        except ValueError:
+            size = None
+        image_format = image_format or request.query_params.get('image_format')
+    size = size or config['DEFAULT_SIZE']
+    if image_format not in FORMATS:
+        image_format = config['DEFAULT_FORMAT']
+
+    sizes = sorted(int(available) for available in variants)
+    fitting = [available for available in sizes if available >= size]
+    path = variants[str(fitting[0] if fitting else sizes[-1])][image_format]
+    return default_storage.url(path)
+
+
+class ImageVariantField(serializers.ImageField):
+    """
+    На входе - загрузка изображения (проверка и очистка через sanitize_image),
+    на выходе - URL подходящей миниатюры вместо оригинала.
+    """
+
+    def get_attribute(self, instance):
+        return instance
+
+    def to_internal_value(self, data):
+        return sanitize_image(super().to_internal_value(data))
+
+    def to_representation(self, instance):
+        return variant_url(instance, self.source, request=self.context.get('request'))
+
+
+class ImageVariantsSerializerMixin:
+    """Сбрасывает миниатюры при замене изображения и ставит в очередь построение новых"""
+
+    def save(self, **kwargs):
+        image_fields = [
+            field.source for field in self.fields.values()
+            if isinstance(field, ImageVariantField) and field.source in self.validated_data
+        ]
+        stale = []
+        if self.instance is not None:
+            for field_name in image_fields:
+                stale += variant_paths(getattr(self.instance, f'{field_name}_variants') or {})
+                previous = getattr(self.instance, field_name)
+                if previous:
+                    stale.append(previous.name)
+        for field_name in image_fields:
+            kwargs[f'{field_name}_variants'] = {}
+        instance = super().save(**kwargs)
+        for field_name in image_fields:
+            schedule_variants(instance, field_name, stale)
+            stale = []
+        return instance
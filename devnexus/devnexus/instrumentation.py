@@ -0,0 +1,281 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+
+# Инструментация запросов: число SQL-запросов, время в БД, время сериализации
+# и общее время на каждый URL (по имени view из resolver, например group:group-detail).
+# Статистика текущего запроса живет в contextvar, поэтому ее видят и потоки
+# sync_to_async, в которых async-view ходят в БД.
+
+logger = logging.getLogger(__name__)
+
+UNRESOLVED_VIEW = '<unresolved>'
+
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+
+_current = ContextVar('request_stats', default=None)
+
+
+def current_stats():
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - start
+        stats.queries += 1
+
+
+def install_query_recorder(connection, **kwargs):
+    # В начало списка: connection.execute_wrapper() снимает свои обертки с конца
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+class InstrumentedSerializerMixin:
+    """Считает время to_representation; вложенные сериализаторы не считаются повторно."""
+
+    def to_representation(self, instance):
+        stats = _current.get()
+        if stats is None:
+            return super().to_representation(instance)
+        stats.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_depth -= 1
+            if not stats.serializer_depth:
+                stats.serializer_time += time.perf_counter() - start
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+HISTOGRAMS = {
+    'devnexus_request_duration_seconds': ('Общее время обработки запроса', SECONDS_BUCKETS),
+    'devnexus_request_db_seconds': ('Время SQL-запросов за запрос', SECONDS_BUCKETS),
+    'devnexus_request_serializer_seconds': ('Время сериализации ответа', SECONDS_BUCKETS),
+    'devnexus_request_queries': ('Число SQL-запросов за запрос', QUERY_BUCKETS),
+}
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._violations = {}
+
+    def observe(self, view_name, stats, total_time):
+        values = {
+            'devnexus_request_duration_seconds': total_time,
+            'devnexus_request_db_seconds': stats.db_time,
+            'devnexus_request_serializer_seconds': stats.serializer_time,
+            'devnexus_request_queries': stats.queries,
+        }
+        with self._lock:
+            for name, value in values.items():
+                histogram = self._histograms.get((name, view_name))
+                if histogram is None:
+                    histogram = self._histograms[(name, view_name)] = Histogram(HISTOGRAMS[name][1])
+                histogram.observe(value)
+
+    def violation(self, view_name, metric):
+        with self._lock:
+            key = (view_name, metric)
+            self._violations[key] = self._violations.get(key, 0) + 1
+
+    def violations(self):
+        with self._lock:
+            return dict(self._violations)
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            for name, (help_text, buckets) in HISTOGRAMS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (metric, view_name), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{view="{view_name}",le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{view="{view_name}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{view="{view_name}"}} {histogram.count}')
+            lines += [
+                '# HELP devnexus_request_budget_violations_total Превышения бюджета запроса',
+                '# TYPE devnexus_request_budget_violations_total counter',
+            ]
+            for (view_name, metric), count in sorted(self._violations.items()):
+                lines.append(f'devnexus_request_budget_violations_total{{view="{view_name}",metric="{metric}"}} {count}')
+        return lines
+
+
+metrics = RequestMetrics()
+
+
+def budget_for(view_name):
+    config = settings.REQUEST_INSTRUMENTATION
+    return config['BUDGETS'].get(view_name, config.get('DEFAULT_BUDGET') or {})
+
+
+def check_budget(view_name, stats, total_time):
+    measured = {
+        'queries': stats.queries,
+        'db_ms': stats.db_time * 1000,
+        'serializer_ms': stats.serializer_time * 1000,
+        'total_ms': total_time * 1000,
+    }
+    for metric, limit in budget_for(view_name).items():
+        value = measured[metric]
+        if value > limit:
+            metrics.violation(view_name, metric)
+            logger.warning(
+                "Превышен бюджет %s: %s=%s при лимите %s", view_name, metric, round(value, 1), limit,
+            )
+
+
+class RequestInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Соединения, открытые до загрузки middleware, сигнал connection_created уже пропустили
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    def finish(self, request, response, stats, total_time):
+        resolver_match = getattr(request, 'resolver_match', None)
+        view_name = resolver_match.view_name if resolver_match else UNRESOLVED_VIEW
+        metrics.observe(view_name, stats, total_time)
+        check_budget(view_name, stats, total_time)
+        if settings.REQUEST_INSTRUMENTATION['HEADERS']:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={stats.db_time * 1000:.1f}',
+                f'serializer;dur={stats.serializer_time * 1000:.1f}',
+                f'total;dur={total_time * 1000:.1f}',
+            ])
+            response['X-Query-Count'] = str(stats.queries)
+        return response
+
+
+def snapshot_cache_lines():
+    from group.cache import snapshot_cache
+
+    stats = snapshot_cache().stats()
+    return [
+        '# HELP devnexus_board_snapshot_cache_total Обращения к кэшу снимков доски',
+        '# TYPE devnexus_board_snapshot_cache_total counter',
+        f'devnexus_board_snapshot_cache_total{{result="hit"}} {stats["hits"]}',
+        f'devnexus_board_snapshot_cache_total{{result="miss"}} {stats["misses"]}',
+    ]
+
+
+def auth_throttle_lines():
+    from user.throttling import metrics_lines
+
+    return metrics_lines()
+
+
+DB_POOL_GAUGES = {
+    'pool_size': ('devnexus_db_pool_connections', 'Соединения в пуле БД (занятые и свободные)'),
+    'pool_available': ('devnexus_db_pool_available', 'Свободные соединения в пуле БД'),
+    'requests_waiting': ('devnexus_db_pool_requests_waiting', 'Запросы, ждущие соединение из пула БД'),
+}
+
+
+def db_pool_lines():
+    # Только для баз с пулом psycopg (DB_CONN_MODE=pool), см. settings.py
+    pools = {alias: getattr(connections[alias], 'pool', None) for alias in connections}
+    stats = {alias: pool.get_stats() for alias, pool in pools.items() if pool is not None}
+    lines = []
+    for key, (name, help_text) in DB_POOL_GAUGES.items():
+        if stats:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+        for alias, values in sorted(stats.items()):
+            lines.append(f'{name}{{alias="{alias}"}} {values.get(key, 0)}')
+    return lines
+
+
+def metrics_view(request):
+    """
+    Гистограммы по view в формате Prometheus: по Bearer-токену METRICS_TOKEN или всем,
+    если явно включен METRICS_PUBLIC. От DEBUG доступ не зависит: он включен по умолчанию
+    """
+    config = settings.REQUEST_INSTRUMENTATION
+    token = config['METRICS_TOKEN']
+    if not config['METRICS_PUBLIC']:
+        auth = request.headers.get('Authorization', '').split()
+        if not token or len(auth) != 2 or auth[0].lower() != 'bearer' or not constant_time_compare(auth[1], token):
+            return HttpResponse(status=403)
+    lines = metrics.render() + snapshot_cache_lines() + auth_throttle_lines() + db_pool_lines()
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
+import os
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'devnexus.instrumentation.RequestInstrumentationMiddleware',
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -93,9 +96,42 @@ DATABASES = {
         "PASSWORD": config('DB_PASSWORD'),
         "HOST": config('DB_HOST', default='localhost'),
         "PORT": config('DB_PORT', default='5432'),
+        # Для PgBouncer в режиме transaction: курсоры выгрузки (iterator()) не переживают смену соединения
+        "DISABLE_SERVER_SIDE_CURSORS": config('DB_DISABLE_SERVER_SIDE_CURSORS', default=False, cast=bool),
     }
 }
 
+# Соединения с БД (DB_CONN_MODE):
+# persistent - соединение потока живет DB_CONN_MAX_AGE секунд и перед повторным
+#   использованием проверяется (CONN_HEALTH_CHECKS); подходит для синхронных воркеров;
+# pool - пул psycopg 3 (только PostgreSQL): под ASGI каждый запрос идет в новом
+#   потоке, и постоянные соединения потоков копились бы, а пул отдает их повторно;
+# none - новое соединение на каждый запрос.
+SERVER_MODE = config('SERVER_MODE', default='asgi')
+IS_POSTGRESQL = DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql'
+DB_CONN_MODE = config('DB_CONN_MODE', default='pool' if SERVER_MODE == 'asgi' and IS_POSTGRESQL else 'persistent')
+
+if DB_CONN_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+elif DB_CONN_MODE == 'pool':
+    if not IS_POSTGRESQL:
+        raise ImproperlyConfigured("DB_CONN_MODE=pool поддерживается только для PostgreSQL.")
+    # Размеры пула - на каждый воркер gunicorn: workers * DB_POOL_MAX_SIZE не должно превышать max_connections
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            # Сколько секунд запрос ждет свободное соединение, прежде чем упасть с ошибкой
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float),
+            # Соединения старше max_lifetime и простаивающие дольше max_idle закрываются пулом
+            'max_lifetime': config('DB_POOL_MAX_LIFETIME', default=1800, cast=float),
+            'max_idle': config('DB_POOL_MAX_IDLE', default=300, cast=float),
+        },
+    }
+elif DB_CONN_MODE != 'none':
+    raise ImproperlyConfigured(f"DB_CONN_MODE должен быть persistent, pool или none, а не {DB_CONN_MODE!r}.")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -115,6 +151,32 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# pbkdf2_sha256 считается в пуле процессов (user/hashing.py); остальные хэшеры -
+# только для проверки паролей, сохраненных ими раньше
+PASSWORD_HASHERS = [
+    'user.hashing.PooledPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# ITERATIONS по умолчанию как у PBKDF2PasswordHasher в Django 5.1.
+# При заполненной очереди (WORKERS + QUEUE_SIZE задач) вход и регистрация получают 429.
+# Пул свой в каждом воркере gunicorn (WEB_CONCURRENCY, см. gunicorn.conf.py),
+# поэтому ядра делятся между воркерами: всего на хосте около cpu_count процессов
+PASSWORD_HASHING = {
+    "ITERATIONS": config('PASSWORD_HASH_ITERATIONS', default=870000, cast=int),
+    "WORKERS": config(
+        'PASSWORD_HASH_WORKERS',
+        default=max(1, (os.cpu_count() or 1) // config('WEB_CONCURRENCY', default=1, cast=int)),
+        cast=int,
+    ),
+    "QUEUE_SIZE": config('PASSWORD_HASH_QUEUE_SIZE', default=32, cast=int),
+    "START_METHOD": config('PASSWORD_HASH_START_METHOD', default='forkserver'),
+    "RETRY_AFTER": 1,
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -158,8 +220,14 @@ LOGIN_URL = "/user/login/"
 REST_FRAMEWORK = {    
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    ) 
+        'user.authentication.TokenVersionJWTAuthentication',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'user-lookup': config('USER_LOOKUP_RATE', default='120/minute'),
+    },
+    # Сколько доверенных прокси стоит перед приложением. 0 - IP клиента для throttle
+    # берется из REMOTE_ADDR, X-Forwarded-For не учитывается (его может подставить кто угодно)
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
 }
 
 SIMPLE_JWT = {
@@ -194,7 +262,7 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_LIFETIME": timedelta(hours=10),
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=3),
 
-    "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
+    "TOKEN_OBTAIN_SERIALIZER": "user.authentication.TokenVersionObtainPairSerializer",
     "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
@@ -202,5 +270,152 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSlidingSerializer",
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": config('CACHE_LOCATION', default=''),
+    }
+}
+
+# Кэш снимков доски группы (group/cache.py).
+# LocMemSnapshotBackend держит снимки в памяти процесса и подходит для одного воркера;
+# для нескольких воркеров gunicorn - group.cache.DjangoCacheSnapshotBackend поверх общего CACHES.
+BOARD_SNAPSHOT_CACHE = {
+    "BACKEND": config('BOARD_SNAPSHOT_BACKEND', default='group.cache.LocMemSnapshotBackend'),
+    "OPTIONS": {},
+    # Сколько секунд снимок живет в общем кэше (DjangoCacheSnapshotBackend): снимки
+    # прежних версий больше не читаются и должны истекать. Ключи версий хранятся без срока
+    "SNAPSHOT_TIMEOUT": config('BOARD_SNAPSHOT_TIMEOUT', default=3600, cast=int),
+}
+
+# Ограничение попыток входа (/users/login/, /api/token/) и регистрации (user/throttling.py):
+# корзина на N попыток, полностью наполняется за период. Для нескольких узлов -
+# STORE=user.throttling.CacheBucketStore поверх общего CACHES
+AUTH_THROTTLE = {
+    "STORE": config('AUTH_THROTTLE_STORE', default='user.throttling.ShardedMemoryBucketStore'),
+    "OPTIONS": {},
+    "RATES": {
+        "login": {
+            "ip": config('LOGIN_IP_RATE', default='30/minute'),
+            "username": config('LOGIN_USERNAME_RATE', default='5/minute'),
+        },
+        "register": {
+            "ip": config('REGISTER_IP_RATE', default='10/hour'),
+        },
+    },
+}
+
+# Кэш username/is_active/token_version для JWT-аутентификации (user/authentication.py);
+# сбрасывается при сохранении пользователя, TIMEOUT - страховка
+TOKEN_USER_CACHE = {
+    "CACHE_ALIAS": "default",
+    "TIMEOUT": 60,
+}
+
+# Кэш множеств групп пользователя для IsGroupMember (group/membership.py);
+# сбрасывается при изменении участников группы, TIMEOUT - страховка
+GROUP_MEMBERSHIP_CACHE = {
+    "CACHE_ALIAS": "default",
+    "TIMEOUT": config('GROUP_MEMBERSHIP_CACHE_TIMEOUT', default=300, cast=int),
+}
+
+# Журнал изменений доски (group/changes.py): сколько последних версий хранить
+# на группу и как часто чистить старые
+BOARD_CHANGES = {
+    "RETENTION": config('BOARD_CHANGES_RETENTION', default=1000, cast=int),
+    "COMPACT_EVERY": config('BOARD_CHANGES_COMPACT_EVERY', default=100, cast=int),
+}
+
+# Выгрузка доски (group/export.py): сколько строк читать из курсора за раз
+# и каким блоком (в символах) отдавать ответ
+BOARD_EXPORT = {
+    "CHUNK_SIZE": config('BOARD_EXPORT_CHUNK_SIZE', default=500, cast=int),
+    "BUFFER_SIZE": config('BOARD_EXPORT_BUFFER_SIZE', default=64 * 1024, cast=int),
+}
+
+# Нечеткий поиск по группе (group/search.py): корпуса групп хранятся
+# в памяти процесса, не больше MAX_GROUPS, давно не использованные вытесняются
+BOARD_SEARCH = {
+    "MAX_GROUPS": config('BOARD_SEARCH_MAX_GROUPS', default=100, cast=int),
+    "LIMIT": 10,
+    "MAX_LIMIT": 50,
+    "MAX_QUERY_LENGTH": 100,
+    "SCORE_CUTOFF": config('BOARD_SEARCH_SCORE_CUTOFF', default=60, cast=int),
+}
+
+# Полнотекстовый поиск карточек (group/search_backends.py). Пустой BACKEND -
+# PostgresCardSearchBackend для PostgreSQL и BasicCardSearchBackend для остальных баз
+CARD_SEARCH = {
+    "BACKEND": config('CARD_SEARCH_BACKEND', default=''),
+    "OPTIONS": {},
+}
+
+# Автодополнение имен пользователей (user/lookup.py): индекс в памяти процесса
+# перестраивается в фоне после переименований и удалений (версия в кэше CACHE_ALIAS)
+# и не реже раза в REBUILD_INTERVAL секунд
+USER_LOOKUP = {
+    "LIMIT": 10,
+    "MAX_LIMIT": 50,
+    "REBUILD_INTERVAL": config('USER_LOOKUP_REBUILD_INTERVAL', default=600, cast=int),
+    "CACHE_ALIAS": "default",
+}
+
+# Загрузка изображений и миниатюры (devnexus/images.py). Миниатюры SIZES строятся
+# в WORKERS потоках после коммита; WORKERS=0 - сразу, в потоке запроса
+IMAGE_PIPELINE = {
+    "SIZES": [48, 96, 256],
+    "DEFAULT_SIZE": 96,
+    "DEFAULT_FORMAT": "webp",
+    "WEBP_QUALITY": 80,
+    "JPEG_QUALITY": 85,
+    "MAX_UPLOAD_SIZE": 5 * 1024 * 1024,
+    "MAX_PIXELS": 25_000_000,
+    "WORKERS": config('IMAGE_PIPELINE_WORKERS', default=2, cast=int),
+}
+
+# Рассылка изменений доски по WebSocket (group/broker.py, devnexus/asgi.py).
+# InProcessBroker работает в пределах одного процесса; для нескольких узлов
+# нужна своя реализация group.broker.BaseBroker поверх общей шины.
+BOARD_BROKER = {
+    "BACKEND": config('BOARD_BROKER_BACKEND', default='group.broker.InProcessBroker'),
+    "OPTIONS": {
+        "queue_size": config('BOARD_BROKER_QUEUE_SIZE', default=100, cast=int),
+        "history_size": config('BOARD_BROKER_HISTORY_SIZE', default=100, cast=int),
+    },
+}
+
+# Server-Sent Events доски (group/realtime.py): интервал heartbeat в секундах
+# и задержка переподключения для EventSource. RECHECK - как часто открытые
+# WebSocket и потоки событий заново проверяют токен и членство в группе.
+# QUERY_TOKEN разрешает потоку событий ?token= для нативного EventSource, который
+# не умеет заголовки; токен при этом оседает в логах доступа
+BOARD_EVENTS = {
+    "HEARTBEAT": config('BOARD_EVENTS_HEARTBEAT', default=15, cast=int),
+    "RETRY_MS": config('BOARD_EVENTS_RETRY_MS', default=3000, cast=int),
+    "RECHECK": config('BOARD_EVENTS_RECHECK', default=60, cast=int),
+    "QUERY_TOKEN": config('BOARD_EVENTS_QUERY_TOKEN', default=False, cast=bool),
+    # Сколько секунд поток ждет версию, пришедшую не по порядку, прежде чем отправить resync
+    "GAP_TIMEOUT": config('BOARD_EVENTS_GAP_TIMEOUT', default=5, cast=int),
+}
+
+# Инструментация запросов (devnexus/instrumentation.py): заголовки Server-Timing
+# и X-Query-Count, гистограммы на /metrics/ и бюджеты по имени view.
+# Бюджет - лимиты queries, db_ms, serializer_ms, total_ms; превышение пишется
+# в лог и в счетчик devnexus_request_budget_violations_total.
+REQUEST_INSTRUMENTATION = {
+    "HEADERS": config('REQUEST_TIMING_HEADERS', default=DEBUG, cast=bool),
+    "METRICS_TOKEN": config('METRICS_TOKEN', default=''),
+    # /metrics/ без токена - только для локальной разработки, по умолчанию выключено
+    "METRICS_PUBLIC": config('METRICS_PUBLIC', default=False, cast=bool),
+    "DEFAULT_BUDGET": {"queries": 30, "total_ms": 1000},
+    "BUDGETS": {
+        "group:group-detail": {"queries": 10, "total_ms": 300},
+        "group:card-list": {"queries": 5, "total_ms": 300},
+        "group:board-changes": {"queries": 5, "total_ms": 200},
+        "user:me": {"queries": 15, "total_ms": 500},
+        "user:profile": {"queries": 15, "total_ms": 500},
+    },
+}
+
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS =True
\ No newline at end of file
@@ -0,0 +1,43 @@
+from django.conf import settings
+
+
+# Часть состояния по умолчанию живет в памяти процесса: кэш Django (LocMemCache),
+# снимки доски, рассылка изменений, корзины ограничения попыток входа. С несколькими
+# воркерами gunicorn каждый видит свою копию: сброс кэша или событие доски в одном
+# воркере не доходят до остальных. gunicorn.conf.py не запускает больше одного
+# воркера, пока такие бэкенды не заменены общими (Redis/Memcached и т. п.).
+
+PROCESS_LOCAL_CACHES = {'django.core.cache.backends.locmem.LocMemCache'}
+
+
+def process_local_cache(alias):
+    return settings.CACHES[alias]['BACKEND'] in PROCESS_LOCAL_CACHES
+
+
+def process_local_backends():
+    """Имена настроек, чьи бэкенды хранят состояние в памяти процесса"""
+    local = []
+    if process_local_cache('default'):
+        local.append('CACHES')
+
+    snapshot_cache = settings.BOARD_SNAPSHOT_CACHE
+    if snapshot_cache['BACKEND'] == 'group.cache.LocMemSnapshotBackend' or (
+        snapshot_cache['BACKEND'] == 'group.cache.DjangoCacheSnapshotBackend'
+        and process_local_cache(snapshot_cache['OPTIONS'].get('cache_alias', 'default'))
+    ):
+        local.append('BOARD_SNAPSHOT_CACHE')
+
+    if settings.BOARD_BROKER['BACKEND'] == 'group.broker.InProcessBroker':
+        local.append('BOARD_BROKER')
+
+    throttle = settings.AUTH_THROTTLE
+    if throttle['STORE'] == 'user.throttling.ShardedMemoryBucketStore' or (
+        throttle['STORE'] == 'user.throttling.CacheBucketStore'
+        and process_local_cache(throttle['OPTIONS'].get('cache_alias', 'default'))
+    ):
+        local.append('AUTH_THROTTLE')
+
+    for name in ('TOKEN_USER_CACHE', 'GROUP_MEMBERSHIP_CACHE', 'USER_LOOKUP'):
+        if process_local_cache(getattr(settings, name)['CACHE_ALIAS']):
+            local.append(name)
+    return local
@@ -0,0 +1,80 @@
+from collections import defaultdict
+from devnexus.images import variant_url
+from user.serializers import UserProfileSerializer
+from .models import Card, ColumnBoard, UserTagRelation
+from .serializers import CardSerializer
+
+
+# Сборка доски группы за фиксированное число запросов:
+# участники, теги участников, колонки, карточки (+ prefetch тегов карточек).
+# Загрузка отделена от сборки, чтобы одну и ту же сборку можно было
+# использовать с любым способом получения данных (load_board и aload_board).
+
+def board_querysets(group):
+    return {
+        'members': group.members.order_by('id'),
+        'user_tags': UserTagRelation.objects.filter(tag__group=group)
+            .values('user_id', 'tag__code', 'tag__name', 'tag__color')
+            .order_by('id'),
+        'columns': ColumnBoard.objects.filter(group=group).order_by('id'),
+        'cards': Card.objects.filter(group=group)
+            .select_related('column', 'assignee')
+            .prefetch_related('tags')
+            .order_by('id'),
+    }
+
+
+def load_board(group):
+    return {name: list(queryset) for name, queryset in board_querysets(group).items()}
+
+
+async def aload_board(group):
+    # Те же запросы через async ORM, для async-view
+    return {name: [obj async for obj in queryset] for name, queryset in board_querysets(group).items()}
+
+
+def assemble_board(group, members, user_tags, columns, cards):
+    tags_by_user = defaultdict(list)
+    for relation in user_tags:
+        tags_by_user[relation['user_id']].append({
+            'code': relation['tag__code'],
+            'name': relation['tag__name'],
+            'color': relation['tag__color'],
+        })
+
+    members_data = UserProfileSerializer(members, many=True).data
+    for member, member_data in zip(members, members_data):
+        member_data['tags'] = tags_by_user.get(member.id, [])
+
+    # Один проход по карточкам: раскладываем по id колонки
+    tasks_by_column = defaultdict(list)
+    cards_data = CardSerializer(cards, many=True).data
+    for card, card_data in zip(cards, cards_data):
+        tasks_by_column[card.column_id].append(card_data)
+
+    columns_data = [
+        {
+            'name': column.name,
+            'color': column.color,
+            'code': column.id,
+            'tasks': tasks_by_column.get(column.id, []),
+        }
+        for column in columns
+    ]
+
+    return {
+        'name': group.name,
+        'description': group.description,
+        'group_uuid': group.group_uuid,
+        'icon': variant_url(group, 'icon'),
+        'members': members_data,
+        'board': {'columns': columns_data},
+    }
+
+
+def build_board(group):
+    return assemble_board(group, **load_board(group))
+
+
+async def abuild_board(group):
+    return assemble_board(group, **await aload_board(group))
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+# Брокер событий доски: изменения из журнала (changes.py) после коммита
+# рассылаются всем подписчикам группы (WebSocket-соединениям).
+# publish вызывается из синхронного кода в любом потоке, подписчики живут
+# в event loop ASGI-сервера.
+
+class Subscription:
+    def __init__(self, group_uuid, queue_size):
+        self.group_uuid = group_uuid
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def deliver(self, message):
+        if self.overflowed:
+            return
+        if self.queue.full():
+            # Клиент не успевает читать: вместо потери части событий
+            # отключаем его, он досинхронизируется через /changes/
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        """Следующее событие или None, если подписка переполнилась"""
+        return await self.queue.get()
+
+
+class History:
+    """
+    Кольцевой буфер последних событий группы. События приходят не обязательно
+    по порядку версий (publish из on_commit разных потоков), поэтому буфер
+    помнит floor: версии больше floor, если уже опубликованы, в буфере есть.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.messages = deque()
+        self.floor = None
+
+    def extend(self, messages):
+        for message in messages:
+            if self.floor is None:
+                # Что было до первого события, буфер не видел
+                self.floor = message['version'] - 1
+            self.messages.append(message)
+            if len(self.messages) > self.size:
+                evicted = self.messages.popleft()
+                self.floor = max(self.floor, evicted['version'])
+
+    def after(self, version):
+        if self.floor is None or version < self.floor:
+            return None
+        return sorted(
+            (message for message in self.messages if message['version'] > version),
+            key=lambda message: message['version'],
+        )
+
+
+class BaseBroker:
+    def publish(self, group_uuid, messages):
+        raise NotImplementedError
+
+    def recent(self, group_uuid, after_version):
+        """
+        События группы с версией больше after_version из буфера последних событий
+        по возрастанию версий или None, если буфер не покрывает все такие события.
+        Еще не опубликованные версии (on_commit не дошел) придут через подписку.
+        """
+        return None
+
+    def subscribe(self, group_uuid):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class InProcessBroker(BaseBroker):
+    """Рассылка внутри одного процесса (один узел, ASGI-сервер)."""
+
+    def __init__(self, queue_size=100, history_size=100, history_groups=1000):
+        self.queue_size = queue_size
+        self.history_size = history_size
+        self.history_groups = history_groups
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        # group_uuid -> кольцевой буфер последних событий (для Last-Event-ID)
+        self._history = OrderedDict()
+
+    def publish(self, group_uuid, messages):
+        with self._lock:
+            history = self._history.get(group_uuid)
+            if history is None:
+                history = self._history[group_uuid] = History(self.history_size)
+                while len(self._history) > self.history_groups:
+                    self._history.popitem(last=False)
+            else:
+                self._history.move_to_end(group_uuid)
+            history.extend(messages)
+            subscriptions = list(self._subscriptions.get(group_uuid, ()))
+        for subscription in subscriptions:
+            for message in messages:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+
+    def recent(self, group_uuid, after_version):
+        with self._lock:
+            history = self._history.get(group_uuid)
+            return history.after(after_version) if history is not None else None
+
+    def subscribe(self, group_uuid):
+        subscription = Subscription(group_uuid, self.queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(group_uuid, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.group_uuid)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.group_uuid]
+
+
+_broker = None
+
+
+def broker():
+    global _broker
+    if _broker is None:
+        config = settings.BOARD_BROKER
+        _broker = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    global _broker
+    if setting == 'BOARD_BROKER':
+        _broker = None
+
+
+def change_message(change):
+    return {'version': change.version, 'entity': change.entity, 'op': change.op, 'data': change.payload}
+
+
+def publish_changes(group_uuid, changes):
+    if not changes:
+        return
+    messages = [change_message(change) for change in changes]
+    transaction.on_commit(lambda: broker().publish(group_uuid, messages))
@@ -0,0 +1,176 @@
+from django.db import connection, transaction
+from rest_framework import serializers
+from .models import Card, CardTag, GroupCodeCounter
+from .serializers import CardSerializer, GroupCardTagSerializer
+from .signals import board_changed
+from .validation import GroupValidationContext
+
+
+# Пакетные операции над карточками группы: create, update и move.
+# Колонки, участники и теги берутся из GroupValidationContext, карточки -
+# одной выборкой по кодам; операции проверяются по этим словарям.
+# Запись - bulk_create/bulk_update и одна вставка в таблицу связей с тегами,
+# все в одной транзакции.
+# bulk-методы не отправляют сигналы, поэтому журнал пишется здесь же.
+
+MAX_OPERATIONS = 500
+
+CARD_FIELDS = ('title', 'description', 'column', 'assignee')
+
+
+class BulkTagSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=50)
+    color = serializers.CharField(max_length=20)
+
+
+class BulkCardDataSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=100)
+    description = serializers.CharField(max_length=700, required=False, allow_blank=True)
+    column = serializers.CharField()
+    assignee = serializers.CharField(required=False, allow_null=True)
+    tags = BulkTagSerializer(many=True, required=False)
+
+
+class BulkOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['create', 'update', 'move'])
+    code = serializers.CharField(required=False)
+    column = serializers.CharField(required=False)
+    data = serializers.DictField(required=False)
+
+    def validate(self, attrs):
+        op = attrs['op']
+        if op in ('update', 'move') and not attrs.get('code'):
+            raise serializers.ValidationError({"code": "Укажите код карточки."})
+        if op in ('create', 'update') and 'data' not in attrs:
+            raise serializers.ValidationError({"data": "Укажите поля карточки."})
+        if op == 'move' and not attrs.get('column'):
+            raise serializers.ValidationError({"column": "Укажите колонку."})
+        if op != 'move':
+            data = BulkCardDataSerializer(data=attrs['data'], partial=op == 'update')
+            data.is_valid(raise_exception=True)
+            attrs['data'] = data.validated_data
+        else:
+            attrs['data'] = {'column': attrs['column']}
+        return attrs
+
+
+class BulkCardOperations:
+    def __init__(self, group, operations):
+        self.group = group
+        self.operations = operations
+
+    def validate(self):
+        """Проверяет операции; возвращает список ошибок по позициям или None"""
+        errors = []
+        parsed = []
+        for operation in self.operations:
+            serializer = BulkOperationSerializer(data=operation)
+            if serializer.is_valid():
+                parsed.append(serializer.validated_data)
+                errors.append(None)
+            else:
+                parsed.append(None)
+                errors.append(serializer.errors)
+
+        valid = [operation for operation in parsed if operation is not None]
+        self.preload(valid)
+        for position, operation in enumerate(parsed):
+            if operation is not None:
+                errors[position] = self.check(operation) or None
+
+        self.parsed = parsed
+        return errors if any(errors) else None
+
+    def preload(self, operations):
+        codes = {op['code'] for op in operations if op['op'] != 'create'}
+        self.validation = GroupValidationContext(self.group)
+        self.cards = {
+            card.code: card
+            for card in Card.objects.filter(group=self.group, code__in=codes).select_related('column', 'assignee')
+        } if codes else {}
+
+    def check(self, operation):
+        errors = {}
+        data = operation['data']
+        if operation['op'] != 'create' and operation['code'] not in self.cards:
+            errors['code'] = ["Карточка не найдена в группе."]
+        if 'column' in data and data['column'] not in self.validation.columns:
+            errors['column'] = ["Колонка не найдена в группе."]
+        if data.get('assignee') and data['assignee'] not in self.validation.members:
+            errors['assignee'] = ["Assignee must be a group member."]
+        return errors
+
+    @transaction.atomic
+    def save(self):
+        """Применяет проверенные операции, возвращает карточки в порядке операций"""
+        group_uuid = self.group.group_uuid
+        tag_keys = {
+            (tag['name'], tag['color'])
+            for operation in self.parsed for tag in operation['data'].get('tags', ())
+        }
+        tags, created_tags = CardTag.resolve_many(group_uuid, tag_keys, known=self.validation.card_tags)
+
+        creates = [operation for operation in self.parsed if operation['op'] == 'create']
+        codes = GroupCodeCounter.allocate(group_uuid, GroupCodeCounter.CARD, count=len(creates)) if creates else []
+        new_cards = []
+        for code, operation in zip(codes, creates):
+            card = Card(group=self.group, code=code)
+            self.apply(card, operation['data'])
+            operation['card'] = card
+            new_cards.append(card)
+        Card.objects.bulk_create(new_cards)
+        if new_cards and not connection.features.can_return_rows_from_bulk_insert:
+            # MySQL не возвращает pk из bulk_create: дочитываем их по кодам одной выборкой
+            pks = dict(Card.objects.filter(group=self.group, code__in=codes).values_list('code', 'pk'))
+            for card in new_cards:
+                card.pk = pks[card.code]
+
+        updated, fields = {}, set()
+        for operation in self.parsed:
+            if operation['op'] == 'create':
+                continue
+            card = operation['card'] = self.cards[operation['code']]
+            fields.update(self.apply(card, operation['data']))
+            updated[card.pk] = card
+        if fields:
+            Card.objects.bulk_update(list(updated.values()), sorted(fields))
+
+        tag_ids_by_card = {}
+        for operation in self.parsed:
+            if 'tags' in operation['data']:
+                tag_ids_by_card[operation['card'].pk] = {
+                    tags[(tag['name'], tag['color'])].pk for tag in operation['data']['tags']
+                }
+        Card.set_tags_many(tag_ids_by_card)
+
+        cards = Card.objects.filter(pk__in=[operation['card'].pk for operation in self.parsed])\
+            .select_related('column', 'assignee')\
+            .prefetch_related('tags')\
+            .in_bulk()
+        result = [cards[operation['card'].pk] for operation in self.parsed]
+
+        ops = [('card_tag', 'create', GroupCardTagSerializer(tag).data) for tag in created_tags]
+        new_pks = {card.pk for card in new_cards}
+        serializer = CardSerializer()
+        seen = set()
+        for card in result:
+            if card.pk not in seen:
+                seen.add(card.pk)
+                ops.append(('card', 'create' if card.pk in new_pks else 'update', serializer.to_representation(card)))
+        board_changed(group_uuid, ops)
+        return result
+
+    def apply(self, card, data):
+        """Переносит поля операции на карточку, возвращает имена измененных полей"""
+        changed = []
+        for field in CARD_FIELDS:
+            if field not in data:
+                continue
+            value = data[field]
+            if field == 'column':
+                value = self.validation.columns[value]
+            elif field == 'assignee':
+                value = self.validation.members[value] if value else None
+            setattr(card, field, value)
+            changed.append(field)
+        return changed
@@ -0,0 +1,212 @@
+import json
+import threading
+from collections import OrderedDict
+import shortuuid
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+# Кэш готовых (уже сериализованных в JSON) снимков доски группы.
+# У каждой группы есть версия - случайный токен, который меняется при любом
+# изменении данных группы (см. signals.py). Снимок хранится под ключом
+# (group_uuid, версия), поэтому после смены версии старый снимок просто
+# перестает читаться. Версия же используется как ETag.
+
+def new_version():
+    return shortuuid.uuid()
+
+
+def user_version_key(user_pk):
+    # Версия данных самого пользователя хранится рядом с версиями групп
+    return f'user:{user_pk}'
+
+
+class BaseSnapshotBackend:
+    def get_version(self, group_uuid):
+        raise NotImplementedError
+
+    def bump_version(self, group_uuid):
+        raise NotImplementedError
+
+    def get(self, group_uuid, version):
+        raise NotImplementedError
+
+    def set(self, group_uuid, version, content):
+        raise NotImplementedError
+
+
+class LocMemSnapshotBackend(BaseSnapshotBackend):
+    """Снимки в памяти процесса (только для одного воркера)."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # group_uuid -> [версия, снимок или None]
+        self._entries = OrderedDict()
+
+    def _entry(self, group_uuid):
+        entry = self._entries.get(group_uuid)
+        if entry is None:
+            entry = self._entries[group_uuid] = [new_version(), None]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(group_uuid)
+        return entry
+
+    def get_version(self, group_uuid):
+        with self._lock:
+            return self._entry(group_uuid)[0]
+
+    def bump_version(self, group_uuid):
+        with self._lock:
+            self._entries[group_uuid] = [new_version(), None]
+            self._entries.move_to_end(group_uuid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, group_uuid, version):
+        with self._lock:
+            entry = self._entries.get(group_uuid)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+            return None
+
+    def set(self, group_uuid, version, content):
+        with self._lock:
+            entry = self._entries.get(group_uuid)
+            if entry is not None and entry[0] == version:
+                entry[1] = content
+
+
+class DjangoCacheSnapshotBackend(BaseSnapshotBackend):
+    """
+    Снимки в кэше Django (Redis/Memcached из CACHES), общем для всех воркеров.
+    Снимок живет timeout секунд (по умолчанию BOARD_SNAPSHOT_CACHE['SNAPSHOT_TIMEOUT']):
+    после смены версии старый снимок никто не читает и не удаляет, он должен истечь сам.
+    Ключ версии хранится без срока, иначе ETag менялся бы без изменения данных.
+    """
+
+    def __init__(self, cache_alias='default', timeout=None, key_prefix='board'):
+        self.cache = caches[cache_alias]
+        self.timeout = settings.BOARD_SNAPSHOT_CACHE.get('SNAPSHOT_TIMEOUT', 3600) if timeout is None else timeout
+        self.key_prefix = key_prefix
+
+    def _version_key(self, group_uuid):
+        return f'{self.key_prefix}:version:{group_uuid}'
+
+    def _snapshot_key(self, group_uuid, version):
+        return f'{self.key_prefix}:snapshot:{group_uuid}:{version}'
+
+    def get_version(self, group_uuid):
+        key = self._version_key(group_uuid)
+        version = self.cache.get(key)
+        if version is None:
+            # Если версию уже успел записать другой воркер, add ничего не сделает
+            self.cache.add(key, new_version(), None)
+            version = self.cache.get(key)
+        return version
+
+    def bump_version(self, group_uuid):
+        self.cache.set(self._version_key(group_uuid), new_version(), None)
+
+    def get(self, group_uuid, version):
+        return self.cache.get(self._snapshot_key(group_uuid, version))
+
+    def set(self, group_uuid, version, content):
+        self.cache.set(self._snapshot_key(group_uuid, version), content, self.timeout)
+
+
+class BoardSnapshotCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, group_uuid):
+        return self.backend.get_version(group_uuid)
+
+    def invalidate(self, group_uuid):
+        self.backend.bump_version(group_uuid)
+
+    def lookup(self, group_uuid):
+        version = self.backend.get_version(group_uuid)
+        content = self.backend.get(group_uuid, version)
+        with self._lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return version, content
+
+    def get_or_build(self, group_uuid, build):
+        version, content = self.lookup(group_uuid)
+        if content is None:
+            content = JSONRenderer().render(build())
+            self.backend.set(group_uuid, version, content)
+        return content
+
+    async def aget_or_build(self, group_uuid, build):
+        """get_or_build для async-view: build - корутина, бэкенд (кэш Django) вызывается в потоке"""
+        version, content = await sync_to_async(self.lookup)(group_uuid)
+        if content is None:
+            content = JSONRenderer().render(await build())
+            await sync_to_async(self.backend.set)(group_uuid, version, content)
+        return content
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+_snapshot_cache = None
+
+
+def snapshot_cache():
+    global _snapshot_cache
+    if _snapshot_cache is None:
+        config = settings.BOARD_SNAPSHOT_CACHE
+        backend = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+        _snapshot_cache = BoardSnapshotCache(backend)
+    return _snapshot_cache
+
+
+@receiver(setting_changed)
+def reset_snapshot_cache(setting, **kwargs):
+    global _snapshot_cache
+    if setting == 'BOARD_SNAPSHOT_CACHE':
+        _snapshot_cache = None
+
+
+class SnapshotResponse(Response):
+    """Ответ с уже готовым JSON: для JSON-рендерера байты отдаются как есть."""
+
+    def __init__(self, content, **kwargs):
+        super().__init__(**kwargs)
+        self.snapshot = content
+
+    @property
+    def data(self):
+        # Разбираем снимок только если он действительно нужен (browsable API, тесты)
+        if self._data is None and getattr(self, 'snapshot', None) is not None:
+            self._data = json.loads(self.snapshot)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def rendered_content(self):
+        renderer = getattr(self, 'accepted_renderer', None)
+        if isinstance(renderer, JSONRenderer):
+            self['Content-Type'] = renderer.media_type
+            return self.snapshot
+        return super().rendered_content
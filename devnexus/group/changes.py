@@ -0,0 +1,85 @@
+import threading
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from .models import BoardChange, Group
+
+
+# Журнал изменений доски: у каждой группы монотонно растущий номер версии
+# (Group.change_version), каждая операция create/update/delete над карточками,
+# колонками, тегами и участниками получает следующий номер.
+# Номер выделяется UPDATE'ом строки группы, поэтому конкурирующие записи
+# в одну группу сериализуются до коммита и версии коммитятся по порядку.
+
+_local = threading.local()
+
+
+def _deleting_groups():
+    if not hasattr(_local, 'deleting'):
+        _local.deleting = set()
+    return _local.deleting
+
+
+def mark_group_deleting(group_uuid):
+    # Пока группа удаляется каскадом, записывать ее изменения некуда
+    _deleting_groups().add(group_uuid)
+
+
+def unmark_group_deleting(group_uuid):
+    _deleting_groups().discard(group_uuid)
+
+
+def allocate_versions(group_uuid, count):
+    with transaction.atomic():
+        updated = Group.objects.filter(group_uuid=group_uuid)\
+            .update(change_version=F('change_version') + count)
+        if not updated:
+            return None
+        last = Group.objects.filter(group_uuid=group_uuid)\
+            .values_list('change_version', flat=True).get()
+    return range(last - count + 1, last + 1)
+
+
+def record_many(group_uuid, ops):
+    """Записывает в журнал операции вида (entity, op, payload)"""
+    if not ops or group_uuid is None or group_uuid in _deleting_groups():
+        return []
+    with transaction.atomic():
+        versions = allocate_versions(group_uuid, len(ops))
+        if versions is None:
+            return []
+        changes = BoardChange.objects.bulk_create([
+            BoardChange(group_id=group_uuid, version=version, entity=entity, op=op, payload=payload)
+            for version, (entity, op, payload) in zip(versions, ops)
+        ])
+        compact(group_uuid, versions)
+    return changes
+
+
+def record(group_uuid, entity, op, payload):
+    return record_many(group_uuid, [(entity, op, payload)])
+
+
+def compact(group_uuid, versions):
+    # Чистим журнал не на каждой записи, а когда версия перешагивает границу шага
+    retention = settings.BOARD_CHANGES['RETENTION']
+    step = settings.BOARD_CHANGES['COMPACT_EVERY']
+    if versions[-1] // step == (versions[0] - 1) // step:
+        return
+    BoardChange.objects.filter(group_id=group_uuid, version__lte=versions[-1] - retention).delete()
+
+
+def changes_since(group, since):
+    """
+    Возвращает (версия, список изменений) или (версия, None), если часть
+    изменений после since уже удалена из журнала и нужен полный снимок.
+    """
+    version = group.change_version
+    if since == version:
+        return version, []
+    if since > version:
+        return version, None
+    changes = list(BoardChange.objects.filter(group=group, version__gt=since).order_by('version'))
+    if not changes or changes[0].version != since + 1:
+        return version, None
+    return max(version, changes[-1].version), changes
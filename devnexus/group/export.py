@@ -0,0 +1,109 @@
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from .models import Card, CardTag, ColumnBoard, UserTag, UserTagRelation
+from .serializers import CardSerializer
+
+
+# Потоковая выгрузка доски группы: строки читаются серверными курсорами
+# (iterator(chunk_size=...)) и сразу пишутся в ответ, поэтому память
+# не зависит от размера доски. Форматы: NDJSON (по объекту на строку,
+# {"type": ..., "data": ...}) и один JSON-объект, который пишется частями.
+# Под ASGI синхронный итератор Django целиком собрал бы через sync_to_async(list),
+# поэтому там ответ получает async-итератор, читающий блоки по одному в потоке.
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+def export_sections(group):
+    """Пары (тип объекта, итератор словарей) в порядке выгрузки"""
+    chunk_size = settings.BOARD_EXPORT['CHUNK_SIZE']
+    yield 'member', group.members.order_by('id')\
+        .values('username', 'email', 'description').iterator(chunk_size=chunk_size)
+    yield 'column', ColumnBoard.objects.filter(group=group).order_by('id')\
+        .values('id', 'name', 'color').iterator(chunk_size=chunk_size)
+    yield 'card_tag', CardTag.objects.filter(group=group).order_by('id')\
+        .values('code', 'name', 'color').iterator(chunk_size=chunk_size)
+    yield 'user_tag', UserTag.objects.filter(group=group).order_by('id')\
+        .values('code', 'name', 'color').iterator(chunk_size=chunk_size)
+    yield 'user_tag_relation', UserTagRelation.objects.filter(tag__group=group).order_by('id')\
+        .values(username=F('user__username'), tag_code=F('tag__code')).iterator(chunk_size=chunk_size)
+
+    cards = Card.objects.filter(group=group)\
+        .select_related('column', 'assignee')\
+        .prefetch_related('tags')\
+        .order_by('id')\
+        .iterator(chunk_size=chunk_size)
+    # Один сериализатор на все карточки: поля связываются один раз
+    serializer = CardSerializer()
+    yield 'card', (serializer.to_representation(card) for card in cards)
+
+
+def group_header(group):
+    return {
+        'name': group.name,
+        'description': group.description,
+        'group_uuid': group.group_uuid,
+        'version': group.change_version,
+    }
+
+
+def dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def ndjson_lines(group):
+    yield dumps({'type': 'group', 'data': group_header(group)}) + '\n'
+    for kind, rows in export_sections(group):
+        for row in rows:
+            yield dumps({'type': kind, 'data': row}) + '\n'
+
+
+def json_parts(group):
+    yield '{"group":' + dumps(group_header(group))
+    for kind, rows in export_sections(group):
+        yield f',"{kind}s":['
+        separator = ''
+        for row in rows:
+            yield separator + dumps(row)
+            separator = ','
+        yield ']'
+    yield '}'
+
+
+def buffered(parts, size):
+    """Склеивает мелкие куски в блоки около size символов"""
+    buffer, length = [], 0
+    for part in parts:
+        buffer.append(part)
+        length += len(part)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+async def aiterate(iterator):
+    """Async-итератор поверх синхронного: каждый следующий блок готовится в потоке"""
+    done = object()
+    try:
+        while True:
+            chunk = await sync_to_async(next)(iterator, done)
+            if chunk is done:
+                return
+            yield chunk
+    finally:
+        # Клиент мог отключиться посреди выгрузки: серверные курсоры закрываются в том же потоке
+        await sync_to_async(iterator.close)()
+
+
+def export_board(group, export_format, asynchronous=False):
+    parts = ndjson_lines(group) if export_format == 'ndjson' else json_parts(group)
+    chunks = buffered(parts, settings.BOARD_EXPORT['BUFFER_SIZE'])
+    return aiterate(chunks) if asynchronous else chunks
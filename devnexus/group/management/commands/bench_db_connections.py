@@ -0,0 +1,78 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.test import Client
+from django.urls import reverse
+from group.cache import snapshot_cache
+from group.models import Group
+from user.authentication import TokenVersionObtainPairSerializer
+
+
+# Запросы доски в секунду при разных режимах соединений с БД (DB_CONN_MODE в settings.py),
+# в этом же процессе через тестовый клиент. После каждого запроса соединения
+# закрываются так же, как в конце обычного запроса (close_old_connections):
+# none - каждый раз новое соединение, persistent - одно на весь замер,
+# pool - соединение возвращается в пул psycopg.
+
+MODES = ('none', 'persistent', 'pool')
+
+
+class Command(BaseCommand):
+    help = "Замеряет запросы доски в секунду без постоянных соединений с БД, с ними или с пулом"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', required=True, help="group_uuid группы, доску которой читают")
+        parser.add_argument('--seconds', type=float, default=5.0, help="Длительность замера на режим")
+        parser.add_argument('--modes', default=None, help=f"Через запятую из {', '.join(MODES)}; по умолчанию все доступные")
+        parser.add_argument('--cold', action='store_true', help="Сбрасывать снимок доски перед каждым запросом (полная сборка)")
+
+    def handle(self, *args, group, seconds, modes, cold, **options):
+        connection = connections[DEFAULT_DB_ALIAS]
+        # Пул включается только в DATABASES (DB_CONN_MODE=pool) и на лету не переключается
+        available = ['pool'] if connection.settings_dict.get('OPTIONS', {}).get('pool') else ['none', 'persistent']
+        modes = [mode.strip() for mode in modes.split(',')] if modes else available
+        for mode in modes:
+            if mode not in available:
+                raise CommandError(f"Режим {mode} недоступен при текущем DB_CONN_MODE, доступны: {', '.join(available)}")
+
+        try:
+            group = Group.objects.select_related('admin').get(group_uuid=group)
+        except Group.DoesNotExist:
+            raise CommandError("Группа не найдена")
+        token = TokenVersionObtainPairSerializer.get_token(group.admin).access_token
+        client = Client(headers={'Authorization': f'Bearer {token}'})
+        url = reverse('group:group-detail', kwargs={'group_uuid': group.group_uuid})
+
+        max_age = connection.settings_dict['CONN_MAX_AGE']
+        try:
+            for mode in modes:
+                connection.close()
+                connection.settings_dict['CONN_MAX_AGE'] = 600 if mode == 'persistent' else 0
+                self.stdout.write(f"{mode}: {self.measure(client, url, group, seconds, cold)}")
+        finally:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = max_age
+
+    def measure(self, client, url, group, seconds, cold):
+        latencies = []
+        deadline = time.perf_counter() + seconds
+        started = time.perf_counter()
+        while time.perf_counter() < deadline:
+            if cold:
+                snapshot_cache().invalidate(group.group_uuid)
+            request_started = time.perf_counter()
+            response = client.get(url)
+            # Тестовый клиент не закрывает соединения по request_finished, делаем это сами
+            close_old_connections()
+            if response.status_code != 200:
+                raise CommandError(f"Доска вернула {response.status_code}")
+            latencies.append(time.perf_counter() - request_started)
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        return (
+            f"{len(latencies) / elapsed:.1f} req/s ({len(latencies)} за {elapsed:.1f} с), "
+            f"p50={statistics.median(latencies) * 1000:.1f} ms p99={p99 * 1000:.1f} ms"
+        )
@@ -0,0 +1,121 @@
+import http.client
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+
+# Нагрузочный тест читающих запросов (доска, список карточек, профиль по группе)
+# против уже запущенного сервера. Для сравнения режимов запустите сервер
+# с SERVER_MODE=wsgi и SERVER_MODE=asgi (gunicorn.conf.py) и прогоните тест с
+# одинаковыми параметрами: сравниваются запросы в секунду и p99.
+
+VIEWS = ('board', 'cards', 'profile')
+
+
+def view_path(view, group_uuid, username):
+    if view == 'board':
+        return reverse('group:group-detail', kwargs={'group_uuid': group_uuid})
+    if view == 'cards':
+        return reverse('group:card-list', kwargs={'group_uuid': group_uuid})
+    return reverse('user:profile_group', kwargs={'username': username, 'group_uuid': group_uuid})
+
+
+class Command(BaseCommand):
+    help = "Нагрузочный тест чтения доски, карточек и профиля: запросы в секунду и задержки p50/p95/p99"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Адрес запущенного сервера")
+        parser.add_argument('--group', required=True, help="group_uuid группы, которую читают")
+        parser.add_argument('--username', required=True, help="Участник группы, от имени которого идут запросы")
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--views', default=','.join(VIEWS), help=f"Через запятую: {', '.join(VIEWS)}")
+        parser.add_argument('--concurrency', type=int, default=50, help="Параллельных клиентов")
+        parser.add_argument('--seconds', type=float, default=10.0, help="Длительность замера")
+        parser.add_argument('--label', default='', help="Подпись в выводе, например asgi или wsgi")
+
+    def handle(self, *args, url, group, username, password, views, concurrency, seconds, label, **options):
+        views = [view.strip() for view in views.split(',') if view.strip()]
+        unknown = set(views) - set(VIEWS)
+        if unknown:
+            raise CommandError(f"Неизвестные view: {', '.join(sorted(unknown))}")
+        target = urlsplit(url)
+        paths = [view_path(view, group, username) for view in views]
+
+        token = self.obtain_token(target, username, password)
+        headers = {'Authorization': f'Bearer {token}', 'Accept': 'application/json'}
+
+        latencies = {path: [] for path in paths}
+        errors = 0
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def client(number):
+            nonlocal errors
+            # Keep-alive соединение на клиента, запросы по кругу по всем view
+            connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=60)
+            own = {path: [] for path in paths}
+            failed = 0
+            position = number
+            while time.perf_counter() < deadline:
+                path = paths[position % len(paths)]
+                position += 1
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    connection.close()
+                    continue
+                if response.status != 200:
+                    failed += 1
+                    continue
+                own[path].append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                for path, values in own.items():
+                    latencies[path].extend(values)
+                errors += failed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as clients:
+            list(clients.map(client, range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        total = sum(len(values) for values in latencies.values())
+        prefix = f"[{label}] " if label else ""
+        self.stdout.write(f"{prefix}concurrency={concurrency} seconds={elapsed:.1f} views={','.join(views)}")
+        self.stdout.write(f"{prefix}requests: {total}, ошибок: {errors}, requests/sec: {total / elapsed:.1f}")
+        for view, path in zip(views, paths):
+            self.stdout.write(f"{prefix}{view}: {self.summary(latencies[path], elapsed)}")
+        self.stdout.write(f"{prefix}all: {self.summary([value for values in latencies.values() for value in values], elapsed)}")
+
+    def obtain_token(self, target, username, password):
+        connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=60)
+        body = json.dumps({'username': username, 'password': password})
+        connection.request('POST', reverse('token_obtain_pair'), body=body, headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        data = response.read()
+        connection.close()
+        if response.status != 200:
+            raise CommandError(f"Не удалось получить токен: {response.status} {data.decode(errors='replace')}")
+        return json.loads(data)['access']
+
+    def summary(self, latencies, elapsed):
+        if not latencies:
+            return "нет успешных запросов"
+        latencies = sorted(latencies)
+
+        def percentile(share):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * share))] * 1000
+
+        return (
+            f"{len(latencies) / elapsed:.1f} req/s, "
+            f"p50={statistics.median(latencies) * 1000:.1f} ms p95={percentile(0.95):.1f} ms p99={percentile(0.99):.1f} ms"
+        )
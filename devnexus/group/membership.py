@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from .models import Group
+
+
+# Множество id групп пользователя для проверки членства без запроса в БД.
+# Сбрасывается сигналами при изменении Group.members (signals.py).
+
+def _cache():
+    return caches[settings.GROUP_MEMBERSHIP_CACHE['CACHE_ALIAS']]
+
+
+def membership_key(user_pk):
+    return f'group-membership:{user_pk}'
+
+
+def member_group_ids(user_pk):
+    key = membership_key(user_pk)
+    group_ids = _cache().get(key)
+    if group_ids is None:
+        group_ids = frozenset(Group.objects.filter(members=user_pk).values_list('pk', flat=True))
+        _cache().set(key, group_ids, settings.GROUP_MEMBERSHIP_CACHE['TIMEOUT'])
+    return group_ids
+
+
+def invalidate_membership(user_pks):
+    keys = [membership_key(user_pk) for user_pk in user_pks]
+    if not keys:
+        return
+    _cache().delete_many(keys)
+    if connection.in_atomic_block:
+        # Иначе до коммита в кэш может попасть старое членство
+        transaction.on_commit(lambda: _cache().delete_many(keys))
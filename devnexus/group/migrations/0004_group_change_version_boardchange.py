@@ -0,0 +1,41 @@
+# Generated by Django 5.1.3 on 2026-10-17 19:10
+
+import django.db.models.deletion
+import shortuuid.main
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0003_alter_group_group_uuid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='change_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='group',
+            name='group_uuid',
+            field=models.CharField(default=shortuuid.main.ShortUUID.uuid, max_length=128, unique=True),
+        ),
+        migrations.CreateModel(
+            name='BoardChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField()),
+                ('entity', models.CharField(max_length=20)),
+                ('op', models.CharField(max_length=10)),
+                ('payload', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='group.group', to_field='group_uuid')),
+            ],
+            options={
+                'db_table': 'board_change',
+                'constraints': [models.UniqueConstraint(fields=('group', 'version'), name='unique_change_version_per_group')],
+            },
+        ),
+    ]
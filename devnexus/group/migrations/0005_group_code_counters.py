@@ -0,0 +1,68 @@
+# Generated by Django 5.1.3 on 2026-10-17 19:15
+
+import django.db.models.deletion
+import shortuuid.main
+from django.conf import settings
+from django.db import migrations, models
+
+
+CODE_MODELS = [
+    ('card', 'Card', 'group__group_uuid'),
+    ('card_tag', 'CardTag', 'group_id'),
+    ('user_tag', 'UserTag', 'group_id'),
+]
+
+
+def fill_code_counters(apps, schema_editor):
+    # До счетчиков параллельные вставки могли выдать одинаковые коды:
+    # повторам выдаем новые коды после максимального, затем заводим счетчики.
+    # Уникальные ограничения на коды - в следующей миграции: в PostgreSQL ALTER TABLE
+    # в одной транзакции с изменением данных может упасть с "pending trigger events"
+    Group = apps.get_model('group', 'Group')
+    GroupCodeCounter = apps.get_model('group', 'GroupCodeCounter')
+    for group_uuid in Group.objects.values_list('group_uuid', flat=True).iterator():
+        for kind, model_name, lookup in CODE_MODELS:
+            model = apps.get_model('group', model_name)
+            objects = list(model.objects.filter(**{lookup: group_uuid}).order_by('id').only('id', 'code'))
+            last = max((int(obj.code) for obj in objects), default=0)
+            seen = set()
+            for obj in objects:
+                if obj.code in seen:
+                    last += 1
+                    obj.code = f"{last:06}"
+                    obj.save(update_fields=['code'])
+                seen.add(obj.code)
+            GroupCodeCounter.objects.create(group_id=group_uuid, kind=kind, value=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0004_group_change_version_boardchange'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupCodeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('card', 'Карточки'), ('card_tag', 'Теги карточек'), ('user_tag', 'Теги пользователей')], max_length=20)),
+                ('value', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'group_code_counter',
+            },
+        ),
+        migrations.AlterField(
+            model_name='group',
+            name='group_uuid',
+            field=models.CharField(default=shortuuid.main.ShortUUID.uuid, max_length=128, unique=True),
+        ),
+        migrations.AddField(
+            model_name='groupcodecounter',
+            name='group',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='code_counters', to='group.group', to_field='group_uuid'),
+        ),
+        migrations.RunPython(fill_code_counters, migrations.RunPython.noop),
+    ]
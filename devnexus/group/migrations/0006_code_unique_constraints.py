@@ -0,0 +1,29 @@
+# Generated by Django 5.1.3 on 2026-10-17 19:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0005_group_code_counters'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='card',
+            constraint=models.UniqueConstraint(fields=('group', 'code'), name='unique_card_code_per_group'),
+        ),
+        migrations.AddConstraint(
+            model_name='cardtag',
+            constraint=models.UniqueConstraint(fields=('group', 'code'), name='unique_card_tag_code_per_group'),
+        ),
+        migrations.AddConstraint(
+            model_name='usertag',
+            constraint=models.UniqueConstraint(fields=('group', 'code'), name='unique_user_tag_code_per_group'),
+        ),
+        migrations.AddConstraint(
+            model_name='groupcodecounter',
+            constraint=models.UniqueConstraint(fields=('group', 'kind'), name='unique_code_counter_per_group'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-17 19:17
+
+import shortuuid.main
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0006_code_unique_constraints'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='group',
+            name='group_uuid',
+            field=models.CharField(default=shortuuid.main.ShortUUID.uuid, max_length=128, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['group', 'assignee'], name='card_group_assignee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['group', 'column'], name='card_group_column_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['group', 'created_at'], name='card_group_created_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.3 on 2026-10-17 19:43
+
+import django.contrib.postgres.search
+import shortuuid.main
+from django.db import migrations, models
+
+
+# Триггер, GIN-индекс и заполнение колонки - только в PostgreSQL,
+# в остальных базах search_vector остается пустой (см. group/search_backends.py)
+FORWARD_SQL = [
+    """
+    CREATE FUNCTION card_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER card_search_vector_trigger BEFORE INSERT OR UPDATE ON card
+    FOR EACH ROW EXECUTE FUNCTION card_search_vector_update()
+    """,
+    "UPDATE card SET title = title",
+    "CREATE INDEX card_search_vector_idx ON card USING gin (search_vector)",
+]
+
+BACKWARD_SQL = [
+    "DROP INDEX IF EXISTS card_search_vector_idx",
+    "DROP TRIGGER IF EXISTS card_search_vector_trigger ON card",
+    "DROP FUNCTION IF EXISTS card_search_vector_update()",
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0007_card_group_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='group',
+            name='group_uuid',
+            field=models.CharField(default=shortuuid.main.ShortUUID.uuid, max_length=128, unique=True),
+        ),
+        migrations.RunPython(run_on_postgresql(FORWARD_SQL), run_on_postgresql(BACKWARD_SQL)),
+    ]
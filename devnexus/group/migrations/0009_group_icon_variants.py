@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-17 19:49
+
+import shortuuid.main
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0008_card_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='icon_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='group',
+            name='group_uuid',
+            field=models.CharField(default=shortuuid.main.ShortUUID.uuid, max_length=128, unique=True),
+        ),
+    ]
@@ -1,4 +1,8 @@
-from django.db import models
+from collections import defaultdict
+from django.contrib.postgres.search import SearchVectorField
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, IntegerField, Max, Q
+from django.db.models.functions import Cast
 from user.models import User
 import shortuuid
 
@@ -7,8 +11,10 @@ class Group(models.Model):
     group_uuid = models.CharField(max_length=128, unique=True, default=shortuuid.uuid)
     admin = models.ForeignKey(User, blank=True, null=True, on_delete=models.SET_NULL)
     icon = models.ImageField(upload_to='group_icons/', blank=True)
+    icon_variants = models.JSONField(default=dict, blank=True, editable=False)  # миниатюры иконки, см. devnexus/images.py
     members = models.ManyToManyField(User, related_name='group_memberships')
     description = models.TextField(max_length=200, blank=True)
+    change_version = models.PositiveBigIntegerField(default=0, editable=False)  # последняя версия в журнале изменений
 
 
     class Meta:
@@ -20,6 +26,70 @@ class Group(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # change_version растет только UPDATE'ом с F() (changes.allocate_versions);
+        # обычное сохранение группы не должно записывать поверх него значение из памяти
+        if not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+            kwargs['update_fields'] = [name for name in update_fields if name != 'change_version']
+        super().save(*args, **kwargs)
+
+
+class GroupCodeCounter(models.Model):
+    """Счетчики шестизначных кодов карточек и тегов в группе"""
+    CARD = 'card'
+    CARD_TAG = 'card_tag'
+    USER_TAG = 'user_tag'
+    KIND_CHOICES = [
+        (CARD, 'Карточки'),
+        (CARD_TAG, 'Теги карточек'),
+        (USER_TAG, 'Теги пользователей'),
+    ]
+
+    group = models.ForeignKey(Group, to_field='group_uuid', on_delete=models.CASCADE, related_name='code_counters')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "group_code_counter"
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'kind'], name='unique_code_counter_per_group')
+        ]
+
+    @classmethod
+    def allocate(cls, group_uuid, kind, count=1):
+        """
+        Выделяет count подряд идущих кодов. UPDATE блокирует строку счетчика
+        до конца транзакции, поэтому параллельные вставки в группу не получат
+        одинаковых кодов.
+        """
+        with transaction.atomic():
+            counters = cls.objects.filter(group_id=group_uuid, kind=kind)
+            if not counters.update(value=F('value') + count):
+                cls._create(group_uuid, kind)
+                counters.update(value=F('value') + count)
+            last = counters.values_list('value', flat=True).get()
+        return [f"{code:06}" for code in range(last - count + 1, last + 1)]
+
+    @classmethod
+    def _create(cls, group_uuid, kind):
+        # Для групп, где коды уже выдавались без счетчика, продолжаем с максимального
+        model, lookup = {
+            cls.CARD: (Card, 'group__group_uuid'),
+            cls.CARD_TAG: (CardTag, 'group'),
+            cls.USER_TAG: (UserTag, 'group'),
+        }[kind]
+        last = model.objects.filter(**{lookup: group_uuid})\
+            .aggregate(last=Max(Cast('code', IntegerField())))['last'] or 0
+        try:
+            with transaction.atomic():
+                cls.objects.create(group_id=group_uuid, kind=kind, value=last)
+        except IntegrityError:
+            # Счетчик параллельно создал другой запрос
+            pass
+
 
 # решил разделить одну модель с тегами на две, так-как это позволит присваивать существующие теги, а не прописывать их каждый раз 
 class UserTag(models.Model):
@@ -30,19 +100,16 @@ class UserTag(models.Model):
 
     class Meta:
         unique_together = ('name', 'color', 'group')
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'code'], name='unique_user_tag_code_per_group')
+        ]
 
     def save(self, *args, **kwargs):
-        # Генерируем уникальный шестизначный код
-        if not self.code:
-            last_card = UserTag.objects.filter(group=self.group).order_by('code').last()
-            if last_card:
-                last_code = int(last_card.code)
-                new_code = last_code + 1
-            else:
-                new_code = 1
-            
-            self.code = f"{new_code:06}"
-        super().save(*args, **kwargs)
+        # Генерируем уникальный шестизначный код в той же транзакции, что и вставка
+        with transaction.atomic():
+            if not self.code:
+                self.code = GroupCodeCounter.allocate(self.group_id, GroupCodeCounter.USER_TAG)[0]
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name} ({self.group.name})"
@@ -67,23 +134,49 @@ class CardTag(models.Model):
 
     class Meta:
         unique_together = ('name', 'color', 'group')
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'code'], name='unique_card_tag_code_per_group')
+        ]
 
     def save(self, *args, **kwargs):
-        # Генерируем уникальный шестизначный код
-        if not self.code:
-            last_card = CardTag.objects.filter(group=self.group).order_by('code').last()
-            if last_card:
-                last_code = int(last_card.code)
-                new_code = last_code + 1
-            else:
-                new_code = 1
-            
-            self.code = f"{new_code:06}"
-        super().save(*args, **kwargs)
+        # Генерируем уникальный шестизначный код в той же транзакции, что и вставка
+        with transaction.atomic():
+            if not self.code:
+                self.code = GroupCodeCounter.allocate(self.group_id, GroupCodeCounter.CARD_TAG)[0]
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name} ({self.group.name})"
 
+    @classmethod
+    def resolve_many(cls, group_uuid, keys, known=None):
+        """
+        Теги группы по парам (name, color): существующие - одной выборкой
+        (или из уже загруженного словаря known), недостающие - одним bulk_create.
+        Сигналы post_save не отправляются.
+        Возвращает ({(name, color): тег}, список созданных тегов).
+        """
+        keys = set(keys)
+        if not keys:
+            return {}, []
+
+        def select():
+            tags = cls.objects.filter(group_id=group_uuid, name__in={name for name, _ in keys})
+            return {(tag.name, tag.color): tag for tag in tags if (tag.name, tag.color) in keys}
+
+        tags = {key: known[key] for key in keys if key in known} if known is not None else select()
+        missing = sorted(keys - set(tags))
+        if not missing:
+            return tags, []
+        codes = GroupCodeCounter.allocate(group_uuid, GroupCodeCounter.CARD_TAG, count=len(missing))
+        # Тег мог параллельно создать другой запрос: его код просто останется неиспользованным
+        cls.objects.bulk_create(
+            [cls(group_id=group_uuid, code=code, name=name, color=color) for code, (name, color) in zip(codes, missing)],
+            ignore_conflicts=True,
+        )
+        tags = select()
+        return tags, [tags[key] for key in missing]
+
 
 class ColumnBoard(models.Model):
     name = models.CharField(max_length=50)
@@ -100,6 +193,12 @@ class ColumnBoard(models.Model):
 
 
 
+class CardManager(models.Manager):
+    def get_queryset(self):
+        # search_vector нужен только базе для поиска, в выборки карточек его не тянем
+        return super().get_queryset().defer('search_vector')
+
+
 class Card(models.Model):
     """Карточки с заданиями в группах"""
     code = models.CharField(max_length=6, editable=False)  # Уникальный шестизначный код карточки
@@ -112,24 +211,75 @@ class Card(models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE)
     tags = models.ManyToManyField(CardTag, related_name='card_tags')
     column = models.ForeignKey(ColumnBoard, on_delete=models.CASCADE, related_name='cards')
+    # Заполняется триггером в PostgreSQL (миграция 0008), в остальных базах пустое
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = CardManager()
 
     class Meta:
         db_table = "card"
         verbose_name = "Карточка"
         verbose_name_plural = "Карточки"
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'code'], name='unique_card_code_per_group')
+        ]
+        indexes = [
+            models.Index(fields=['group', 'assignee'], name='card_group_assignee_idx'),
+            models.Index(fields=['group', 'column'], name='card_group_column_idx'),
+            models.Index(fields=['group', 'created_at'], name='card_group_created_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        # Генерируем уникальный шестизначный код
-        if not self.code:
-            last_card = Card.objects.filter(group=self.group).order_by('code').last()
-            if last_card:
-                last_code = int(last_card.code)
-                new_code = last_code + 1
-            else:
-                new_code = 1
-            
-            self.code = f"{new_code:06}"
-        super().save(*args, **kwargs)
+        # Генерируем уникальный шестизначный код в той же транзакции, что и вставка
+        with transaction.atomic():
+            if not self.code:
+                self.code = GroupCodeCounter.allocate(self.group.group_uuid, GroupCodeCounter.CARD)[0]
+            super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.group.name} {self.title} {self.code}"
+
+    @classmethod
+    def set_tags_many(cls, tag_ids_by_card):
+        """
+        Приводит теги карточек {card_id: множество id тегов} к заданным:
+        одна выборка связей, затем удаляется и вставляется только разница.
+        Сигналы m2m_changed не отправляются. Возвращает True, если что-то изменилось.
+        """
+        through = cls.tags.through
+        current = defaultdict(set)
+        rows = through.objects.filter(card_id__in=list(tag_ids_by_card)).values_list('card_id', 'cardtag_id')
+        for card_id, tag_id in rows:
+            current[card_id].add(tag_id)
+
+        stale = Q()
+        added = []
+        for card_id, tag_ids in tag_ids_by_card.items():
+            removed = current[card_id] - tag_ids
+            if removed:
+                stale |= Q(card_id=card_id, cardtag_id__in=removed)
+            added += [through(card_id=card_id, cardtag_id=tag_id) for tag_id in tag_ids - current[card_id]]
+        if stale:
+            through.objects.filter(stale).delete()
+        if added:
+            through.objects.bulk_create(added)
+        return bool(stale or added)
+
+
+class BoardChange(models.Model):
+    """Журнал изменений доски группы"""
+    group = models.ForeignKey(Group, to_field='group_uuid', on_delete=models.CASCADE, related_name='changes')
+    version = models.PositiveBigIntegerField()
+    entity = models.CharField(max_length=20)
+    op = models.CharField(max_length=10)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "board_change"
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'version'], name='unique_change_version_per_group')
+        ]
 
     def __str__(self):
-        return f"{self.group.name} {self.title} {self.code}"
\ No newline at end of file
+        return f"{self.group_id} #{self.version} {self.entity} {self.op}"
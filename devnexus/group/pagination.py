@@ -0,0 +1,34 @@
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class CardCursorPagination(CursorPagination):
+    """Keyset-пагинация карточек по (created_at, id): страница не зависит от размера группы"""
+
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('created_at', 'id')
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'cards': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'cards': schema,
+            },
+        }
+
+
+class CardSearchPagination(CardCursorPagination):
+    """Keyset-пагинация результатов поиска по search_key (ранг, затем id), см. search_backends.py"""
+
+    ordering = '-search_key'
@@ -1,27 +1,48 @@
 from rest_framework import permissions
+from rest_framework.exceptions import NotFound
 from group.models import Group, Card, UserTag, CardTag, ColumnBoard, UserTagRelation
+from .membership import member_group_ids
+
+
+def resolve_group(view):
+    """Группа из URL, загружается один раз за запрос и остается в view.group"""
+    group = getattr(view, 'group', None)
+    if group is None:
+        try:
+            group = Group.objects.get(group_uuid=view.kwargs.get('group_uuid'))
+        except Group.DoesNotExist:
+            raise NotFound("Группа не найдена.")
+        view.group = group
+    return group
+
 
 class IsGroupMember(permissions.BasePermission):
     def has_permission(self, request, view):
         if not request.user.is_authenticated:
             return False
-        group_uuid = view.kwargs.get('group_uuid')
-        try:
-            group = Group.objects.get(group_uuid=group_uuid)
-            return group.members.filter(id=request.user.id).exists()
-        except Group.DoesNotExist:
-            return False
+        return resolve_group(view).pk in member_group_ids(request.user.pk)
 
     def has_object_permission(self, request, view, obj):
         if not request.user.is_authenticated:
             return False
+        group = getattr(view, 'group', None)
         if isinstance(obj, Group):
-            return obj.members.filter(id=request.user.id).exists()
-        elif isinstance(obj, (Card, UserTag, CardTag, ColumnBoard, UserTagRelation)):
-            return obj.group.members.filter(id=request.user.id).exists()
-        return False
+            group_pk = obj.pk
+        elif isinstance(obj, Card):
+            group_pk = obj.group_id
+        elif isinstance(obj, (UserTag, CardTag, ColumnBoard)):
+            # Эти модели ссылаются на группу по group_uuid
+            group_pk = group.pk if group is not None and obj.group_id == group.group_uuid else obj.group.pk
+        elif isinstance(obj, UserTagRelation):
+            group_pk = obj.tag.group.pk
+        else:
+            return False
+        if group is not None and group_pk == group.pk:
+            # Членство в группе из URL уже проверено в has_permission
+            return True
+        return group_pk in member_group_ids(request.user.pk)
 
 
 class IsGroupAdmin(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return request.user == obj.admin
+        return request.user.pk == obj.admin_id
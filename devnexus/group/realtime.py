@@ -0,0 +1,306 @@
+import asyncio
+import json
+import math
+import re
+import time
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from .broker import broker
+from .models import Group
+
+
+# Push-каналы доски: WebSocket /ws/groups/<group_uuid>/ и Server-Sent Events
+# /api/v1/groups/<group_uuid>/events/. Токен - тот же access-токен SimpleJWT,
+# что и для API, в заголовке Authorization: Bearer <token>. Браузерный WebSocket
+# заголовки задавать не умеет, поэтому ему можно ?token=<access token>; потоку
+# событий - только при BOARD_EVENTS['QUERY_TOKEN']: токен из адреса попадает
+# в логи доступа сервера и прокси.
+# Права проверяются не только при подключении: открытый канал проверяет токен
+# и членство заново, когда истекает exp токена, не реже BOARD_EVENTS['RECHECK']
+# секунд (так доходит отзыв токенов сменой пароля) и сразу после удаления
+# участника из группы - и закрывается, если доступа больше нет.
+
+BOARD_SOCKET_PATH = re.compile(r'^/ws/groups/(?P<group_uuid>[^/]+)/$')
+
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+CLOSE_TOO_SLOW = 4408
+
+
+def authenticate_token(raw_token):
+    """
+    (пользователь, проверенный токен) по access-токену или (None, None),
+    через JWT-аутентификацию из настроек DRF
+    """
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        authenticator = authentication_class()
+        if isinstance(authenticator, JWTAuthentication):
+            try:
+                validated_token = authenticator.get_validated_token(raw_token)
+                return authenticator.get_user(validated_token), validated_token
+            except (InvalidToken, AuthenticationFailed):
+                return None, None
+    return None, None
+
+
+def is_group_member(user, group_uuid):
+    return Group.objects.filter(group_uuid=group_uuid, members=user.id).exists()
+
+
+def token_from_scope(scope, allow_query=True):
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.split()
+            if len(parts) == 2 and parts[0].lower() == b'bearer':
+                return parts[1]
+    if not allow_query:
+        return None
+    query_string = scope.get('query_string', b'')
+    if isinstance(query_string, bytes):
+        # Тестовый AsyncClient передает строку, ASGI-серверы - байты
+        query_string = query_string.decode()
+    tokens = parse_qs(query_string).get('token')
+    return tokens[0] if tokens else None
+
+
+@sync_to_async
+def authorize(raw_token, group_uuid):
+    """(код закрытия или None, время истечения токена в секундах epoch)"""
+    user, validated_token = authenticate_token(raw_token) if raw_token else (None, None)
+    if user is None:
+        return CLOSE_UNAUTHORIZED, None
+    if not is_group_member(user, group_uuid):
+        return CLOSE_FORBIDDEN, None
+    return None, validated_token.get('exp')
+
+
+class ChannelAccess:
+    """Доступ открытого канала к доске: когда и по каким событиям проверять его заново"""
+
+    def __init__(self, raw_token, group_uuid):
+        self.raw_token = raw_token
+        self.group_uuid = group_uuid
+        self.next_check = 0
+
+    async def check(self):
+        """None, если доступ есть, иначе код закрытия"""
+        error, expires_at = await authorize(self.raw_token, self.group_uuid)
+        wait = settings.BOARD_EVENTS['RECHECK']
+        if expires_at is not None:
+            # +1: exp проверяется с точностью до секунды
+            wait = min(wait, max(0, expires_at - time.time()) + 1)
+        self.next_check = time.monotonic() + wait
+        return error
+
+    def timeout(self):
+        """Секунд до следующей плановой проверки"""
+        return max(0, self.next_check - time.monotonic())
+
+    def due(self, message=False):
+        """Пора ли проверять доступ перед событием message (False - событий не было)"""
+        # Удаленный участник мог быть владельцем этого канала; имя могло смениться, поэтому
+        # проверяем при любом удалении участника, а не сравниваем username
+        if message and message['entity'] == 'member' and message['op'] == 'delete':
+            return True
+        return self.timeout() == 0
+
+
+async def board_socket(scope, receive, send):
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    match = BOARD_SOCKET_PATH.match(scope['path'])
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    group_uuid = match['group_uuid']
+
+    access = ChannelAccess(token_from_scope(scope), group_uuid)
+    error = await access.check()
+    if error is not None:
+        await send({'type': 'websocket.close', 'code': error})
+        return
+
+    # Подписываемся до accept, чтобы не потерять события между ними
+    subscription = broker().subscribe(group_uuid)
+    try:
+        await send({'type': 'websocket.accept'})
+        sender = asyncio.create_task(forward_events(subscription, access, send))
+        receiver = asyncio.create_task(wait_disconnect(receive))
+        done, pending = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        broker().unsubscribe(subscription)
+
+
+async def forward_events(subscription, access, send):
+    while True:
+        try:
+            message = await asyncio.wait_for(subscription.get(), access.timeout())
+        except asyncio.TimeoutError:
+            # Событий не было, но подошло время плановой проверки
+            message = False
+        if message is None:
+            await send({'type': 'websocket.close', 'code': CLOSE_TOO_SLOW})
+            return
+        if access.due(message):
+            error = await access.check()
+            if error is not None:
+                await send({'type': 'websocket.close', 'code': error})
+                return
+        if message:
+            await send({'type': 'websocket.send', 'text': json.dumps(message, ensure_ascii=False)})
+
+
+async def wait_disconnect(receive):
+    # Клиент ничего не присылает, ждем только отключения
+    while True:
+        message = await receive()
+        if message['type'] == 'websocket.disconnect':
+            return
+
+
+def sse_event(message):
+    data = json.dumps(
+        {'entity': message['entity'], 'op': message['op'], 'data': message['data']},
+        ensure_ascii=False, separators=(',', ':'),
+    )
+    return f"id: {message['version']}\nevent: change\ndata: {data}\n\n"
+
+
+async def board_events(request, group_uuid):
+    """Поток событий доски (text/event-stream), только под ASGI-сервером"""
+    if not isinstance(request, ASGIRequest):
+        # Под WSGI поток занял бы воркер целиком
+        return JsonResponse({"error": "Поток событий доступен только при запуске через ASGI."}, status=501)
+
+    raw_token = token_from_scope(request.scope, allow_query=settings.BOARD_EVENTS['QUERY_TOKEN'])
+    access = ChannelAccess(raw_token, group_uuid)
+    error = await access.check()
+    if error == CLOSE_UNAUTHORIZED:
+        return JsonResponse({"detail": "Учетные данные не были предоставлены."}, status=401)
+    if error == CLOSE_FORBIDDEN:
+        return JsonResponse({"detail": "У вас недостаточно прав для выполнения данного действия."}, status=403)
+
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+
+    # Подписка до чтения версии и буфера: так ни одно событие не проскочит между ними
+    subscription = broker().subscribe(group_uuid)
+    try:
+        version = await Group.objects.filter(group_uuid=group_uuid)\
+            .values_list('change_version', flat=True).aget()
+    except Group.DoesNotExist:
+        broker().unsubscribe(subscription)
+        return JsonResponse({"detail": "Страница не найдена."}, status=404)
+
+    response = StreamingHttpResponse(
+        event_stream(subscription, access, version, last_event_id),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class VersionOrder:
+    """
+    Отдает события строго по возрастанию версий. publish идет из on_commit разных
+    потоков, поэтому v6 может прийти раньше v5: события после пропуска ждут
+    недостающие, но не дольше GAP_TIMEOUT секунд.
+    """
+
+    def __init__(self, sent):
+        # Последняя версия, которая уже есть у клиента
+        self.sent = sent
+        self.pending = {}
+        self.gap_since = None
+
+    def push(self, message):
+        """События, которые после message можно отдать по порядку"""
+        if message['version'] <= self.sent:
+            return []
+        self.pending[message['version']] = message
+        ready = []
+        while self.sent + 1 in self.pending:
+            self.sent += 1
+            ready.append(self.pending.pop(self.sent))
+        if not self.pending:
+            self.gap_since = None
+        elif ready or self.gap_since is None:
+            self.gap_since = time.monotonic()
+        return ready
+
+    def timeout(self):
+        """Секунд до того, как пропуск считается потерянным (inf, если пропуска нет)"""
+        if self.gap_since is None:
+            return math.inf
+        return max(0, self.gap_since + settings.BOARD_EVENTS['GAP_TIMEOUT'] - time.monotonic())
+
+    def gap_lost(self):
+        return self.gap_since is not None and self.timeout() == 0
+
+
+def resync_event(version, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: resync\ndata: {json.dumps({'version': version})}\n\n"
+
+
+async def event_stream(subscription, access, version, last_event_id):
+    heartbeat = settings.BOARD_EVENTS['HEARTBEAT']
+    try:
+        yield f"retry: {settings.BOARD_EVENTS['RETRY_MS']}\n\n"
+        order = VersionOrder(version)
+        if last_event_id is not None and last_event_id < version:
+            missed = broker().recent(subscription.group_uuid, last_event_id)
+            if missed is None:
+                # Буфер уже не покрывает пропущенное: клиенту нужен /changes/ или полный снимок
+                yield resync_event(version, event_id=version)
+            else:
+                # Что не успело попасть в буфер, придет через подписку
+                order = VersionOrder(last_event_id)
+                for message in missed:
+                    for ready in order.push(message):
+                        yield sse_event(ready)
+
+        while True:
+            try:
+                message = await asyncio.wait_for(
+                    subscription.get(), min(heartbeat, access.timeout(), order.timeout()),
+                )
+            except asyncio.TimeoutError:
+                message = False
+            if message is None:
+                yield resync_event(order.sent)
+                return
+            if access.due(message):
+                error = await access.check()
+                if error is not None:
+                    # Переподключение EventSource получит 401/403 и остановится
+                    yield f"event: close\ndata: {json.dumps({'code': error})}\n\n"
+                    return
+            if message:
+                for ready in order.push(message):
+                    yield sse_event(ready)
+            if order.gap_lost():
+                # Пропущенные версии так и не пришли: клиент дочитает их через /changes/
+                # с order.sent, а после переподключения с этим Last-Event-ID продолжит поток
+                yield resync_event(order.sent)
+                return
+            if not message:
+                yield ": ping\n\n"
+    finally:
+        broker().unsubscribe(subscription)
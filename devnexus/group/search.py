@@ -0,0 +1,165 @@
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rapidfuzz import fuzz, process, utils
+from .changes import changes_since
+from .models import Card, CardTag, Group, UserTag
+
+
+# Нечеткий поиск по карточкам, участникам и тегам группы (RapidFuzz).
+# Корпус группы строится при первом поиске и хранится в памяти процесса
+# (LRU по группам). Корпус помнит версию журнала изменений (changes.py),
+# на которой он актуален: перед поиском он догоняет журнал по операциям,
+# поэтому изменения из других процессов тоже попадают в него без перестройки.
+
+DESCRIPTION_LENGTH = 200
+
+
+class GroupCorpus:
+    def __init__(self, version):
+        self.version = version
+        self.lock = threading.Lock()
+        # вид -> {ключ: строка для сравнения}
+        self.choices = {'card_title': {}, 'card_description': {}, 'member': {}, 'card_tag': {}, 'user_tag': {}}
+        # вид -> {ключ: данные для ответа}
+        self.items = {'card': {}, 'member': {}, 'card_tag': {}, 'user_tag': {}}
+
+    def put_card(self, code, title, description):
+        self.choices['card_title'][code] = title
+        if description:
+            self.choices['card_description'][code] = description[:DESCRIPTION_LENGTH]
+        else:
+            self.choices['card_description'].pop(code, None)
+        self.items['card'][code] = {'code': code, 'title': title}
+
+    def put_tag(self, kind, code, name, color):
+        self.choices[kind][code] = name
+        self.items[kind][code] = {'code': code, 'name': name, 'color': color}
+
+    def put_member(self, username):
+        self.choices['member'][username] = username
+        self.items['member'][username] = {'username': username}
+
+    def remove(self, kind, key):
+        for choices in (('card_title', 'card_description') if kind == 'card' else (kind,)):
+            self.choices[choices].pop(key, None)
+        self.items[kind].pop(key, None)
+
+    def apply(self, change):
+        entity, op, payload = change.entity, change.op, change.payload
+        if entity == 'card':
+            if op == 'delete':
+                self.remove('card', payload['code'])
+            else:
+                self.put_card(payload['code'], payload['title'], payload.get('description'))
+        elif entity in ('card_tag', 'user_tag'):
+            if op == 'delete':
+                self.remove(entity, payload['code'])
+            else:
+                self.put_tag(entity, payload['code'], payload['name'], payload['color'])
+        elif entity == 'member':
+            if op == 'delete':
+                self.remove('member', payload['username'])
+            else:
+                self.put_member(payload['username'])
+        self.version = max(self.version, change.version)
+
+    def extract(self, query, kind, limit, cutoff):
+        return process.extract(
+            query, self.choices[kind],
+            scorer=fuzz.WRatio, processor=utils.default_process,
+            limit=limit, score_cutoff=cutoff,
+        )
+
+    def search(self, query, limit, cutoff):
+        with self.lock:
+            card_scores = {}
+            for kind in ('card_title', 'card_description'):
+                for _, score, code in self.extract(query, kind, limit, cutoff):
+                    card_scores[code] = max(score, card_scores.get(code, 0))
+            if query in self.items['card']:
+                card_scores[query] = 100
+            results = {'cards': ranked(self.items['card'], card_scores, limit)}
+            for kind, name in (('member', 'members'), ('card_tag', 'card_tags'), ('user_tag', 'user_tags')):
+                scores = {key: score for _, score, key in self.extract(query, kind, limit, cutoff)}
+                results[name] = ranked(self.items[kind], scores, limit)
+        return results
+
+
+def ranked(items, scores, limit):
+    keys = sorted(scores, key=lambda key: -scores[key])[:limit]
+    return [{**items[key], 'score': round(scores[key], 1)} for key in keys]
+
+
+def build_corpus(group):
+    # Версию читаем до данных: изменения после нее применятся повторно, это безопасно
+    version = Group.objects.filter(pk=group.pk).values_list('change_version', flat=True).get()
+    corpus = GroupCorpus(version)
+    cards = Card.objects.filter(group=group).values_list('code', 'title', 'description')
+    for code, title, description in cards.iterator(chunk_size=2000):
+        corpus.put_card(code, title, description)
+    for username in group.members.values_list('username', flat=True):
+        corpus.put_member(username)
+    for kind, model in (('card_tag', CardTag), ('user_tag', UserTag)):
+        for code, name, color in model.objects.filter(group=group).values_list('code', 'name', 'color'):
+            corpus.put_tag(kind, code, name, color)
+    return corpus
+
+
+class FuzzySearchIndex:
+    def __init__(self, max_groups=100):
+        self.max_groups = max_groups
+        self._lock = threading.Lock()
+        self._corpora = OrderedDict()
+
+    def corpus(self, group):
+        with self._lock:
+            corpus = self._corpora.get(group.group_uuid)
+            if corpus is not None:
+                self._corpora.move_to_end(group.group_uuid)
+        if corpus is None:
+            corpus = build_corpus(group)
+            with self._lock:
+                self._corpora[group.group_uuid] = corpus
+                while len(self._corpora) > self.max_groups:
+                    self._corpora.popitem(last=False)
+            return corpus
+
+        if group.change_version > corpus.version:
+            version, changes = changes_since(group, corpus.version)
+            if changes is None:
+                # Нужных записей журнала уже нет: собираем корпус заново
+                self.forget(group.group_uuid)
+                return self.corpus(group)
+            with corpus.lock:
+                for change in changes:
+                    if change.version > corpus.version:
+                        corpus.apply(change)
+        return corpus
+
+    def search(self, group, query, limit):
+        config = settings.BOARD_SEARCH
+        return self.corpus(group).search(query, limit, config['SCORE_CUTOFF'])
+
+    def forget(self, group_uuid):
+        with self._lock:
+            self._corpora.pop(group_uuid, None)
+
+
+_fuzzy_index = None
+
+
+def fuzzy_index():
+    global _fuzzy_index
+    if _fuzzy_index is None:
+        _fuzzy_index = FuzzySearchIndex(max_groups=settings.BOARD_SEARCH['MAX_GROUPS'])
+    return _fuzzy_index
+
+
+@receiver(setting_changed)
+def reset_fuzzy_index(setting, **kwargs):
+    global _fuzzy_index
+    if setting == 'BOARD_SEARCH':
+        _fuzzy_index = None
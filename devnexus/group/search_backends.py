@@ -0,0 +1,108 @@
+import re
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.signals import setting_changed
+from django.db import connection
+from django.db.models import BigIntegerField, Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Cast, Least
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+# Полнотекстовый поиск по названию и описанию карточек для CardListView (?search=).
+# Строка в кавычках ищется как фраза, иначе каждое слово - как префикс ("depl prod").
+# search() фильтрует queryset и добавляет search_key - уникальный ключ сортировки
+# (ранг * RANK_SHIFT + id), по которому работает keyset-пагинация (CardSearchPagination).
+
+RANK_SHIFT = 10 ** 10
+RANK_SCALE = 10 ** 6
+
+
+class InvalidSearchQuery(ValueError):
+    pass
+
+
+def parse_query(query):
+    """Возвращает (фраза или None, список слов)"""
+    query = query.strip()
+    phrase = None
+    if len(query) > 1 and query[0] == query[-1] == '"':
+        phrase = query[1:-1].strip()
+    terms = re.findall(r'\w+', phrase if phrase is not None else query)
+    if not terms:
+        raise InvalidSearchQuery("Строка поиска не содержит слов.")
+    return phrase, terms
+
+
+class BaseCardSearchBackend:
+    def __init__(self, config='simple'):
+        # Конфигурация текстового поиска PostgreSQL, та же, что в триггере миграции 0008
+        self.config = config
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def with_key(self, queryset, rank):
+        return queryset.annotate(search_key=rank * Value(RANK_SHIFT) + F('id'))
+
+
+class PostgresCardSearchBackend(BaseCardSearchBackend):
+    """
+    Поиск по колонке card.search_vector (tsvector с GIN-индексом). Колонку
+    заполняет триггер из миграции 0008 при каждой вставке и изменении карточки,
+    в том числе при bulk_create/bulk_update.
+    """
+
+    def search(self, queryset, query):
+        phrase, terms = parse_query(query)
+        if phrase is not None:
+            search_query = SearchQuery(phrase, search_type='phrase', config=self.config)
+        else:
+            search_query = SearchQuery(' & '.join(f"{term}:*" for term in terms), search_type='raw', config=self.config)
+        # ts_rank - float4: для точного сравнения в курсоре переводим в целое
+        rank = Cast(Least(SearchRank(F('search_vector'), search_query), Value(1.0)) * Value(RANK_SCALE), BigIntegerField())
+        return self.with_key(queryset.filter(search_vector=search_query), rank)
+
+
+class BasicCardSearchBackend(BaseCardSearchBackend):
+    """Переносимый вариант без индекса (SQLite в тестах): совпадение в названии выше, чем в описании"""
+
+    def search(self, queryset, query):
+        phrase, terms = parse_query(query)
+        if phrase is not None:
+            matches = [self.match('icontains', phrase)]
+        else:
+            matches = [self.match('iregex', r'\b' + re.escape(term)) for term in terms]
+
+        condition = Q()
+        in_title = Q()
+        for title, description in matches:
+            condition &= title | description
+            in_title &= title
+        rank = Case(When(in_title, then=Value(2)), default=Value(1), output_field=IntegerField())
+        return self.with_key(queryset.filter(condition), rank)
+
+    def match(self, lookup, value):
+        return Q(**{f'title__{lookup}': value}), Q(**{f'description__{lookup}': value})
+
+
+_card_search_backend = None
+
+
+def card_search_backend():
+    global _card_search_backend
+    if _card_search_backend is None:
+        config = settings.CARD_SEARCH
+        path = config['BACKEND'] or (
+            'group.search_backends.PostgresCardSearchBackend' if connection.vendor == 'postgresql'
+            else 'group.search_backends.BasicCardSearchBackend'
+        )
+        _card_search_backend = import_string(path)(**config.get('OPTIONS', {}))
+    return _card_search_backend
+
+
+@receiver(setting_changed)
+def reset_card_search_backend(setting, **kwargs):
+    global _card_search_backend
+    if setting == 'CARD_SEARCH':
+        _card_search_backend = None
@@ -1,10 +1,12 @@
 from rest_framework import serializers
+from devnexus.images import ImageVariantField, ImageVariantsSerializerMixin
+from devnexus.instrumentation import InstrumentedSerializerMixin
 from user.models import User
 from user.serializers import UserProfileSerializer
 from .models import Group, Card, UserTag, UserTagRelation, CardTag, ColumnBoard
 
 
-class GroupCardTagSerializer(serializers.ModelSerializer):
+class GroupCardTagSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
    
     class Meta:
         model = CardTag
@@ -12,22 +14,47 @@ class GroupCardTagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'code']
 
 
-class CardSerializer(serializers.ModelSerializer):
+class ContextSlugRelatedField(serializers.SlugRelatedField):
+    """
+    SlugRelatedField, который сначала ищет объект в словаре GroupValidationContext
+    из context['validation'], и только если не нашел - запросом, как обычно.
+    """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, context_map, **kwargs):
+        self.context_map = context_map
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        validation = self.context.get('validation')
+        if validation is not None:
+            obj = getattr(validation, self.context_map).get(data)
+            if obj is not None:
+                return obj
+        return super().to_internal_value(data)
+
+
+class CardSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
+
+    def __init__(self, *args, fields=None, **kwargs):
         super().__init__(*args, **kwargs)
         group = self.context.get('group')
         if group:
             self.fields['column'].queryset = ColumnBoard.objects.filter(group=group)
+        if fields is not None:
+            # Разреженный набор полей (?fields=title,code)
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
 
-    column = serializers.SlugRelatedField(
+    column = ContextSlugRelatedField(
+        'columns',
         slug_field='name',
         queryset=ColumnBoard.objects.none(),
         required=True
     )
 
-    assignee = serializers.SlugRelatedField(
+    assignee = ContextSlugRelatedField(
+        'members',
         slug_field='username',
         queryset=User.objects.all(),
         required=False,
@@ -44,29 +71,55 @@ class CardSerializer(serializers.ModelSerializer):
         group = self.context.get('group')
         if group is None:
             raise serializers.ValidationError("Group not found")
-        if 'column' in data and data['column'].group != group:
+        if 'column' in data and data['column'].group_id != group.group_uuid:
             raise serializers.ValidationError("Column does not belong to this group.")
-        if 'assignee' in data and data['assignee'] and not group.members.filter(id=data['assignee'].id).exists():
+        if 'assignee' in data and data['assignee'] and not self.is_member(group, data['assignee']):
             raise serializers.ValidationError("Assignee must be a group member.")
         return data
 
+    def is_member(self, group, user):
+        validation = self.context.get('validation')
+        if validation is not None:
+            return user.pk in validation.member_ids
+        return group.members.filter(id=user.id).exists()
+
     def create(self, validated_data):
         tags_data = validated_data.pop('tags', [])
+        validated_data.setdefault('group', self.context['group'])
         card = Card.objects.create(**validated_data)
-        for tag_data in tags_data:
-            tag, _ = CardTag.objects.get_or_create(group=card.group, **tag_data)
-            card.tags.add(tag)
+        if tags_data:
+            self.set_tags(card, tags_data)
         return card
 
     def update(self, instance, validated_data):
         tags_data = validated_data.pop('tags', [])
         instance = super().update(instance, validated_data)
         if tags_data:
-            instance.tags.clear()
-            for tag_data in tags_data:
-                tag, _ = CardTag.objects.get_or_create(group=instance.group, **tag_data)
-                instance.tags.add(tag)
+            self.set_tags(instance, tags_data)
         return instance
+
+    def set_tags(self, card, tags_data):
+        # Все пары (name, color) - одной выборкой, недостающие теги - одним bulk_create,
+        # в таблице связей меняется только разница: число запросов не зависит от числа тегов
+        from .signals import board_changed
+
+        group_uuid = (self.context.get('group') or card.group).group_uuid
+        validation = self.context.get('validation')
+        tags, created = CardTag.resolve_many(
+            group_uuid,
+            [(tag['name'], tag['color']) for tag in tags_data],
+            known=validation.card_tags if validation is not None else None,
+        )
+        if created:
+            # bulk_create не отправляет post_save, журнал пишем сами
+            board_changed(group_uuid, [('card_tag', 'create', GroupCardTagSerializer(tag).data) for tag in created])
+
+        current = {tag.pk for tag in card.tags.all()}
+        wanted = {tag.pk for tag in tags.values()}
+        if current - wanted:
+            card.tags.remove(*(current - wanted))
+        if wanted - current:
+            card.tags.add(*(wanted - current))
     
 
 # class GroupSerializer(serializers.ModelSerializer):
@@ -85,7 +138,9 @@ class GroupCreateSerializer(serializers.ModelSerializer):
         fields = ['name']
 
 
-class GroupSerializerForProfile(serializers.ModelSerializer):
+class GroupSerializerForProfile(InstrumentedSerializerMixin, serializers.ModelSerializer):
+    icon = ImageVariantField(read_only=True)
+
     class Meta:
         model = Group
         fields = ['id', 'group_uuid', 'name', 'icon']
@@ -102,7 +157,7 @@ class UserTagCreateSerializer(serializers.ModelSerializer):
         fields = ['name', 'color']
 
 
-class UserTagSerializer(serializers.ModelSerializer):
+class UserTagSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
    
     class Meta:
         model = UserTag
@@ -117,24 +172,25 @@ class GroupCardTagCreateSerializer(serializers.ModelSerializer):
         fields = ['name', 'color']
 
 
-class ColumnBoardSerializer(serializers.ModelSerializer):
+class ColumnBoardSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ColumnBoard
         fields = ['id', 'name', 'color']
         read_only_fields = ['id']
 
 
-class GroupSerializer(serializers.ModelSerializer):
+class GroupSerializer(ImageVariantsSerializerMixin, InstrumentedSerializerMixin, serializers.ModelSerializer):
     members = UserProfileSerializer(many=True, read_only=True)
     board = ColumnBoardSerializer(many=True, read_only=True, source='columnboard_set')
+    icon = ImageVariantField(required=False, allow_null=True)
 
     class Meta:
         model = Group
-        fields = ['name', 'description', 'group_uuid', 'members', 'board']
+        fields = ['name', 'description', 'group_uuid', 'icon', 'members', 'board']
         read_only_fields = ['group_uuid', 'members', 'board']
 
 
-class UserTagRelationSerializer(serializers.ModelSerializer):
+class UserTagRelationSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     username = serializers.SlugRelatedField(
         slug_field='username',
         queryset=User.objects.all(),
@@ -0,0 +1,244 @@
+import threading
+from collections import OrderedDict
+from django.db import connection, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from devnexus.images import variants_ready
+from user.models import User
+from . import changes
+from .broker import publish_changes
+from .cache import snapshot_cache, user_version_key
+from .membership import invalidate_membership
+from .search import fuzzy_index
+from .models import Card, CardTag, ColumnBoard, Group, UserTag, UserTagRelation
+from .serializers import CardSerializer, ColumnBoardSerializer, GroupCardTagSerializer, UserTagSerializer
+
+
+# Card ссылается на группу по pk, остальные модели - по group_uuid.
+# group_uuid не меняется, поэтому соответствие pk -> group_uuid можно держать в памяти
+# (LRU, чтобы не расти вместе с числом групп).
+GROUP_UUIDS_MAX_ENTRIES = 10000
+_group_uuids = OrderedDict()
+_group_uuids_lock = threading.Lock()
+
+
+def remember_group_uuid(group_pk, group_uuid):
+    with _group_uuids_lock:
+        _group_uuids[group_pk] = group_uuid
+        _group_uuids.move_to_end(group_pk)
+        while len(_group_uuids) > GROUP_UUIDS_MAX_ENTRIES:
+            _group_uuids.popitem(last=False)
+
+
+def forget_group_uuid(group_pk):
+    with _group_uuids_lock:
+        _group_uuids.pop(group_pk, None)
+
+
+def group_uuid_for(group_pk):
+    with _group_uuids_lock:
+        group_uuid = _group_uuids.get(group_pk)
+        if group_uuid is not None:
+            _group_uuids.move_to_end(group_pk)
+            return group_uuid
+    group_uuid = Group.objects.filter(pk=group_pk).values_list('group_uuid', flat=True).first()
+    if group_uuid is not None:
+        remember_group_uuid(group_pk, group_uuid)
+    return group_uuid
+
+
+def card_group_uuid(card):
+    if Card.group.is_cached(card):
+        return card.group.group_uuid
+    return group_uuid_for(card.group_id)
+
+
+def related_value(instance, descriptor, field_name):
+    # Значение поля связанного объекта: из уже загруженного объекта, иначе одним values_list
+    field = descriptor.field
+    pk = getattr(instance, field.attname)
+    if pk is None:
+        return None
+    if descriptor.is_cached(instance):
+        return getattr(getattr(instance, field.name), field_name)
+    return field.related_model._base_manager.filter(pk=pk).values_list(field_name, flat=True).first()
+
+
+def card_payload(card, created=False):
+    """То же, что CardSerializer(card).data, но из уже загруженных полей и кэша prefetch"""
+    if created:
+        # Теги новой карточки добавляются после сохранения и приходят через card_tags_changed
+        tags = []
+    elif 'tags' in getattr(card, '_prefetched_objects_cache', {}):
+        tags = [{'code': tag.code, 'name': tag.name, 'color': tag.color} for tag in card.tags.all()]
+    else:
+        tags = list(card.tags.values('code', 'name', 'color'))
+    return {
+        'title': card.title,
+        'description': card.description,
+        'column': related_value(card, Card.column, 'name'),
+        'assignee': related_value(card, Card.assignee, 'username'),
+        'tags': tags,
+        'code': card.code,
+    }
+
+
+def invalidate_board(group_uuid):
+    if group_uuid is None:
+        return
+    snapshot_cache().invalidate(group_uuid)
+    if connection.in_atomic_block:
+        # Пока транзакция не закоммичена, кто-то может собрать снимок из старых данных
+        transaction.on_commit(lambda: snapshot_cache().invalidate(group_uuid))
+
+
+def board_changed(group_uuid, ops):
+    """Сбрасывает снимок доски, пишет операции (entity, op, payload) в журнал и рассылает их"""
+    invalidate_board(group_uuid)
+    publish_changes(group_uuid, changes.record_many(group_uuid, ops))
+
+
+def save_op(created):
+    return 'create' if created else 'update'
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    remember_group_uuid(instance.pk, instance.group_uuid)
+    payload = {'name': instance.name, 'description': instance.description}
+    board_changed(instance.group_uuid, [] if created else [('group', 'update', payload)])
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    changes.mark_group_deleting(instance.group_uuid)
+    # Связи с участниками удаляются каскадом, без m2m_changed
+    invalidate_membership(list(instance.members.values_list('pk', flat=True)))
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    forget_group_uuid(instance.pk)
+    changes.unmark_group_deleting(instance.group_uuid)
+    invalidate_board(instance.group_uuid)
+
+
+@receiver(post_save, sender=Card)
+def card_saved(sender, instance, created, **kwargs):
+    board_changed(card_group_uuid(instance), [('card', save_op(created), card_payload(instance, created))])
+
+
+@receiver(post_delete, sender=Card)
+def card_deleted(sender, instance, **kwargs):
+    board_changed(card_group_uuid(instance), [('card', 'delete', {'code': instance.code})])
+
+
+@receiver(post_save, sender=ColumnBoard)
+def column_saved(sender, instance, created, **kwargs):
+    board_changed(instance.group_id, [('column', save_op(created), ColumnBoardSerializer(instance).data)])
+
+
+@receiver(post_delete, sender=ColumnBoard)
+def column_deleted(sender, instance, **kwargs):
+    board_changed(instance.group_id, [('column', 'delete', {'id': instance.id})])
+
+
+@receiver(post_save, sender=CardTag)
+def card_tag_saved(sender, instance, created, **kwargs):
+    board_changed(instance.group_id, [('card_tag', save_op(created), GroupCardTagSerializer(instance).data)])
+
+
+@receiver(post_delete, sender=CardTag)
+def card_tag_deleted(sender, instance, **kwargs):
+    board_changed(instance.group_id, [('card_tag', 'delete', {'code': instance.code})])
+
+
+@receiver(post_save, sender=UserTag)
+def user_tag_saved(sender, instance, created, **kwargs):
+    board_changed(instance.group_id, [('user_tag', save_op(created), UserTagSerializer(instance).data)])
+
+
+@receiver(post_delete, sender=UserTag)
+def user_tag_deleted(sender, instance, **kwargs):
+    board_changed(instance.group_id, [('user_tag', 'delete', {'code': instance.code})])
+
+
+@receiver(post_save, sender=UserTagRelation)
+@receiver(post_delete, sender=UserTagRelation)
+def user_tag_relation_changed(sender, instance, created=False, **kwargs):
+    op = 'delete' if kwargs['signal'] is post_delete else save_op(created)
+    payload = {'username': instance.user.username, 'tag_code': instance.tag.code}
+    board_changed(instance.tag.group_id, [('user_tag_relation', op, payload)])
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+def group_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    op = 'create' if action == 'post_add' else 'delete'
+    if not reverse:
+        if pk_set is not None:
+            invalidate_membership(pk_set)
+        else:
+            invalidate_membership(list(instance.members.values_list('pk', flat=True)))
+        users = User.objects.filter(pk__in=pk_set) if pk_set is not None else instance.members.all()
+        usernames = users.values_list('username', flat=True)
+        board_changed(instance.group_uuid, [('member', op, {'username': username}) for username in usernames])
+        return
+    invalidate_membership([instance.pk])
+    if pk_set is not None:
+        group_uuids = [group_uuid_for(group_pk) for group_pk in pk_set]
+    else:
+        group_uuids = instance.group_memberships.values_list('group_uuid', flat=True)
+    for group_uuid in group_uuids:
+        board_changed(group_uuid, [('member', op, {'username': instance.username})])
+
+
+@receiver(m2m_changed, sender=Card.tags.through)
+def card_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        board_changed(card_group_uuid(instance), [('card', 'update', card_payload(instance))])
+        return
+    cards = Card.objects.filter(pk__in=pk_set or ()).select_related('column', 'assignee').prefetch_related('tags')
+    board_changed(instance.group_id, [('card', 'update', data) for data in CardSerializer(cards, many=True).data])
+
+
+# Данные пользователя (username, email, description) входят в снимки его групп
+BOARD_USER_FIELDS = {'username', 'email', 'description', 'avatar'}
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        # pk может достаться от удаленного пользователя вместе с его закэшированным членством
+        invalidate_membership([instance.pk])
+        return
+    if (update_fields is not None and not BOARD_USER_FIELDS & set(update_fields)):
+        return
+    invalidate_board(user_version_key(instance.pk))
+    for group_uuid in instance.group_memberships.values_list('group_uuid', flat=True):
+        invalidate_board(group_uuid)
+        # Переименование не попадает в журнал, корпус поиска пересоберется при следующем поиске
+        fuzzy_index().forget(group_uuid)
+
+
+@receiver(variants_ready, sender=User)
+def avatar_variants_ready(sender, pk, **kwargs):
+    # Миниатюры записываются через update(), post_save не отправляется
+    invalidate_board(user_version_key(pk))
+    for group_uuid in Group.objects.filter(members=pk).values_list('group_uuid', flat=True):
+        invalidate_board(group_uuid)
+
+
+@receiver(variants_ready, sender=Group)
+def icon_variants_ready(sender, pk, **kwargs):
+    invalidate_board(group_uuid_for(pk))
+
+
+@receiver(pre_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    for group_uuid in instance.group_memberships.values_list('group_uuid', flat=True):
+        invalidate_board(group_uuid)
+        fuzzy_index().forget(group_uuid)
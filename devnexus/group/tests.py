@@ -1,9 +1,32 @@
 from rest_framework.test import APIClient
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from .models import *
 from user.models import User
 from rest_framework import status
+from .cache import snapshot_cache
+from .membership import member_group_ids
+from .serializers import CardSerializer
+from .validation import GroupValidationContext
+from .broker import InProcessBroker, broker
+from .realtime import board_socket, CLOSE_FORBIDDEN, CLOSE_UNAUTHORIZED
+from .views import CardListView, GroupDetailView
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from rest_framework_simplejwt.tokens import AccessToken
+import asyncio
+from datetime import timedelta
+import gzip
+import json
+import re
+import runpy
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.db import IntegrityError, connection, connections
+from django.conf import settings
+from django.test.utils import CaptureQueriesContext
+from devnexus.workers import process_local_backends
+from types import SimpleNamespace
+from unittest import mock
 
 class GroupCreateViewTests(TestCase):
     def setUp(self):
@@ -102,7 +125,8 @@ class CardCreateViewTests(TestCase):
         self.client.force_authenticate(user=self.user)
 
     def test_create_card_success(self):
-        data = {'title': 'Test Card', 'column': self.column.id}
+        # Колонка карточки задается именем (CardSerializer.column - slug по name)
+        data = {'title': 'Test Card', 'column': self.column.name}
         url = reverse('group:card-create', kwargs={'group_uuid': self.group.group_uuid})
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
@@ -110,6 +134,8 @@ class CardCreateViewTests(TestCase):
         card = Card.objects.first()
         self.assertEqual(card.title, 'Test Card')
         self.assertEqual(card.column.id, self.column.id)
+        self.assertEqual(card.group, self.group)
+        self.assertEqual(response.data['column'], 'Column1')
 
     def test_create_card_invalid_data(self):
         data = {'title': 'Test Card'}  # Отсутствует 'column'
@@ -120,17 +146,1290 @@ class CardCreateViewTests(TestCase):
     def test_create_card_non_member(self):
         other_user = User.objects.create_user(username='otheruser', password='testpass')
         self.client.force_authenticate(user=other_user)
-        data = {'title': 'Test Card', 'column': self.column.id}
+        data = {'title': 'Test Card', 'column': self.column.name}
         url = reverse('group:card-create', kwargs={'group_uuid': self.group.group_uuid})
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
     def test_create_card_nonexistent_group(self):
         url = reverse('group:card-create', kwargs={'group_uuid': 'nonexistent'})
-        data = {'title': 'Test Card', 'column': self.column.id}
+        data = {'title': 'Test Card', 'column': self.column.name}
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+class GroupBoardQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.group = Group.objects.create(name='Test Group', admin=self.user)
+        self.group.members.add(self.user)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('group:group-detail', kwargs={'group_uuid': self.group.group_uuid})
+        # Членство кэшируется на первом запросе, сравниваем прогретые запросы
+        member_group_ids(self.user.pk)
+
+    def fill_board(self, columns, cards_per_column, prefix):
+        member = User.objects.create_user(username=f'{prefix}-member', password='testpass')
+        self.group.members.add(member)
+        user_tag = UserTag.objects.create(name=f'{prefix}-role', color='red', group=self.group)
+        UserTagRelation.objects.create(user=member, tag=user_tag)
+        card_tag = CardTag.objects.create(name=f'{prefix}-tag', color='green', group=self.group)
+        for i in range(columns):
+            column = ColumnBoard.objects.create(name=f'{prefix}-{i}', color='blue', group=self.group)
+            for j in range(cards_per_column):
+                card = Card.objects.create(title=f'{prefix} {i}-{j}', column=column, group=self.group, assignee=member)
+                card.tags.add(card_tag)
+
+    def get_board(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(ctx.captured_queries)
+
+    def test_query_count_does_not_depend_on_board_size(self):
+        self.fill_board(columns=1, cards_per_column=1, prefix='small')
+        _, small_queries = self.get_board()
+
+        self.fill_board(columns=5, cards_per_column=10, prefix='large')
+        response, large_queries = self.get_board()
+
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(len(response.data['board']['columns']), 6)
+
+    def test_cards_are_grouped_by_column(self):
+        self.fill_board(columns=3, cards_per_column=2, prefix='c')
+        response, _ = self.get_board()
+
+        for column in response.data['board']['columns']:
+            self.assertEqual(len(column['tasks']), 2)
+            for task in column['tasks']:
+                self.assertEqual(task['column'], column['name'])
+                self.assertEqual(task['assignee'], 'c-member')
+                self.assertEqual(task['tags'][0]['name'], 'c-tag')
+
+        member = next(m for m in response.data['members'] if m['username'] == 'c-member')
+        self.assertEqual(member['tags'][0]['name'], 'c-role')
+
+
+class GroupBoardSnapshotCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.group = Group.objects.create(name='Test Group', admin=self.user)
+        self.group.members.add(self.user)
+        self.column = ColumnBoard.objects.create(name='Column1', color='blue', group=self.group)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('group:group-detail', kwargs={'group_uuid': self.group.group_uuid})
+
+    def get_tasks(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['board']['columns'][0]['tasks']
+
+    def test_second_read_is_served_from_cache(self):
+        self.client.get(self.url)
+        stats = snapshot_cache().stats()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(snapshot_cache().stats()['hits'], stats['hits'] + 1)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json()['name'], 'Test Group')
+        self.assertFalse(any('"card"' in q['sql'] for q in ctx.captured_queries))
+
+    def test_card_changes_invalidate_snapshot(self):
+        self.assertEqual(self.get_tasks(), [])
+        card = Card.objects.create(title='Card', column=self.column, group=self.group)
+        self.assertEqual(self.get_tasks()[0]['title'], 'Card')
+        tag = CardTag.objects.create(name='bug', color='red', group=self.group)
+        card.tags.add(tag)
+        self.assertEqual(self.get_tasks()[0]['tags'][0]['name'], 'bug')
+        card.delete()
+        self.assertEqual(self.get_tasks(), [])
+
+    def test_membership_changes_invalidate_snapshot(self):
+        self.client.get(self.url)
+        other_user = User.objects.create_user(username='otheruser', password='testpass')
+        self.group.members.add(other_user)
+        response = self.client.get(self.url)
+        self.assertIn('otheruser', [m['username'] for m in response.data['members']])
+
+        tag = UserTag.objects.create(name='lead', color='gold', group=self.group)
+        UserTagRelation.objects.create(user=other_user, tag=tag)
+        response = self.client.get(self.url)
+        member = next(m for m in response.data['members'] if m['username'] == 'otheruser')
+        self.assertEqual(member['tags'][0]['name'], 'lead')
+
+        other_user.group_memberships.remove(self.group)
+        response = self.client.get(self.url)
+        self.assertNotIn('otheruser', [m['username'] for m in response.data['members']])
+
+    @override_settings(BOARD_SNAPSHOT_CACHE={'BACKEND': 'group.cache.DjangoCacheSnapshotBackend'})
+    def test_shared_backend(self):
+        self.get_tasks()
+        Card.objects.create(title='Card', column=self.column, group=self.group)
+        self.assertEqual(self.get_tasks()[0]['title'], 'Card')
+        self.assertEqual(snapshot_cache().stats(), {'hits': 0, 'misses': 2})
+
+    def test_shared_backend_snapshots_expire(self):
+        config = {'BACKEND': 'group.cache.DjangoCacheSnapshotBackend', 'OPTIONS': {}, 'SNAPSHOT_TIMEOUT': 60}
+        with override_settings(BOARD_SNAPSHOT_CACHE=config):
+            backend = snapshot_cache().backend
+            version = backend.get_version(self.group.group_uuid)
+            backend.set(self.group.group_uuid, version, b'{}')
+            self.assertEqual(backend.get(self.group.group_uuid, version), b'{}')
+            # Через минуту снимок истек, а версия (и ETag) осталась прежней
+            later = time.time() + 61
+            with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+                self.assertIsNone(backend.get(self.group.group_uuid, version))
+                self.assertEqual(backend.get_version(self.group.group_uuid), version)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.group = Group.objects.create(name='Test Group', admin=self.user)
+        self.group.members.add(self.user)
+        self.column = ColumnBoard.objects.create(name='Column1', color='blue', group=self.group)
+        self.client.force_authenticate(user=self.user)
+
+    def assert_conditional(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_group_detail(self):
+        url = reverse('group:group-detail', kwargs={'group_uuid': self.group.group_uuid})
+        self.assert_conditional(url, lambda: Card.objects.create(title='Card', column=self.column, group=self.group))
+
+    def test_card_list(self):
+        url = reverse('group:card-list', kwargs={'group_uuid': self.group.group_uuid})
+        self.assert_conditional(url, lambda: Card.objects.create(title='Card', column=self.column, group=self.group))
+
+    def test_current_user_profile(self):
+        url = reverse('user:me')
+        self.assert_conditional(url, lambda: Card.objects.create(
+            title='Card', column=self.column, group=self.group, assignee=self.user))
+
+        def rename():
+            self.user.description = 'changed'
+            self.user.save()
+        self.assert_conditional(url, rename)
+
+        other_group = Group.objects.create(name='Other Group', admin=self.user)
+        self.assert_conditional(url, lambda: other_group.members.add(self.user))
+
+
+class BoardChangesViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.group = Group.objects.create(name='Test Group', admin=self.user)
+        self.group.members.add(self.user)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('group:board-changes', kwargs={'group_uuid': self.group.group_uuid})
+
+    def get_changes(self, since):
+        response = self.client.get(self.url, {'since': since})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_changes_since_version(self):
+        start = self.get_changes(0)['version']
+        column = ColumnBoard.objects.create(name='Column1', color='blue', group=self.group)
+        card = Card.objects.create(title='Card', column=column, group=self.group)
+        card.title = 'Renamed'
+        card.save()
+        card.delete()
+
+        data = self.get_changes(start)
+        self.assertFalse(data['full'])
+        ops = [(c['entity'], c['op']) for c in data['changes']]
+        self.assertEqual(ops, [('column', 'create'), ('card', 'create'), ('card', 'update'), ('card', 'delete')])
+        self.assertEqual([c['version'] for c in data['changes']], list(range(start + 1, start + 5)))
+        self.assertEqual(data['changes'][2]['data']['title'], 'Renamed')
+        self.assertEqual(data['version'], start + 4)
+
+        self.assertEqual(self.get_changes(data['version'])['changes'], [])
+
+    def test_membership_changes(self):
+        start = self.get_changes(0)['version']
+        other_user = User.objects.create_user(username='otheruser', password='testpass')
+        self.group.members.add(other_user)
+        other_user.group_memberships.remove(self.group)
+
+        ops = [(c['entity'], c['op'], c['data']) for c in self.get_changes(start)['changes']]
+        self.assertEqual(ops, [
+            ('member', 'create', {'username': 'otheruser'}),
+            ('member', 'delete', {'username': 'otheruser'}),
+        ])
+
+    @override_settings(BOARD_CHANGES={'RETENTION': 3, 'COMPACT_EVERY': 2})
+    def test_compacted_version_returns_snapshot(self):
+        column = ColumnBoard.objects.create(name='Column1', color='blue', group=self.group)
+        for i in range(6):
+            Card.objects.create(title=f'Card {i}', column=column, group=self.group)
+
+        self.assertLessEqual(BoardChange.objects.filter(group=self.group).count(), 4)
+        data = self.get_changes(0)
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['snapshot']['board']['columns'][0]['tasks']), 6)
+
+        data = self.get_changes(data['version'] - 2)
+        self.assertFalse(data['full'])
+        self.assertEqual(len(data['changes']), 2)
+
+    def test_group_save_keeps_change_version(self):
+        # Добавление участника и правка группы не должны откатывать версию журнала
+        other_user = User.objects.create_user(username='newmember', password='testpass')
+        url = reverse('group:add-member-to-group', kwargs={'group_uuid': self.group.group_uuid})
+        response = self.client.put(url, {'username': 'newmember'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        url = reverse('group:column-create', kwargs={'group_uuid': self.group.group_uuid})
+        response = self.client.post(url, {'name': 'Column1', 'color': 'blue'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        stale = Group.objects.get(pk=self.group.pk)
+        ColumnBoard.objects.create(name='Column2', color='red', group=self.group)
+        stale.name = 'Renamed'
+        stale.save()
+        ColumnBoard.objects.create(name='Column3', color='red', group=self.group)
+
+        versions = list(BoardChange.objects.filter(group=self.group).order_by('version').values_list('version', flat=True))
+        self.assertEqual(versions, list(range(1, len(versions) + 1)))
+        self.assertIn(other_user, self.group.members.all())
+
+    def test_card_payload_matches_serializer(self):
+        column = ColumnBoard.objects.create(name='Column1', color='blue', group=self.group)
+        card = Card.objects.create(title='Card', column=column, group=self.group, assignee=self.user)
+        card.tags.add(CardTag.objects.create(name='bug', color='red', group=self.group))
+        start = self.get_changes(0)['version']
+
+        card = Card.objects.get(pk=card.pk)
+        card.title = 'Renamed'
+        card.save()
+        data = self.get_changes(start)['changes'][0]['data']
+        self.assertEqual(data, CardSerializer(Card.objects.get(pk=card.pk)).data)
+
+    def test_card_update_logs_without_extra_queries(self):
+        # Колонка, исполнитель и теги уже загружены view, журнал не перечитывает их
+        column = ColumnBoard.objects.create(name='Column1', color='blue', group=self.group)
+        card = Card.objects.create(title='Card', column=column, group=self.group, assignee=self.user)
+        card.tags.add(CardTag.objects.create(name='bug', color='red', group=self.group))
+        card = Card.objects.select_related('group', 'column', 'assignee').prefetch_related('tags').get(pk=card.pk)
+        card.title = 'Renamed'
+        with CaptureQueriesContext(connection) as queries:
+            card.save()
+        selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        for table in (ColumnBoard._meta.db_table, CardTag._meta.db_table, User._meta.db_table):
+            self.assertFalse([sql for sql in selects if f'FROM "{table}"' in sql], table)
+
+    def test_invalid_since(self):
+        response = self.client.get(self.url, {'since': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_group_can_be_deleted_with_log(self):
+        column = ColumnBoard.objects.create(name='Column1', color='blue', group=self.group)
+        Card.objects.create(title='Card', column=column, group=self.group)
+        self.group.delete()
+        self.assertFalse(BoardChange.objects.exists())
+
+
+class BoardSocketTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.group = Group.objects.create(name='Test Group', admin=self.user)
+        self.group.members.add(self.user)
+        self.column = ColumnBoard.objects.create(name='Column1', color='blue', group=self.group)
+
+    def scope(self, user=None, token=None):
+        if token is None:
+            token = str(AccessToken.for_user(user))
+        return {
+            'type': 'websocket',
+            'path': f'/ws/groups/{self.group.group_uuid}/',
+            'query_string': f'token={token}'.encode(),
+            'headers': [],
+        }
+
+    def connect(self, scope, scenario):
+        async def run():
+            inbox, outbox = asyncio.Queue(), asyncio.Queue()
+            await inbox.put({'type': 'websocket.connect'})
+            task = asyncio.create_task(board_socket(scope, inbox.get, outbox.put))
+            first = await asyncio.wait_for(outbox.get(), 5)
+            result = await scenario(first, outbox) if first['type'] == 'websocket.accept' else first
+            await inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+            await asyncio.wait_for(task, 5)
+            return result
+        return async_to_sync(run)()
+
+    def create_card(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Card.objects.create(title='Card', column=self.column, group=self.group)
+
+    def test_member_receives_card_changes(self):
+        async def scenario(accept, outbox):
+            await sync_to_async(self.create_card)()
+            return await asyncio.wait_for(outbox.get(), 5)
+
+        message = self.connect(self.scope(self.user), scenario)
+        self.assertEqual(message['type'], 'websocket.send')
+        event = json.loads(message['text'])
+        self.assertEqual((event['entity'], event['op']), ('card', 'create'))
+        self.assertEqual(event['data']['title'], 'Card')
+
+    def test_non_member_is_rejected(self):
+        other_user = User.objects.create_user(username='otheruser', password='testpass')
+        message = self.connect(self.scope(other_user), None)
+        self.assertEqual(message, {'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+
+    def test_invalid_token_is_rejected(self):
+        message = self.connect(self.scope(token='invalid'), None)
+        self.assertEqual(message, {'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+
+    def test_removed_member_is_disconnected(self):
+        other_user = User.objects.create_user(username='otheruser', password='testpass')
+        self.group.members.add(other_user)
+
+        def remove_member():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.group.members.remove(other_user)
+
+        async def scenario(accept, outbox):
+            await sync_to_async(remove_member)()
+            return await asyncio.wait_for(outbox.get(), 5)
+
+        message = self.connect(self.scope(other_user), scenario)
+        self.assertEqual(message, {'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+
+    def test_remaining_member_sees_removal(self):
+        other_user = User.objects.create_user(username='otheruser', password='testpass')
+        self.group.members.add(other_user)
+
+        def remove_member():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.group.members.remove(other_user)
+
+        async def scenario(accept, outbox):
+            await sync_to_async(remove_member)()
+            return await asyncio.wait_for(outbox.get(), 5)
+
+        message = self.connect(self.scope(self.user), scenario)
+        self.assertEqual(json.loads(message['text'])['data'], {'username': 'otheruser'})
+
+    def test_expired_token_is_disconnected(self):
+        token = AccessToken.for_user(self.user)
+        token.set_exp(lifetime=timedelta(seconds=1))
+
+        async def scenario(accept, outbox):
+            return await asyncio.wait_for(outbox.get(), 5)
+
+        message = self.connect(self.scope(token=str(token)), scenario)
+        self.assertEqual(message, {'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+
+    @override_settings(BOARD_EVENTS={**settings.BOARD_EVENTS, 'RECHECK': 0.05})
+    def test_revoked_token_is_disconnected(self):
+        def change_password():
+            self.user.set_password('newpass')
+            self.user.token_version += 1
+            self.user.save()
+
+        async def scenario(accept, outbox):
+            await sync_to_async(change_password)()
+            return await asyncio.wait_for(outbox.get(), 5)
+
+        message = self.connect(self.scope(self.user), scenario)
+        self.assertEqual(message, {'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+
+
+class BoardEventsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.group = Group.objects.create(name='Test Group', admin=self.user)
+        self.group.members.add(self.user)
+        self.column = ColumnBoard.objects.create(name='Column1', color='blue', group=self.group)
+        self.url = reverse('group:board-events', kwargs={'group_uuid': self.group.group_uuid})
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def create_card(self, title='Card'):
+        with self.captureOnCommitCallbacks(execute=True):
+            Card.objects.create(title=title, column=self.column, group=self.group)
+
+    async def next_chunk(self, stream):
+        return (await asyncio.wait_for(anext(stream), 5)).decode()
+
+    async def test_stream_receives_changes(self):
+        response = await self.async_client.get(self.url, headers=self.headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await self.next_chunk(stream)).startswith('retry:'))
+
+        await sync_to_async(self.create_card)()
+        chunk = await self.next_chunk(stream)
+        self.assertIn('event: change', chunk)
+        data = json.loads(chunk.split('data: ', 1)[1])
+        self.assertEqual((data['entity'], data['op'], data['data']['title']), ('card', 'create', 'Card'))
+
+    @override_settings(BOARD_EVENTS={**settings.BOARD_EVENTS, 'HEARTBEAT': 0.01, 'RETRY_MS': 1000})
+    async def test_heartbeat(self):
+        response = await self.async_client.get(self.url, headers=self.headers)
+        stream = aiter(response.streaming_content)
+        await self.next_chunk(stream)
+        self.assertEqual(await self.next_chunk(stream), ': ping\n\n')
+
+    async def test_resume_from_last_event_id(self):
+        await sync_to_async(self.create_card)('First')
+        await sync_to_async(self.create_card)('Second')
+        group = await Group.objects.aget(pk=self.group.pk)
+
+        headers = dict(self.headers, **{'Last-Event-ID': str(group.change_version - 2)})
+        response = await self.async_client.get(self.url, headers=headers)
+        stream = aiter(response.streaming_content)
+        await self.next_chunk(stream)
+        self.assertIn('"title":"First"', await self.next_chunk(stream))
+        self.assertIn(f'id: {group.change_version}\n', await self.next_chunk(stream))
+
+    async def test_non_member_is_rejected(self):
+        other_user = await User.objects.acreate(username='otheruser')
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(other_user)}'}
+        response = await self.async_client.get(self.url, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_requires_asgi(self):
+        response = self.client.get(self.url, headers=self.headers)
+        self.assertEqual(response.status_code, 501)
+
+    async def test_removed_member_stream_is_closed(self):
+        other_user = await User.objects.acreate(username='otheruser')
+        await self.group.members.aadd(other_user)
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(other_user)}'}
+        response = await self.async_client.get(self.url, headers=headers)
+        stream = aiter(response.streaming_content)
+        await self.next_chunk(stream)
+
+        def remove_member():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.group.members.remove(other_user)
+
+        await sync_to_async(remove_member)()
+        self.assertEqual(await self.next_chunk(stream), f'event: close\ndata: {{"code": {CLOSE_FORBIDDEN}}}\n\n')
+        with self.assertRaises(StopAsyncIteration):
+            await self.next_chunk(stream)
+
+    async def open_stream(self):
+        response = await self.async_client.get(self.url, headers=self.headers)
+        stream = aiter(response.streaming_content)
+        await self.next_chunk(stream)
+        group = await Group.objects.aget(pk=self.group.pk)
+        return stream, group.change_version
+
+    def message(self, version):
+        return {'version': version, 'entity': 'card', 'op': 'delete', 'data': {'code': f'{version:06}'}}
+
+    async def test_out_of_order_versions_are_reordered(self):
+        stream, version = await self.open_stream()
+        # on_commit второй транзакции отработал раньше первой
+        broker().publish(self.group.group_uuid, [self.message(version + 2)])
+        broker().publish(self.group.group_uuid, [self.message(version + 1)])
+        self.assertIn(f'id: {version + 1}\n', await self.next_chunk(stream))
+        self.assertIn(f'id: {version + 2}\n', await self.next_chunk(stream))
+
+    @override_settings(BOARD_EVENTS={**settings.BOARD_EVENTS, 'GAP_TIMEOUT': 0.05})
+    async def test_lost_version_sends_resync(self):
+        stream, version = await self.open_stream()
+        broker().publish(self.group.group_uuid, [self.message(version + 2)])
+        chunk = await self.next_chunk(stream)
+        self.assertEqual(chunk, f'event: resync\ndata: {{"version": {version}}}\n\n')
+        with self.assertRaises(StopAsyncIteration):
+            await self.next_chunk(stream)
+
+    def test_recent_with_out_of_order_history(self):
+        history = InProcessBroker(history_size=3)
+        history.publish('group', [self.message(5), self.message(7), self.message(6)])
+        self.assertEqual([m['version'] for m in history.recent('group', 4)], [5, 6, 7])
+        self.assertIsNone(history.recent('group', 3))
+        # Вытеснена v5, но раньше v6 пришла v7: с 6 буфер покрывает все
+        history.publish('group', [self.message(8)])
+        self.assertIsNone(history.recent('group', 4))
+        self.assertEqual([m['version'] for m in history.recent('group', 5)], [6, 7, 8])
+        # Вытеснена v7, хотя v6 осталась: с 6 буфер больше ничего не покрывает
+        history.publish('group', [self.message(9)])
+        self.assertIsNone(history.recent('group', 6))
+        self.assertEqual([m['version'] for m in history.recent('group', 7)], [8, 9])
+
+    async def test_query_token_only_when_allowed(self):
+        query = {'token': str(AccessToken.for_user(self.user))}
+        response = await self.async_client.get(self.url, query)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        with self.settings(BOARD_EVENTS={**settings.BOARD_EVENTS, 'QUERY_TOKEN': True}):
+            response = await self.async_client.get(self.url, query)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            await response.streaming_content.aclose()
+
+
+class GroupCodeCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.group = Group.objects.create(name='Test Group', admin=self.user)
+        self.column = ColumnBoard.objects.create(name='Column1', color='blue', group=self.group)
+
+    def test_codes_are_sequential_per_group_and_kind(self):
+        cards = [Card.objects.create(title=f'Card {i}', column=self.column, group=self.group) for i in range(3)]
+        self.assertEqual([card.code for card in cards], ['000001', '000002', '000003'])
+        tag = CardTag.objects.create(name='bug', color='red', group=self.group)
+        self.assertEqual(tag.code, '000001')
+
+        other_group = Group.objects.create(name='Other Group', admin=self.user)
+        other_column = ColumnBoard.objects.create(name='Column1', color='blue', group=other_group)
+        self.assertEqual(Card.objects.create(title='Card', column=other_column, group=other_group).code, '000001')
+
+    def test_allocate_block(self):
+        Card.objects.create(title='Card', column=self.column, group=self.group)
+        codes = GroupCodeCounter.allocate(self.group.group_uuid, GroupCodeCounter.CARD, count=3)
+        self.assertEqual(codes, ['000002', '000003', '000004'])
+        self.assertEqual(Card.objects.create(title='Card', column=self.column, group=self.group).code, '000005')
+
+    def test_counter_continues_from_existing_codes(self):
+        Card.objects.create(title='Card', column=self.column, group=self.group, code='000041')
+        GroupCodeCounter.objects.filter(group=self.group, kind=GroupCodeCounter.CARD).delete()
+        self.assertEqual(Card.objects.create(title='Card', column=self.column, group=self.group).code, '000042')
+
+    def test_duplicate_code_is_rejected(self):
+        Card.objects.create(title='Card', column=self.column, group=self.group, code='000001')
+        with self.assertRaises(IntegrityError):
+            Card.objects.create(title='Card', column=self.column, group=self.group, code='000001')
+
+
+class GroupCodeCounterConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("In-memory SQLite does not support concurrent writers")
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.group = Group.objects.create(name='Test Group', admin=self.user)
+        self.column = ColumnBoard.objects.create(name='Column1', color='blue', group=self.group)
+
+    def create_card(self, i):
+        try:
+            return Card.objects.create(title=f'Card {i}', column=self.column, group=self.group).code
+        finally:
+            connections.close_all()
+
+    def test_concurrent_inserts_get_unique_codes(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            codes = list(executor.map(self.create_card, range(40)))
+        self.assertEqual(sorted(codes), [f"{i:06}" for i in range(1, 41)])
+
+
+class GroupScopedQueryPlanTests(TestCase):
+    """Групповые выборки не должны читать таблицы целиком"""
+
+    SEQ_SCAN = {
+        'sqlite': re.compile(r'\bSCAN (?!CONSTANT)(\S+)'),
+        'postgresql': re.compile(r'Seq Scan on (\S+)'),
+    }
 
+    def setUp(self):
+        self.user = User.objects.create_user(username='planuser', password='testpass')
+        self.group = Group.objects.create(name='Plan Group', admin=self.user)
+        self.group.members.add(self.user)
+        self.column = ColumnBoard.objects.create(name='todo', group=self.group)
+        self.tag = CardTag.objects.create(name='bug', group=self.group)
+        self.user_tag = UserTag.objects.create(name='backend', group=self.group)
+        UserTagRelation.objects.create(user=self.user, tag=self.user_tag)
+
+    def assertNoSeqScan(self, queryset):
+        pattern = self.SEQ_SCAN.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f'Нет разбора плана для {connection.vendor}')
+        if connection.vendor == 'postgresql':
+            # На пустых тестовых таблицах планировщик и так выбрал бы Seq Scan
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertEqual(pattern.findall(plan), [], plan)
+
+    def test_card_lookups(self):
+        group_uuid = self.group.group_uuid
+        self.assertNoSeqScan(Card.objects.filter(group__group_uuid=group_uuid, code='000001'))
+        self.assertNoSeqScan(Card.objects.filter(group=self.group).order_by('id'))
+        self.assertNoSeqScan(Card.objects.filter(group=self.group, assignee=self.user))
+        self.assertNoSeqScan(Card.objects.filter(group=self.group, column=self.column))
+        self.assertNoSeqScan(Card.objects.filter(group=self.group).order_by('created_at', 'id'))
+        self.assertNoSeqScan(Card.objects.filter(assignee=self.user, group__in=[self.group.id]))
+
+    def test_tag_and_column_lookups(self):
+        group_uuid = self.group.group_uuid
+        self.assertNoSeqScan(CardTag.objects.filter(group__group_uuid=group_uuid, code=self.tag.code))
+        self.assertNoSeqScan(UserTag.objects.filter(group=self.group, code=self.user_tag.code))
+        self.assertNoSeqScan(ColumnBoard.objects.filter(group__group_uuid=group_uuid, name='todo'))
+        self.assertNoSeqScan(UserTagRelation.objects.filter(tag__group=self.group))
+        self.assertNoSeqScan(UserTagRelation.objects.filter(user=self.user, tag__group=self.group))
+
+    def test_group_lookups(self):
+        self.assertNoSeqScan(Group.objects.filter(group_uuid=self.group.group_uuid, members=self.user.id))
+        self.assertNoSeqScan(self.user.group_memberships.all())
+        self.assertNoSeqScan(BoardChange.objects.filter(group=self.group, version__gt=0).order_by('version'))
+        self.assertNoSeqScan(GroupCodeCounter.objects.filter(group=self.group, kind=GroupCodeCounter.CARD))
+
+
+def instrumentation_settings(**overrides):
+    return {
+        'HEADERS': True, 'METRICS_TOKEN': 'metrics-token', 'METRICS_PUBLIC': False,
+        'DEFAULT_BUDGET': {}, 'BUDGETS': {}, **overrides,
+    }
+
+
+class GunicornWorkersTests(TestCase):
+    def setUp(self):
+        self.config = runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+
+    def start(self, workers):
+        self.config['on_starting'](SimpleNamespace(cfg=SimpleNamespace(workers=workers)))
+
+    def test_single_worker_by_default(self):
+        self.assertEqual(self.config['workers'], 1)
+        self.start(1)
+
+    def test_several_workers_need_shared_backends(self):
+        with self.assertRaisesMessage(RuntimeError, 'BOARD_BROKER'):
+            self.start(4)
+
+        shared = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379'}
+        with override_settings(
+            CACHES={'default': shared},
+            BOARD_SNAPSHOT_CACHE={'BACKEND': 'group.cache.DjangoCacheSnapshotBackend', 'OPTIONS': {}},
+            BOARD_BROKER={'BACKEND': 'example.broker.RedisBroker', 'OPTIONS': {}},
+            AUTH_THROTTLE=dict(settings.AUTH_THROTTLE, STORE='user.throttling.CacheBucketStore'),
+        ):
+            self.assertEqual(process_local_backends(), [])
+            self.start(4)
+        with override_settings(CACHES={'default': shared, 'local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                               TOKEN_USER_CACHE={'CACHE_ALIAS': 'local', 'TIMEOUT': 60}):
+            self.assertIn('TOKEN_USER_CACHE', process_local_backends())
+
+
+class RequestInstrumentationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='metricsuser', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.group = Group.objects.create(name='Metrics Group', admin=self.user)
+        self.group.members.add(self.user)
+        column = ColumnBoard.objects.create(name='todo', group=self.group)
+        Card.objects.create(title='Card', group=self.group, column=column, assignee=self.user)
+        self.url = reverse('group:card-list', kwargs={'group_uuid': self.group.group_uuid})
+
+    @override_settings(REQUEST_INSTRUMENTATION=instrumentation_settings())
+    def test_debug_headers(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Query-Count'], str(len(queries)))
+        timings = dict(part.split(';dur=') for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timings), {'db', 'serializer', 'total'})
+        self.assertGreater(float(timings['serializer']), 0)
+
+    @override_settings(REQUEST_INSTRUMENTATION=instrumentation_settings(HEADERS=False))
+    def test_headers_disabled(self):
+        response = self.client.get(self.url)
+        self.assertNotIn('X-Query-Count', response)
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(REQUEST_INSTRUMENTATION=instrumentation_settings(BUDGETS={'group:card-list': {'queries': 1}}))
+    def test_budget_violation(self):
+        from devnexus.instrumentation import metrics
+
+        before = metrics.violations().get(('group:card-list', 'queries'), 0)
+        with self.assertLogs('devnexus.instrumentation', level='WARNING') as logs:
+            self.client.get(self.url)
+        self.assertIn('group:card-list', logs.output[0])
+        self.assertEqual(metrics.violations()[('group:card-list', 'queries')], before + 1)
+
+    @override_settings(DEBUG=True, REQUEST_INSTRUMENTATION=instrumentation_settings())
+    def test_metrics_endpoint(self):
+        self.client.get(self.url)
+        # DEBUG не открывает метрики без токена
+        self.assertEqual(self.client.get('/metrics/').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer metrics-token')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('devnexus_request_queries_bucket{view="group:card-list",le="+Inf"}', body)
+        self.assertIn('devnexus_board_snapshot_cache_total{result="hit"}', body)
+        # Пул соединений psycopg бывает только у PostgreSQL с DB_CONN_MODE=pool
+        self.assertEqual('devnexus_db_pool_connections' in body, bool(connection.settings_dict['OPTIONS'].get('pool')))
+
+    @override_settings(REQUEST_INSTRUMENTATION=instrumentation_settings(METRICS_TOKEN='', METRICS_PUBLIC=True))
+    def test_public_metrics_endpoint(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, status.HTTP_200_OK)
+        with override_settings(REQUEST_INSTRUMENTATION=instrumentation_settings(METRICS_TOKEN='')):
+            # Без токена и без METRICS_PUBLIC метрики закрыты для всех
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer ').status_code, status.HTTP_403_FORBIDDEN)
+
+
+class GroupMembershipCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='memberuser', password='testpass')
+        self.other = User.objects.create_user(username='outsider', password='testpass')
+        self.group = Group.objects.create(name='Cached Group', admin=self.user)
+        self.group.members.add(self.user)
+        self.column = ColumnBoard.objects.create(name='todo', group=self.group)
+        self.card = Card.objects.create(title='Card', group=self.group, column=self.column)
+        self.url = reverse('group:card-detail', kwargs={'group_uuid': self.group.group_uuid, 'code': self.card.code})
+
+    def test_group_is_loaded_once_per_request(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        group_queries = [q['sql'] for q in ctx.captured_queries if 'FROM "group"' in q['sql']]
+        self.assertEqual(len(group_queries), 1)
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if 'group_members' in q['sql']])
+
+    def test_membership_changes_invalidate_cache(self):
+        self.client.force_authenticate(user=self.other)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.group.members.add(self.other)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+        self.other.group_memberships.remove(self.group)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.group.members.add(self.other)
+        self.group.members.clear()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_missing_group_is_not_found(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('group:card-detail', kwargs={'group_uuid': 'missing', 'code': '000001'})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CardListPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='listuser', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.group = Group.objects.create(name='List Group', admin=self.user)
+        self.group.members.add(self.user)
+        self.todo = ColumnBoard.objects.create(name='todo', group=self.group)
+        self.done = ColumnBoard.objects.create(name='done', group=self.group)
+        self.tag = CardTag.objects.create(name='bug', group=self.group)
+        self.url = reverse('group:card-list', kwargs={'group_uuid': self.group.group_uuid})
+
+    def add_cards(self, count, **kwargs):
+        cards = []
+        for i in range(count):
+            cards.append(Card.objects.create(title=f'Card {i}', group=self.group, column=self.todo, **kwargs))
+        return cards
+
+    def test_pages_follow_cursor(self):
+        cards = self.add_cards(7)
+        codes, url = [], self.url + '?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['cards']), 3)
+            codes += [card['code'] for card in response.data['cards']]
+            url = response.data['next']
+        self.assertEqual(codes, [card.code for card in cards])
+
+    def test_query_count_does_not_depend_on_group_size(self):
+        self.add_cards(3)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(self.url + '?page_size=2')
+        self.add_cards(30)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(self.url + '?page_size=2')
+        self.assertEqual(len(response.data['cards']), 2)
+        self.assertEqual(len(small), len(large))
+
+    def test_sparse_fields(self):
+        self.add_cards(2)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, {'fields': 'code,title'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['cards'][0]), {'code', 'title'})
+        # Без tags нет и выборки тегов
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if 'card_tags' in q['sql']])
+
+        response = self.client.get(self.url, {'fields': 'code,secret'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filters(self):
+        tagged = self.add_cards(2, assignee=self.user)
+        for card in tagged:
+            card.tags.add(self.tag)
+        Card.objects.create(title='Done', group=self.group, column=self.done)
+
+        def codes(**params):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [card['code'] for card in response.data['cards']]
+
+        self.assertEqual(len(codes(column='done')), 1)
+        self.assertEqual(codes(assignee='listuser'), [card.code for card in tagged])
+        self.assertEqual(codes(tag=self.tag.code), [card.code for card in tagged])
+        self.assertEqual(codes(created_after='2000-01-01T00:00:00Z', created_before='2000-01-02T00:00:00Z'), [])
+        self.assertEqual(len(codes(created_after='2000-01-01T00:00:00Z')), 3)
+        response = self.client.get(self.url, {'created_after': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BoardExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='exportadmin', password='testpass')
+        self.member = User.objects.create_user(username='exportmember', password='testpass')
+        self.group = Group.objects.create(name='Export Group', admin=self.admin)
+        self.group.members.add(self.admin, self.member)
+        self.column = ColumnBoard.objects.create(name='todo', group=self.group)
+        self.tag = CardTag.objects.create(name='bug', group=self.group)
+        user_tag = UserTag.objects.create(name='backend', group=self.group)
+        UserTagRelation.objects.create(user=self.member, tag=user_tag)
+        for i in range(3):
+            card = Card.objects.create(title=f'Card {i}', group=self.group, column=self.column, assignee=self.member)
+            card.tags.add(self.tag)
+        self.url = reverse('group:board-export', kwargs={'group_uuid': self.group.group_uuid})
+        self.client.force_authenticate(user=self.admin)
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_ndjson(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(rows[0]['type'], 'group')
+        self.assertEqual(rows[0]['data']['name'], 'Export Group')
+        by_type = {}
+        for row in rows[1:]:
+            by_type.setdefault(row['type'], []).append(row['data'])
+        self.assertEqual(len(by_type['card']), 3)
+        self.assertEqual(by_type['card'][0]['tags'][0]['name'], 'bug')
+        self.assertEqual(by_type['user_tag_relation'], [{'username': 'exportmember', 'tag_code': '000001'}])
+        self.assertEqual({m['username'] for m in by_type['member']}, {'exportadmin', 'exportmember'})
+
+    def test_json(self):
+        response, body = self.export(**{'as': 'json'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = json.loads(body)
+        self.assertEqual(data['group']['group_uuid'], self.group.group_uuid)
+        self.assertEqual([card['title'] for card in data['cards']], ['Card 0', 'Card 1', 'Card 2'])
+        self.assertEqual(data['columns'][0]['name'], 'todo')
+
+    def test_gzip(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertEqual(len(body.splitlines()), 1 + 2 + 1 + 1 + 1 + 1 + 3)
+
+    def test_query_count_does_not_depend_on_board_size(self):
+        self.export()
+        with CaptureQueriesContext(connection) as small:
+            self.export()
+        for i in range(20):
+            Card.objects.create(title=f'More {i}', group=self.group, column=self.column)
+        with CaptureQueriesContext(connection) as large:
+            self.export()
+        self.assertEqual(len(small), len(large))
+
+    def test_only_admin(self):
+        self.client.force_authenticate(user=self.member)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_unknown_format(self):
+        response = self.client.get(self.url, {'as': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(BOARD_EXPORT={'CHUNK_SIZE': 2, 'BUFFER_SIZE': 1})
+    async def test_asgi_streams_incrementally(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.admin)}'}
+        response = await self.async_client.get(self.url, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_async)
+
+        chunks = aiter(response.streaming_content)
+        first = json.loads(await anext(chunks))
+        self.assertEqual(first['type'], 'group')
+        # Карточки еще не прочитаны: удаленные после первого блока не попадают в выгрузку
+        await Card.objects.filter(group=self.group).adelete()
+        rows = [json.loads(chunk) async for chunk in chunks]
+        self.assertEqual([row for row in rows if row['type'] == 'card'], [])
+        self.assertEqual(len([row for row in rows if row['type'] == 'member']), 2)
+
+
+class CardBulkViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='bulkuser', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.group = Group.objects.create(name='Bulk Group', admin=self.user)
+        self.group.members.add(self.user)
+        self.todo = ColumnBoard.objects.create(name='todo', group=self.group)
+        self.done = ColumnBoard.objects.create(name='done', group=self.group)
+        self.url = reverse('group:card-bulk', kwargs={'group_uuid': self.group.group_uuid})
+
+    def post(self, operations):
+        return self.client.post(self.url, {'operations': operations}, format='json')
+
+    def create_ops(self, count, prefix='Card'):
+        return [
+            {'op': 'create', 'data': {
+                'title': f'{prefix} {i}', 'column': 'todo', 'assignee': 'bulkuser',
+                'tags': [{'name': 'bug', 'color': 'red'}, {'name': f'{prefix}-{i % 3}', 'color': 'blue'}],
+            }}
+            for i in range(count)
+        ]
 
+    def test_create(self):
+        response = self.post(self.create_ops(5))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        codes = [card['code'] for card in response.data['cards']]
+        self.assertEqual(codes, ['000001', '000002', '000003', '000004', '000005'])
+        self.assertEqual(Card.objects.filter(group=self.group).count(), 5)
+        self.assertEqual(CardTag.objects.filter(group=self.group).count(), 4)
+        card = Card.objects.get(group=self.group, code='000002')
+        self.assertEqual({tag.name for tag in card.tags.all()}, {'bug', 'Card-1'})
+        self.assertEqual(card.assignee, self.user)
+
+    def test_create_without_returning_bulk_insert(self):
+        # Как на MySQL: bulk_create не заполняет pk новых карточек
+        features = type(connection.features)
+        with mock.patch.object(features, 'can_return_rows_from_bulk_insert', False):
+            response = self.post(self.create_ops(3))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        cards = response.data['cards']
+        self.assertEqual([card['code'] for card in cards], ['000001', '000002', '000003'])
+        self.assertEqual(cards[1]['title'], 'Card 1')
+        card = Card.objects.get(group=self.group, code='000003')
+        self.assertEqual({tag.name for tag in card.tags.all()}, {'bug', 'Card-2'})
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        self.post(self.create_ops(1, prefix='warm'))
+        with CaptureQueriesContext(connection) as small:
+            self.post(self.create_ops(2, prefix='small'))
+        with CaptureQueriesContext(connection) as large:
+            self.post(self.create_ops(40, prefix='large'))
+        self.assertEqual(len(small), len(large))
+
+    def test_update_and_move(self):
+        self.post(self.create_ops(2))
+        response = self.post([
+            {'op': 'update', 'code': '000001', 'data': {'title': 'Renamed', 'tags': [{'name': 'new', 'color': 'green'}]}},
+            {'op': 'move', 'code': '000002', 'column': 'done'},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        renamed = Card.objects.get(group=self.group, code='000001')
+        self.assertEqual(renamed.title, 'Renamed')
+        self.assertEqual([tag.name for tag in renamed.tags.all()], ['new'])
+        moved = Card.objects.get(group=self.group, code='000002')
+        self.assertEqual(moved.column, self.done)
+        self.assertEqual(moved.tags.count(), 2)
+
+    def test_errors_are_reported_per_item_and_nothing_is_written(self):
+        outsider = User.objects.create_user(username='bulkoutsider', password='testpass')
+        version = Group.objects.get(pk=self.group.pk).change_version
+        response = self.post([
+            {'op': 'create', 'data': {'title': 'Ok', 'column': 'todo'}},
+            {'op': 'create', 'data': {'title': 'Bad column', 'column': 'missing'}},
+            {'op': 'create', 'data': {'title': 'Bad assignee', 'column': 'todo', 'assignee': outsider.username}},
+            {'op': 'move', 'code': '999999', 'column': 'done'},
+            {'op': 'delete', 'code': '000001'},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.data['errors']
+        self.assertIsNone(errors[0])
+        self.assertIn('column', errors[1])
+        self.assertIn('assignee', errors[2])
+        self.assertIn('code', errors[3])
+        self.assertIn('op', errors[4])
+        self.assertFalse(Card.objects.filter(group=self.group).exists())
+        self.assertEqual(Group.objects.get(pk=self.group.pk).change_version, version)
+
+    def test_changes_are_recorded(self):
+        version = Group.objects.get(pk=self.group.pk).change_version
+        self.post(self.create_ops(3))
+        changes = list(BoardChange.objects.filter(group=self.group, version__gt=version).order_by('version'))
+        self.assertEqual([(c.entity, c.op) for c in changes], [('card_tag', 'create')] * 4 + [('card', 'create')] * 3)
+
+
+class CardTagWriteTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='taguser', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.group = Group.objects.create(name='Tag Group', admin=self.user)
+        self.group.members.add(self.user)
+        self.column = ColumnBoard.objects.create(name='todo', group=self.group)
+        self.card = Card.objects.create(title='Card', group=self.group, column=self.column)
+        self.url = reverse('group:card-detail', kwargs={'group_uuid': self.group.group_uuid, 'code': self.card.code})
+        # Счетчик кодов тегов создается один раз на группу
+        CardTag.objects.create(name='seed', color='red', group=self.group)
+
+    def put_tags(self, tags, url=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.put(url or self.url, {'title': 'Card', 'column': 'todo', 'tags': tags}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return ctx.captured_queries
+
+    def tags(self, prefix, count):
+        return [{'name': f'{prefix}{i}', 'color': 'red'} for i in range(count)]
+
+    def test_query_count_does_not_depend_on_tag_count(self):
+        other = Card.objects.create(title='Other', group=self.group, column=self.column)
+        other_url = reverse('group:card-detail', kwargs={'group_uuid': self.group.group_uuid, 'code': other.code})
+        self.client.get(self.url)
+        few = self.put_tags(self.tags('a', 1))
+        many = self.put_tags(self.tags('b', 8), url=other_url)
+        self.assertEqual(len(few), len(many))
+        self.assertEqual({tag.name for tag in other.tags.all()}, {f'b{i}' for i in range(8)})
+
+    def test_unchanged_tags_are_not_rewritten(self):
+        self.put_tags(self.tags('a', 3))
+        queries = self.put_tags(list(reversed(self.tags('a', 3))))
+        writes = [q['sql'] for q in queries if 'card_tags' in q['sql'] and q['sql'].startswith(('DELETE', 'INSERT'))]
+        self.assertEqual(writes, [])
+        self.assertEqual(CardTag.objects.filter(group=self.group).count(), 4)
+
+    def test_diff_keeps_shared_tags(self):
+        self.put_tags(self.tags('a', 2))
+        kept = self.card.tags.get(name='a1')
+        self.put_tags([{'name': 'a1', 'color': 'red'}, {'name': 'c', 'color': 'red'}])
+        self.assertEqual({tag.name for tag in self.card.tags.all()}, {'a1', 'c'})
+        self.assertEqual(self.card.tags.get(name='a1').pk, kept.pk)
+
+    def test_create_with_tags(self):
+        url = reverse('group:card-create', kwargs={'group_uuid': self.group.group_uuid})
+        response = self.client.post(url, {'title': 'New', 'column': 'todo', 'tags': self.tags('n', 2)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        card = Card.objects.get(group=self.group, title='New')
+        self.assertEqual({tag.name for tag in card.tags.all()}, {'n0', 'n1'})
+
+
+class GroupValidationContextTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='validuser', password='testpass')
+        self.outsider = User.objects.create_user(username='validoutsider', password='testpass')
+        self.group = Group.objects.create(name='Validation Group', admin=self.user)
+        self.group.members.add(self.user)
+        ColumnBoard.objects.create(name='todo', group=self.group)
+        ColumnBoard.objects.create(name='done', group=self.group)
+
+    def validate(self, cards):
+        context = {'group': self.group, 'validation': GroupValidationContext(self.group)}
+        serializer = CardSerializer(data=cards, many=True, context=context)
+        with CaptureQueriesContext(connection) as ctx:
+            valid = serializer.is_valid()
+        return valid, serializer, len(ctx.captured_queries)
+
+    def cards(self, count):
+        return [
+            {'title': f'Card {i}', 'column': ('todo', 'done')[i % 2], 'assignee': 'validuser'}
+            for i in range(count)
+        ]
+
+    def test_query_count_does_not_depend_on_card_count(self):
+        valid, _, few = self.validate(self.cards(1))
+        self.assertTrue(valid)
+        valid, serializer, many = self.validate(self.cards(30))
+        self.assertTrue(valid)
+        self.assertEqual(few, many)
+        self.assertEqual(serializer.validated_data[1]['column'].name, 'done')
+
+    def test_errors_match_queryset_validation(self):
+        valid, serializer, _ = self.validate([
+            {'title': 'Bad column', 'column': 'missing'},
+            {'title': 'Outsider', 'column': 'todo', 'assignee': 'validoutsider'},
+        ])
+        self.assertFalse(valid)
+        self.assertIn('column', serializer.errors[0])
+        self.assertIn('Assignee must be a group member.', str(serializer.errors[1]))
+
+
+class GroupSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='searchuser', password='testpass')
+        self.other = User.objects.create_user(username='alexandra', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.group = Group.objects.create(name='Search Group', admin=self.user)
+        self.group.members.add(self.user, self.other)
+        self.column = ColumnBoard.objects.create(name='todo', group=self.group)
+        self.card = Card.objects.create(title='Deploy backend to production', group=self.group, column=self.column)
+        Card.objects.create(title='Write onboarding docs', description='Explain the release process', group=self.group, column=self.column)
+        CardTag.objects.create(name='infrastructure', color='red', group=self.group)
+        self.url = reverse('group:group-search', kwargs={'group_uuid': self.group.group_uuid})
+
+    def search(self, q, **params):
+        response = self.client.get(self.url, {'q': q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_typos_are_tolerated(self):
+        data = self.search('deplyo backnd')
+        self.assertEqual(data['cards'][0]['code'], self.card.code)
+        self.assertEqual(self.search('alexandr')['members'][0]['username'], 'alexandra')
+        self.assertEqual(self.search('infrastucture')['card_tags'][0]['name'], 'infrastructure')
+
+    def test_description_and_code_match(self):
+        self.assertEqual(self.search('release proces')['cards'][0]['title'], 'Write onboarding docs')
+        self.assertEqual(self.search(self.card.code)['cards'][0]['score'], 100)
+
+    def test_corpus_follows_changes_without_rebuild(self):
+        from .search import fuzzy_index
+        self.search('deploy')
+        corpus = fuzzy_index().corpus(self.group)
+        Card.objects.create(title='Migrate database', group=self.group, column=self.column)
+        self.card.delete()
+        self.group.refresh_from_db()
+
+        data = self.search('migrate databse')
+        self.assertEqual(data['cards'][0]['title'], 'Migrate database')
+        self.assertNotIn('Deploy backend to production', [card['title'] for card in self.search('deploy backend')['cards']])
+        self.assertIs(fuzzy_index().corpus(self.group), corpus)
+
+    def test_least_recently_used_group_is_evicted(self):
+        from .search import FuzzySearchIndex
+        index = FuzzySearchIndex(max_groups=1)
+        other_group = Group.objects.create(name='Other', admin=self.user)
+        first = index.corpus(self.group)
+        index.corpus(other_group)
+        self.assertIsNot(index.corpus(self.group), first)
+
+    def test_validation_and_access(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'q': 'x', 'limit': 0}).status_code, status.HTTP_400_BAD_REQUEST)
+        outsider = User.objects.create_user(username='searchoutsider', password='testpass')
+        self.client.force_authenticate(user=outsider)
+        self.assertEqual(self.client.get(self.url, {'q': 'deploy'}).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class CardFullTextSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='ftsuser', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.group = Group.objects.create(name='FTS Group', admin=self.user)
+        self.group.members.add(self.user)
+        self.column = ColumnBoard.objects.create(name='todo', group=self.group)
+        self.url = reverse('group:card-list', kwargs={'group_uuid': self.group.group_uuid})
+
+    def add(self, title, description=''):
+        return Card.objects.create(title=title, description=description, group=self.group, column=self.column)
+
+    def titles(self, search, **params):
+        response = self.client.get(self.url, {'search': search, 'fields': 'title', **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [card['title'] for card in response.data['cards']]
+
+    def test_prefix_terms_and_ranking(self):
+        self.add('Release notes', 'deploy the production build')
+        self.add('Deploy production')
+        self.add('Redeploy staging')
+        self.assertEqual(self.titles('depl prod'), ['Deploy production', 'Release notes'])
+
+    def test_phrase(self):
+        self.add('Fix login', 'broken on mobile devices')
+        self.add('Mobile layout', 'login is broken')
+        self.assertEqual(self.titles('"broken on mobile"'), ['Fix login'])
+
+    def test_pages_follow_rank_cursor(self):
+        for i in range(4):
+            self.add(f'Other {i}', 'mentions search in description')
+        for i in range(3):
+            self.add(f'Search {i}')
+        titles, url = [], self.url + '?search=search&fields=title&page_size=2'
+        while url:
+            response = self.client.get(url)
+            titles += [card['title'] for card in response.data['cards']]
+            url = response.data['next']
+        self.assertEqual(titles, [f'Search {i}' for i in (2, 1, 0)] + [f'Other {i}' for i in (3, 2, 1, 0)])
+
+    def test_combines_with_filters_and_rejects_empty(self):
+        other = ColumnBoard.objects.create(name='done', group=self.group)
+        self.add('Search here')
+        Card.objects.create(title='Search there', group=self.group, column=other)
+        self.assertEqual(self.titles('search', column='done'), ['Search there'])
+        response = self.client.get(self.url, {'search': '"  "'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncReadViewsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.group = Group.objects.create(name='Test Group', admin=self.user)
+        self.group.members.add(self.user)
+        self.column = ColumnBoard.objects.create(name='Column1', color='blue', group=self.group)
+        self.card = Card.objects.create(title='Card', column=self.column, group=self.group, assignee=self.user)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.board_url = reverse('group:group-detail', kwargs={'group_uuid': self.group.group_uuid})
+
+    def test_read_views_are_async(self):
+        self.assertTrue(iscoroutinefunction(GroupDetailView.as_view()))
+        self.assertTrue(iscoroutinefunction(CardListView.as_view()))
+
+    async def test_board_and_etag(self):
+        response = await self.async_client.get(self.board_url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['board']['columns'][0]['tasks'][0]['title'], 'Card')
+
+        headers = dict(self.headers, **{'If-None-Match': response['ETag']})
+        response = await self.async_client.get(self.board_url, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_card_list(self):
+        url = reverse('group:card-list', kwargs={'group_uuid': self.group.group_uuid})
+        response = await self.async_client.get(url, {'fields': 'title,tags'}, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['cards'], [{'title': 'Card', 'tags': []}])
+
+    async def test_permissions_checked_before_handler(self):
+        other_user = await User.objects.acreate(username='otheruser')
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(other_user)}'}
+        response = await self.async_client.get(self.board_url, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = await self.async_client.get(self.board_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_sync_handlers_still_work(self):
+        # put и delete остаются синхронными в той же view
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.put(self.board_url, {'name': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(client.get(self.board_url).data['name'], 'Renamed')
+
+    async def test_profile_in_group(self):
+        url = reverse('user:profile_group', kwargs={'username': 'testuser', 'group_uuid': self.group.group_uuid})
+        response = await self.async_client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['user']['username'], 'testuser')
+        self.assertEqual([card['title'] for card in response.json()['cards']], ['Card'])
+
+        url = reverse('user:profile_group', kwargs={'username': 'nobody', 'group_uuid': self.group.group_uuid})
+        response = await self.async_client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        url = reverse('user:profile_group', kwargs={'username': 'testuser', 'group_uuid': 'nonexistent'})
+        response = await self.async_client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
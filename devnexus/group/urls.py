@@ -1,5 +1,6 @@
 from django.urls import path
 from .views import *
+from .realtime import board_events
 
 
 app_name = 'group'
@@ -7,10 +8,15 @@ app_name = 'group'
 urlpatterns = [
     path('', GroupCreateView.as_view(), name='group-create'),
     path('<str:group_uuid>/', GroupDetailView.as_view(), name='group-detail'),
+    path('<str:group_uuid>/changes/', BoardChangesView.as_view(), name='board-changes'),
+    path('<str:group_uuid>/events/', board_events, name='board-events'),
+    path('<str:group_uuid>/export/', BoardExportView.as_view(), name='board-export'),
+    path('<str:group_uuid>/search/', GroupSearchView.as_view(), name='group-search'),
     path('<str:group_uuid>/add_members/', AddMemberToGroupView.as_view(), name='add-member-to-group'),
 
     path('<str:group_uuid>/cards/create/', CardCreateView.as_view(), name='card-create'),
     path('<str:group_uuid>/cards/all/', CardListView.as_view(), name='card-list'),
+    path('<str:group_uuid>/cards/bulk/', CardBulkView.as_view(), name='card-bulk'),
     path('<str:group_uuid>/cards/<str:code>/', CardDetailView.as_view(), name='card-detail'),
 
     path('<str:group_uuid>/usertags/create/', UserTagCreateView.as_view(), name='usertags-create'),
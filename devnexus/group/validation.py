@@ -0,0 +1,32 @@
+from django.utils.functional import cached_property
+from .models import CardTag, ColumnBoard
+
+
+class GroupValidationContext:
+    """
+    Участники, колонки и теги карточек группы, загруженные один раз на запрос.
+    Сериализаторы проверяют данные по этим словарям, поэтому проверка N карточек
+    стоит O(1) запросов. Каждый словарь загружается при первом обращении.
+    """
+
+    def __init__(self, group):
+        self.group = group
+
+    @cached_property
+    def members(self):
+        """username -> User"""
+        return {user.username: user for user in self.group.members.all()}
+
+    @cached_property
+    def member_ids(self):
+        return {user.pk for user in self.members.values()}
+
+    @cached_property
+    def columns(self):
+        """name -> ColumnBoard"""
+        return {column.name: column for column in ColumnBoard.objects.filter(group=self.group)}
+
+    @cached_property
+    def card_tags(self):
+        """(name, color) -> CardTag"""
+        return {(tag.name, tag.color): tag for tag in CardTag.objects.filter(group=self.group)}
@@ -1,4 +1,11 @@
-from django.http import Http404
+import hashlib
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.views.decorators.gzip import gzip_page
 from rest_framework import generics, permissions
 from rest_framework.response import Response
 from rest_framework import status
@@ -7,10 +14,20 @@ from rest_framework.exceptions import NotFound, ValidationError
 from .models import Group, Card, UserTag, UserTagRelation, CardTag, ColumnBoard
 from user.models import User
 from .serializers import *
-from .permissions import IsGroupMember
+from .permissions import IsGroupAdmin, IsGroupMember, resolve_group
+from .pagination import CardCursorPagination, CardSearchPagination
+from .validation import GroupValidationContext
+from .board import abuild_board, build_board
+from .cache import SnapshotResponse, snapshot_cache
+from .bulk import MAX_OPERATIONS, BulkCardOperations
+from .changes import changes_since
+from .export import EXPORT_FORMATS, export_board
+from .search import fuzzy_index
+from .search_backends import InvalidSearchQuery, card_search_backend
+from .broker import change_message
+from devnexus.async_views import AsyncAPIViewMixin, async_condition
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from collections import defaultdict
 
 error_schema = openapi.Schema(
     type=openapi.TYPE_OBJECT,
@@ -33,6 +50,37 @@ not_found_schema = openapi.Schema(
     }
 )
 
+
+# ETag строится из версии группы (см. cache.py), ответ при этом не сериализуется
+def board_etag(request, group_uuid, *args, **kwargs):
+    return f"board-{snapshot_cache().version(group_uuid)}"
+
+
+def card_list_etag(request, group_uuid, *args, **kwargs):
+    # Страница, фильтры и набор полей задаются параметрами запроса
+    query = hashlib.md5(request.META.get('QUERY_STRING', '').encode()).hexdigest()
+    return f"cards-{snapshot_cache().version(group_uuid)}-{query}"
+
+class GroupScopedMixin:
+    """Группа из URL, найденная один раз за запрос (ее же проверяет IsGroupMember)"""
+
+    def get_group(self):
+        return resolve_group(self)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['group'] = self.get_group()
+        context['validation'] = GroupValidationContext(context['group'])
+        return context
+
+
+class GroupObjectMixin(GroupScopedMixin):
+    def get_object(self):
+        group = self.get_group()
+        self.check_object_permissions(self.request, group)
+        return group
+
+
 class GroupCreateView(generics.CreateAPIView):
     queryset = Group.objects.all()
     permission_classes = [permissions.IsAuthenticated] 
@@ -55,7 +103,9 @@ class GroupCreateView(generics.CreateAPIView):
             status=status.HTTP_201_CREATED)
 
 
-class GroupDetailView(mixins.RetrieveModelMixin,
+class GroupDetailView(AsyncAPIViewMixin,
+                      GroupObjectMixin,
+                      mixins.RetrieveModelMixin,
                       mixins.UpdateModelMixin,
                       mixins.DestroyModelMixin,
                       generics.GenericAPIView):
@@ -108,52 +158,12 @@ class GroupDetailView(mixins.RetrieveModelMixin,
             404: openapi.Response("Группа не найдена")
         }
     )
-    def get(self, request, *args, **kwargs):
+    @async_condition(board_etag)
+    async def get(self, request, *args, **kwargs):
+        # Группа уже загружена проверкой прав, запросы доски идут через async ORM
         group = self.get_object()
-        serializer = self.get_serializer(group)
-
-        user_tags = UserTagRelation.objects.filter(
-            tag__group_id=group.group_uuid
-        ).select_related('user', 'tag')
-
-        user_tags_mapping = defaultdict(list)
-        for ut in user_tags:
-            user_tags_mapping[ut.user.username].append({
-                'code': ut.tag.code,
-                'name': ut.tag.name,
-                'color': ut.tag.color
-            })
-
-        # print(user_tags_mapping)
-        response_data = serializer.data
-
-        for member in response_data['members']:
-            member['tags'] = user_tags_mapping.get(member['username'], [])
-
-        columns_queryset = ColumnBoard.objects.filter(group=group)
-        columns_serializer = ColumnBoardSerializer(columns_queryset, many=True)
-        columns_data = columns_serializer.data
-
-        cards = Card.objects.filter(group=group).prefetch_related('tags')
-        cards_serializer = CardSerializer(cards, many=True)
-        cards_data = cards_serializer.data
-
-        grouped_columns = []
-        for column in columns_data: 
-            column_cards = [
-                card for card in cards_data 
-                if card['column'] == column['name'] 
-            ]
-            grouped_columns.append({
-                'name': column['name'],
-                'color': column['color'],
-                'code': column['id'],
-                'tasks': column_cards
-            })
-
-        response_data['board'] = {'columns': grouped_columns}
-
-        return Response(response_data)
+        content = await snapshot_cache().aget_or_build(group.group_uuid, lambda: abuild_board(group))
+        return SnapshotResponse(content)
 
     @swagger_auto_schema(
         operation_summary="Обновление информации о группе")
@@ -167,7 +177,104 @@ class GroupDetailView(mixins.RetrieveModelMixin,
         serializer.save()
 
 
-class AddMemberToGroupView(mixins.UpdateModelMixin,
+class BoardChangesView(GroupObjectMixin, generics.GenericAPIView):
+    queryset = Group.objects.all()
+    permission_classes = [IsGroupMember]
+    lookup_field = 'group_uuid'
+
+    @swagger_auto_schema(
+        operation_summary="Изменения доски после версии N",
+        operation_description="""
+        Возвращает операции журнала изменений группы с версией больше since.
+        Если часть операций уже удалена из журнала, возвращается полный снимок доски (full=true).
+        """,
+        manual_parameters=[
+            openapi.Parameter('since', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=True)
+        ])
+    def get(self, request, *args, **kwargs):
+        try:
+            since = int(request.query_params.get('since', ''))
+        except ValueError:
+            raise ValidationError({"since": "Укажите номер версии."})
+        if since < 0:
+            raise ValidationError({"since": "Номер версии не может быть отрицательным."})
+
+        group = self.get_object()
+        version, changes = changes_since(group, since)
+        if changes is None:
+            return Response({'version': version, 'full': True, 'snapshot': build_board(group)})
+
+        return Response({
+            'version': version,
+            'full': False,
+            'changes': [change_message(change) for change in changes],
+        })
+
+
+class BoardExportView(GroupObjectMixin, generics.GenericAPIView):
+    queryset = Group.objects.all()
+    permission_classes = [IsGroupMember, IsGroupAdmin]
+
+    def perform_content_negotiation(self, request, force=False):
+        # Ответ не рендерится DRF, Accept: application/x-ndjson не должен давать 406
+        return super().perform_content_negotiation(request, force=True)
+
+    @swagger_auto_schema(
+        operation_summary="Выгрузка доски группы",
+        operation_description="""
+        Потоково отдает участников, колонки, теги, связи тегов и карточки группы.
+        as=ndjson (по умолчанию) - объект {"type", "data"} на строку, as=json - один JSON-объект.
+        При Accept-Encoding: gzip ответ сжимается на лету. Доступно только администратору группы.
+        """,
+        manual_parameters=[
+            openapi.Parameter('as', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(EXPORT_FORMATS))
+        ])
+    @method_decorator(gzip_page)
+    def get(self, request, *args, **kwargs):
+        # ?format= занят DRF под выбор рендерера
+        export_format = request.query_params.get('as', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({"as": f"Поддерживаются форматы: {', '.join(EXPORT_FORMATS)}."})
+
+        group = self.get_object()
+        content = export_board(group, export_format, asynchronous=isinstance(request._request, ASGIRequest))
+        response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="board-{group.group_uuid}.{export_format}"'
+        return response
+
+
+class GroupSearchView(GroupScopedMixin, generics.GenericAPIView):
+    permission_classes = [IsGroupMember]
+
+    @swagger_auto_schema(
+        operation_summary="Нечеткий поиск по группе",
+        operation_description="""
+        Ищет по строке q карточки (название, описание, код), участников (username)
+        и теги группы с учетом опечаток. Результаты в каждом разделе отсортированы по score (0-100).
+        """,
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        ])
+    def get(self, request, *args, **kwargs):
+        config = settings.BOARD_SEARCH
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({"q": "Укажите строку поиска."})
+        if len(query) > config['MAX_QUERY_LENGTH']:
+            raise ValidationError({"q": f"Не длиннее {config['MAX_QUERY_LENGTH']} символов."})
+        try:
+            limit = int(request.query_params.get('limit', config['LIMIT']))
+        except ValueError:
+            raise ValidationError({"limit": "Ожидается целое число."})
+        if not 1 <= limit <= config['MAX_LIMIT']:
+            raise ValidationError({"limit": f"Допустимо от 1 до {config['MAX_LIMIT']}."})
+
+        return Response(fuzzy_index().search(self.get_group(), query, limit))
+
+
+class AddMemberToGroupView(GroupObjectMixin,
+                           mixins.UpdateModelMixin,
                            generics.GenericAPIView):
     queryset = Group.objects.all()
     serializer_class = AddMemberToGroupSerializer
@@ -195,24 +302,14 @@ operation_description="Добавляет пользователя в групп
             raise ValidationError({"username": "User is already a member of the group"})
 
         group.members.add(user)
-        group.save()
 
         return Response({"success": "User successfully added to the group"}, status=status.HTTP_200_OK)
     
 
-class CardCreateView(generics.CreateAPIView):
+class CardCreateView(GroupScopedMixin, generics.CreateAPIView):
     serializer_class = CardSerializer
     permission_classes = [IsGroupMember]
 
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        group_uuid = self.kwargs['group_uuid']
-        try:
-            context['group'] = Group.objects.get(group_uuid=group_uuid)
-        except Group.DoesNotExist:
-            raise Http404("Group not found")
-        return context
-
 
     @swagger_auto_schema(
         operation_summary="Создание карточки",
@@ -221,21 +318,125 @@ class CardCreateView(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
-#тут проблемы
-class CardListView(generics.GenericAPIView):
-    def get_queryset(self):
-        group_uuid = self.kwargs['group_uuid']
-        return Card.objects.filter(group__group_uuid=group_uuid)\
-            .select_related('column', 'group')\
-            .prefetch_related('tags')
+class CardListView(AsyncAPIViewMixin, GroupScopedMixin, generics.GenericAPIView):
+    serializer_class = CardSerializer
+    permission_classes = [IsGroupMember]
+    pagination_class = CardCursorPagination
+
+    def get_fields(self):
+        fields = self.request.query_params.get('fields')
+        if not fields:
+            return None
+        fields = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = set(fields) - set(CardSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError({"fields": f"Неизвестные поля: {', '.join(sorted(unknown))}."})
+        return fields
+
+    @property
+    def paginator(self):
+        # С ?search= карточки идут по рангу, а не по дате создания
+        if not hasattr(self, '_paginator'):
+            self._paginator = CardSearchPagination() if self.request.query_params.get('search') else CardCursorPagination()
+        return self._paginator
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({'cards': serializer.data})
+    def get_queryset(self):
+        queryset = Card.objects.filter(group=self.get_group())
+        params = self.request.query_params
+
+        if params.get('column'):
+            queryset = queryset.filter(column__name=params['column'])
+        if params.get('assignee'):
+            queryset = queryset.filter(assignee__username=params['assignee'])
+        if params.get('tag'):
+            queryset = queryset.filter(tags__code=params['tag'])
+        for param, lookup in (('created_after', 'created_at__gte'), ('created_before', 'created_at__lt')):
+            if params.get(param):
+                value = parse_datetime(params[param])
+                if value is None:
+                    raise ValidationError({param: "Ожидается дата и время в формате ISO 8601."})
+                queryset = queryset.filter(**{lookup: value})
+        if params.get('search'):
+            try:
+                queryset = card_search_backend().search(queryset, params['search'])
+            except InvalidSearchQuery as error:
+                raise ValidationError({"search": str(error)})
+
+        # Связанные данные подгружаем, только если их поля попадут в ответ
+        fields = self.get_fields() or CardSerializer.Meta.fields
+        related = [name for name in ('column', 'assignee') if name in fields]
+        if related:
+            queryset = queryset.select_related(*related)
+        if 'tags' in fields:
+            queryset = queryset.prefetch_related('tags')
+        return queryset
 
+    @swagger_auto_schema(
+        operation_summary="Получение списка карточек группы",
+        operation_description="""
+        Карточки группы постранично (cursor из ссылок next/previous).
+        Фильтры: column (имя колонки), assignee (username), tag (код тега),
+        created_after / created_before (ISO 8601). fields - список полей через запятую.
+        search - полнотекстовый поиск по названию и описанию: слова ищутся по префиксу,
+        строка в кавычках - как фраза; результаты отсортированы по релевантности.
+        """,
+        manual_parameters=[
+            openapi.Parameter('search', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+            openapi.Parameter('fields', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter('column', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter('assignee', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter('tag', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter('created_after', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME),
+            openapi.Parameter('created_before', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME),
+        ])
+    @async_condition(card_list_etag)
+    async def get(self, request, *args, **kwargs):
+        # Пагинация DRF синхронная: страница выбирается в потоке, сериализация уже загруженных карточек - здесь
+        page = await sync_to_async(self.paginate_queryset)(self.get_queryset())
+        serializer = self.get_serializer(page, many=True, fields=self.get_fields())
+        return self.get_paginated_response(serializer.data)
+
+
+class CardBulkView(GroupScopedMixin, generics.GenericAPIView):
+    permission_classes = [IsGroupMember]
 
-class CardDetailView(mixins.RetrieveModelMixin,
+    @swagger_auto_schema(
+        operation_summary="Пакетное создание, изменение и перемещение карточек",
+        operation_description="""
+        operations - список операций:
+        {"op": "create", "data": {...поля карточки}},
+        {"op": "update", "code": "000001", "data": {...изменяемые поля}},
+        {"op": "move", "code": "000001", "column": "done"}.
+        Операции применяются в одной транзакции: при ошибке хотя бы в одной
+        ничего не сохраняется, а errors содержит ошибки по позициям (null для корректных).
+        """,
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['operations'],
+            properties={
+                'operations': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT))
+            }
+        ))
+    def post(self, request, *args, **kwargs):
+        operations = request.data.get('operations') if isinstance(request.data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            raise ValidationError({"operations": "Передайте непустой список операций."})
+        if len(operations) > MAX_OPERATIONS:
+            raise ValidationError({"operations": f"Не больше {MAX_OPERATIONS} операций за запрос."})
+
+        bulk = BulkCardOperations(self.get_group(), operations)
+        errors = bulk.validate()
+        if errors is not None:
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        cards = bulk.save()
+        return Response({"cards": CardSerializer(cards, many=True).data}, status=status.HTTP_200_OK)
+
+
+class CardDetailView(GroupScopedMixin,
+                     mixins.RetrieveModelMixin,
                      mixins.UpdateModelMixin,
                      mixins.DestroyModelMixin,
                      generics.GenericAPIView):
@@ -244,17 +445,8 @@ class CardDetailView(mixins.RetrieveModelMixin,
     permission_classes = [IsGroupMember]  # Включено для продакшена
 
     def get_queryset(self):
-        group_uuid = self.kwargs['group_uuid']
-        return Card.objects.filter(group__group_uuid=group_uuid)
-
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        group_uuid = self.kwargs.get('group_uuid')
-        try:
-            context['group'] = Group.objects.get(group_uuid=group_uuid)
-        except Group.DoesNotExist:
-            raise Http404("Group not found")
-        return context
+        # Колонка, исполнитель и теги нужны и в ответе, и в записи журнала (signals.card_payload)
+        return Card.objects.filter(group=self.get_group()).select_related('column', 'assignee').prefetch_related('tags')
 
     @swagger_auto_schema(operation_summary="Получение информации о карточке")
     def get(self, request, *args, **kwargs):
@@ -268,7 +460,8 @@ class CardDetailView(mixins.RetrieveModelMixin,
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
 
-class UserTagDetailView(mixins.RetrieveModelMixin,
+class UserTagDetailView(GroupScopedMixin,
+                        mixins.RetrieveModelMixin,
                         mixins.UpdateModelMixin,
                         mixins.DestroyModelMixin,
                         generics.GenericAPIView):
@@ -280,15 +473,6 @@ class UserTagDetailView(mixins.RetrieveModelMixin,
         group_uuid = self.kwargs['group_uuid']
         return UserTag.objects.filter(group__group_uuid=group_uuid)
 
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        group_uuid = self.kwargs.get('group_uuid')
-        try:
-            context['group'] = Group.objects.get(group_uuid=group_uuid)
-        except Group.DoesNotExist:
-            raise Http404("Group not found")
-        return context
-
     @swagger_auto_schema(operation_summary="Получение информации о теге для пользователей")
     def get(self, request, *args, **kwargs):
         return self.retrieve(request, *args, **kwargs)
@@ -430,6 +614,8 @@ class UserTagRelationCreateView(generics.CreateAPIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+        # UserTagRelationSerializer.validate берет группу из view
+        self.group = group
         serializer = self.get_serializer(data=request.data)
         serializer.context['group'] = group
         serializer.is_valid(raise_exception=True)
@@ -537,7 +723,8 @@ class GroupCardTagListView(generics.GenericAPIView):
         return Response(serializer.data)
 
 
-class GroupCardTagDetailView(mixins.RetrieveModelMixin,
+class GroupCardTagDetailView(GroupScopedMixin,
+                             mixins.RetrieveModelMixin,
                              mixins.UpdateModelMixin,
                              mixins.DestroyModelMixin,
                              generics.GenericAPIView):
@@ -546,17 +733,7 @@ class GroupCardTagDetailView(mixins.RetrieveModelMixin,
     permission_classes = [IsGroupMember]  # Включено для продакшена
 
     def get_queryset(self):
-        group_uuid = self.kwargs['group_uuid']
-        return CardTag.objects.filter(group__group_uuid=group_uuid)
-
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        group_uuid = self.kwargs.get('group_uuid')
-        try:
-            context['group'] = Group.objects.get(group_uuid=group_uuid)
-        except Group.DoesNotExist:
-            raise Http404("Group not found")
-        return context
+        return CardTag.objects.filter(group=self.get_group())
 
     @swagger_auto_schema(operation_summary="Получение информации о теге карточек")
     def get(self, request, *args, **kwargs):
@@ -601,7 +778,8 @@ class ColumnBoardCreateView(generics.CreateAPIView):
         serializer.save(group=group)
 
 
-class ColumnBoardDetailView(mixins.RetrieveModelMixin,
+class ColumnBoardDetailView(GroupScopedMixin,
+                            mixins.RetrieveModelMixin,
                             mixins.UpdateModelMixin,
                             mixins.DestroyModelMixin,
                             generics.GenericAPIView):
@@ -610,17 +788,7 @@ class ColumnBoardDetailView(mixins.RetrieveModelMixin,
     permission_classes = [IsGroupMember]  # Включено для продакшена
 
     def get_queryset(self):
-        group_uuid = self.kwargs['group_uuid']
-        return ColumnBoard.objects.filter(group__group_uuid=group_uuid)
-
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        group_uuid = self.kwargs.get('group_uuid')
-        try:
-            context['group'] = Group.objects.get(group_uuid=group_uuid)
-        except Group.DoesNotExist:
-            raise Http404("Group not found")
-        return context
+        return ColumnBoard.objects.filter(group=self.get_group())
 
     @swagger_auto_schema(operation_summary="Получение информации о колонке")
     def get(self, request, *args, **kwargs):
@@ -0,0 +1,43 @@
+import os
+from decouple import config
+
+
+# Настройки gunicorn (читаются из текущей папки при запуске gunicorn).
+# SERVER_MODE=asgi - воркеры uvicorn поверх devnexus/asgi.py: async-view
+# (доска, список карточек, профиль по группе) не держат воркер, пока ждут БД,
+# работают WebSocket и события доски. SERVER_MODE=wsgi - прежние синхронные воркеры.
+
+SERVER_MODE = config('SERVER_MODE', default='asgi')
+
+bind = config('BIND', default='0.0.0.0:8000')
+# По умолчанию один воркер: кэши, снимки доски и рассылка событий без общих
+# бэкендов живут в памяти процесса (devnexus/workers.py). WEB_CONCURRENCY > 1
+# запускается, только когда они заменены общими, иначе gunicorn не стартует
+workers = config('WEB_CONCURRENCY', default=1, cast=int)
+timeout = config('GUNICORN_TIMEOUT', default=30, cast=int)
+# Для WebSocket и потоков событий: соединения закрываются при перезапуске не дольше этого
+graceful_timeout = config('GUNICORN_GRACEFUL_TIMEOUT', default=30, cast=int)
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'devnexus.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+elif SERVER_MODE == 'wsgi':
+    wsgi_app = 'devnexus.wsgi:application'
+    threads = config('GUNICORN_THREADS', default=1, cast=int)
+else:
+    raise ValueError(f"SERVER_MODE должен быть asgi или wsgi, а не {SERVER_MODE!r}")
+
+
+def on_starting(server):
+    # Число воркеров могли задать и флагом -w, поэтому проверяется итоговое значение
+    if server.cfg.workers <= 1:
+        return
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'devnexus.settings')
+    from devnexus.workers import process_local_backends
+
+    local = process_local_backends()
+    if local:
+        raise RuntimeError(
+            f"{server.cfg.workers} воркеров gunicorn, но {', '.join(local)} хранят состояние в памяти процесса. "
+            f"Настройте общие бэкенды или запустите один воркер (WEB_CONCURRENCY=1)."
+        )
@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .models import User
+
+
+# JWT-аутентификация без загрузки пользователя на каждый запрос.
+# Из БД (через кэш на TOKEN_USER_CACHE['TIMEOUT'] секунд) берутся только username,
+# is_active и token_version; request.user - LazyTokenUser, который загружает
+# полную строку User, только когда view обращается к другим полям.
+# Токен с token_version меньше текущего отклоняется: смена пароля увеличивает
+# версию и тем самым отзывает все выданные токены (refresh копирует claim в access).
+
+TOKEN_VERSION_CLAIM = 'token_version'
+
+
+def _cache():
+    return caches[settings.TOKEN_USER_CACHE['CACHE_ALIAS']]
+
+
+def token_user_key(user_pk):
+    return f'token-user:{user_pk}'
+
+
+def token_user_state(user_pk):
+    """(username, is_active, token_version) пользователя или None, если его нет"""
+    key = token_user_key(user_pk)
+    state = _cache().get(key)
+    if state is None:
+        state = User.objects.filter(pk=user_pk).values_list('username', 'is_active', 'token_version').first()
+        if state is None:
+            return None
+        _cache().set(key, state, settings.TOKEN_USER_CACHE['TIMEOUT'])
+    return state
+
+
+def invalidate_token_user(user_pk):
+    key = token_user_key(user_pk)
+    _cache().delete(key)
+    if connection.in_atomic_block:
+        # Иначе до коммита в кэш может попасть старая версия
+        transaction.on_commit(lambda: _cache().delete(key))
+
+
+class LazyTokenUser(SimpleLazyObject):
+    """
+    Пользователь из токена: pk, username и проверки is_authenticated/isinstance
+    не обращаются к БД, все остальное загружает и проксирует настоящий User.
+    """
+
+    _meta = User._meta
+
+    def __init__(self, pk, username):
+        super().__init__(lambda: User.objects.get(pk=pk))
+        self.__dict__['_pk'] = pk
+        self.__dict__['_username'] = username
+
+    @property
+    def __class__(self):
+        return User
+
+    @property
+    def pk(self):
+        return self.__dict__['_pk']
+
+    id = pk
+
+    @property
+    def username(self):
+        if self._wrapped is not empty:
+            return self._wrapped.username
+        return self.__dict__['_username']
+
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+
+    def __getattr__(self, name):
+        if self._wrapped is empty and name in related_accessors():
+            # Менеджерам связей (group_memberships и т.п.) достаточно pk
+            return getattr(User(pk=self.pk), name)
+        return super().__getattr__(name)
+
+    def __eq__(self, other):
+        # isinstance(LazyTokenUser, User) истинно благодаря __class__
+        if isinstance(other, User):
+            return self.pk == other.pk
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+_related_accessors = None
+
+
+def related_accessors():
+    global _related_accessors
+    if _related_accessors is None:
+        _related_accessors = frozenset(
+            [relation.get_accessor_name() for relation in User._meta.related_objects]
+            + [field.name for field in User._meta.many_to_many]
+        )
+    return _related_accessors
+
+
+class TokenVersionJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_pk = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        state = token_user_state(user_pk)
+        if state is None:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        username, is_active, token_version = state
+        if not is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        # Токены, выданные до появления claim, считаются версией 0
+        if validated_token.get(TOKEN_VERSION_CLAIM, 0) != token_version:
+            raise AuthenticationFailed("Токен отозван.", code="token_revoked")
+        return LazyTokenUser(user_pk, username)
+
+
+class TokenVersionObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[TOKEN_VERSION_CLAIM] = user.token_version
+        return token
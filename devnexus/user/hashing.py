@@ -0,0 +1,138 @@
+import base64
+import hashlib
+import multiprocessing
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.encoding import force_bytes
+
+
+# Хэширование паролей в отдельном пуле процессов (PASSWORD_HASHING).
+# PBKDF2 занимает процессор на сотни миллисекунд; пул ограничивает число
+# одновременных вычислений числом WORKERS, а очередь - QUEUE_SIZE задачами.
+# Хэшер подключается в PASSWORD_HASHERS, поэтому через пул идут все пути:
+# authenticate(), set_password(), create_user() и check_password().
+# Обычно при заполненной очереди вызов ждет свободного места. Во view входа
+# и регистрации (reject_when_busy) вызов сразу падает с PasswordHashingBusy,
+# а view отвечает 429, вместо того чтобы ждать вместе со всеми остальными.
+
+_reject_when_busy = ContextVar('reject_when_busy', default=False)
+
+
+class PasswordHashingBusy(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Очередь хэширования паролей заполнена.")
+        self.retry_after = retry_after
+
+
+@contextmanager
+def reject_when_busy():
+    token = _reject_when_busy.set(True)
+    try:
+        yield
+    finally:
+        _reject_when_busy.reset(token)
+
+
+class HashingPool:
+    def __init__(self, workers, queue_size, start_method='forkserver', retry_after=1):
+        # workers=0 - вычисление в вызывающем потоке, без пула
+        self.workers = workers
+        self.start_method = start_method
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(workers + queue_size) if workers else None
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                )
+            return self._executor
+
+    def reset(self, executor):
+        # Процесс пула упал: следующий вызов создаст новый пул
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def pbkdf2(self, digest, password, salt, iterations):
+        args = (digest, force_bytes(password), force_bytes(salt), iterations)
+        if self._slots is None:
+            return hashlib.pbkdf2_hmac(*args)
+        if not self._slots.acquire(blocking=not _reject_when_busy.get()):
+            raise PasswordHashingBusy(self.retry_after)
+        try:
+            for attempt in range(2):
+                executor = self.executor()
+                try:
+                    return executor.submit(hashlib.pbkdf2_hmac, *args).result()
+                except BrokenProcessPool:
+                    self.reset(executor)
+                    if attempt:
+                        raise
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+_hashing_pool = None
+_hashing_pool_lock = threading.Lock()
+
+
+def hashing_pool():
+    global _hashing_pool
+    with _hashing_pool_lock:
+        if _hashing_pool is None:
+            config = settings.PASSWORD_HASHING
+            _hashing_pool = HashingPool(
+                workers=config['WORKERS'],
+                queue_size=config['QUEUE_SIZE'],
+                start_method=config['START_METHOD'],
+                retry_after=config['RETRY_AFTER'],
+            )
+        return _hashing_pool
+
+
+@receiver(setting_changed)
+def reset_hashing_pool(setting, **kwargs):
+    global _hashing_pool
+    if setting == 'PASSWORD_HASHING':
+        with _hashing_pool_lock:
+            pool, _hashing_pool = _hashing_pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    pbkdf2_sha256 с числом итераций из PASSWORD_HASHING['ITERATIONS'],
+    вычисляемый в HashingPool. Формат хэша тот же, что у PBKDF2PasswordHasher:
+    старые хэши проверяются, а при другом числе итераций пересчитываются при входе.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASHING['ITERATIONS']
+
+    def encode(self, password, salt, iterations=None):
+        self._check_encode_args(password, salt)
+        iterations = iterations or self.iterations
+        hash = hashing_pool().pbkdf2(self.digest().name, password, salt, iterations)
+        hash = base64.b64encode(hash).decode("ascii").strip()
+        return "%s$%d$%s$%s" % (self.algorithm, iterations, salt, hash)
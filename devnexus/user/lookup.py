@@ -0,0 +1,164 @@
+import bisect
+import threading
+import time
+import shortuuid
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+from .models import User
+
+
+# Индекс имен пользователей для автодополнения (/users/lookup/?prefix=).
+# Имена лежат в памяти процесса, отсортированные по username.casefold():
+# поиск по префиксу - bisect и проход по соседним элементам, таблица user не читается.
+# Индекс строится при первом запросе. Новых пользователей из этого процесса
+# добавляют сигналы (signals.py), из других процессов - дочитывание по pk
+# больше последнего увиденного. Переименования и удаления сигналы применяют
+# к индексу своего процесса и меняют версию в общем кэше (CACHE_ALIAS): индекс
+# с другой версией, как и старше REBUILD_INTERVAL секунд, перестраивается
+# в фоновом потоке, а запросы тем временем читают прежний.
+
+VERSION_KEY = 'user-lookup:version'
+
+
+class UsernameIndex:
+    def __init__(self, rebuild_interval=600, cache_alias='default'):
+        self.rebuild_interval = rebuild_interval
+        self.cache_alias = cache_alias
+        self._lock = threading.Lock()
+        # Индекс строит один поток за раз
+        self._build_lock = threading.Lock()
+        self._builder = None
+        self._keys = []
+        self._usernames = []
+        self._max_pk = None
+        self._version = None
+        self._built_at = 0
+
+    def _cache(self):
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def key(username):
+        key = username.casefold()
+        # Для имен в нижнем регистре ключ и имя - одна строка
+        return username if key == username else key
+
+    def _position(self, key, username):
+        lo = bisect.bisect_left(self._keys, key)
+        hi = bisect.bisect_right(self._keys, key, lo)
+        return bisect.bisect_left(self._usernames, username, lo, hi)
+
+    def add(self, username):
+        key = self.key(username)
+        with self._lock:
+            position = self._position(key, username)
+            if position < len(self._usernames) and self._usernames[position] == username:
+                return
+            self._keys.insert(position, key)
+            self._usernames.insert(position, username)
+
+    def remove(self, username):
+        with self._lock:
+            position = self._position(self.key(username), username)
+            if position < len(self._usernames) and self._usernames[position] == username:
+                del self._keys[position]
+                del self._usernames[position]
+
+    def changed(self, removed=(), added=()):
+        """Переименование или удаление: правит индекс этого процесса, остальным меняет версию"""
+        seen = self._cache().get(VERSION_KEY)
+        version = shortuuid.uuid()
+        self._cache().set(VERSION_KEY, version, None)
+        for username in removed:
+            self.remove(username)
+        for username in added:
+            self.add(username)
+        with self._lock:
+            if self._version == seen:
+                # Чужих изменений индекс не пропускал, свое применено выше
+                self._version = version
+
+    def lookup(self, prefix, limit):
+        self.refresh()
+        prefix = prefix.casefold()
+        with self._lock:
+            start = bisect.bisect_left(self._keys, prefix)
+            result = []
+            for position in range(start, min(start + limit, len(self._keys))):
+                if not self._keys[position].startswith(prefix):
+                    break
+                result.append(self._usernames[position])
+        return result
+
+    def refresh(self):
+        if self._max_pk is None:
+            # Отдавать пока нечего: первый запрос строит индекс сам, остальные ждут его
+            with self._build_lock:
+                if self._max_pk is None:
+                    self.rebuild()
+            return
+        if self.is_stale():
+            self.rebuild_in_background()
+        # Пользователи, созданные после последнего чтения (pk-индекс, обычно пустой результат)
+        for pk, username in User.objects.filter(pk__gt=self._max_pk).order_by('pk').values_list('pk', 'username'):
+            self.add(username)
+            self._max_pk = pk
+
+    def is_stale(self):
+        if time.monotonic() - self._built_at > self.rebuild_interval:
+            return True
+        return self._cache().get(VERSION_KEY) != self._version
+
+    def rebuild_in_background(self):
+        if not self._build_lock.acquire(blocking=False):
+            return
+
+        def build():
+            try:
+                self.rebuild()
+            finally:
+                self._build_lock.release()
+                connections.close_all()
+
+        self._builder = threading.Thread(target=build, name='username-index', daemon=True)
+        self._builder.start()
+
+    def rebuild(self):
+        # Версия читается до выборки: изменения во время построения вызовут следующее
+        version = self._cache().get(VERSION_KEY)
+        rows = User.objects.values_list('pk', 'username').order_by()
+        max_pk = 0
+        entries = []
+        for pk, username in rows.iterator(chunk_size=10000):
+            entries.append((self.key(username), username))
+            max_pk = max(max_pk, pk)
+        entries.sort()
+        with self._lock:
+            self._keys = [key for key, _ in entries]
+            self._usernames = [username for _, username in entries]
+            self._max_pk = max_pk
+            self._version = version
+            self._built_at = time.monotonic()
+
+
+_username_index = None
+
+
+def username_index():
+    global _username_index
+    if _username_index is None:
+        _username_index = UsernameIndex(
+            rebuild_interval=settings.USER_LOOKUP['REBUILD_INTERVAL'],
+            cache_alias=settings.USER_LOOKUP['CACHE_ALIAS'],
+        )
+    return _username_index
+
+
+@receiver(setting_changed)
+def reset_username_index(setting, **kwargs):
+    global _username_index
+    if setting == 'USER_LOOKUP':
+        _username_index = None
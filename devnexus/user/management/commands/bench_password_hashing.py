@@ -0,0 +1,65 @@
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from user.hashing import HashingPool, PasswordHashingBusy, reject_when_busy
+
+
+class Command(BaseCommand):
+    help = "Замеряет проверки паролей (входы) в секунду через пул хэширования, всего и на ядро"
+
+    def add_arguments(self, parser):
+        config = settings.PASSWORD_HASHING
+        parser.add_argument('--seconds', type=float, default=5.0, help="Длительность замера")
+        parser.add_argument('--iterations', type=int, default=config['ITERATIONS'])
+        parser.add_argument('--workers', type=int, default=config['WORKERS'], help="0 - без пула, в потоках клиентов")
+        parser.add_argument('--queue-size', type=int, default=config['QUEUE_SIZE'])
+        parser.add_argument('--concurrency', type=int, default=None, help="Параллельных клиентов, по умолчанию workers + queue-size")
+
+    def handle(self, *args, seconds, iterations, workers, queue_size, concurrency, **options):
+        concurrency = concurrency or max(workers + queue_size, 1)
+        pool = HashingPool(workers, queue_size, start_method=settings.PASSWORD_HASHING['START_METHOD'])
+        # Первый вызов запускает процессы пула, в замер он не входит
+        pool.pbkdf2('sha256', 'warm-up', 'salt', iterations)
+
+        latencies = []
+        rejected = 0
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def client(number):
+            nonlocal rejected
+            own, busy = [], 0
+            # Как во view входа: при заполненной очереди отказ, а не ожидание
+            with reject_when_busy():
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        pool.pbkdf2('sha256', f'password-{number}', 'benchmarksalt', iterations)
+                    except PasswordHashingBusy:
+                        busy += 1
+                        time.sleep(0.001)
+                        continue
+                    own.append(time.perf_counter() - started)
+            with lock:
+                latencies.extend(own)
+                rejected += busy
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as clients:
+            list(clients.map(client, range(concurrency)))
+        elapsed = time.perf_counter() - started
+        pool.shutdown()
+
+        cores = min(workers or concurrency, os.cpu_count() or 1)
+        rate = len(latencies) / elapsed
+        self.stdout.write(f"iterations={iterations} workers={workers} queue_size={queue_size} concurrency={concurrency}")
+        self.stdout.write(f"logins: {len(latencies)} за {elapsed:.1f} с, отклонено (429): {rejected}")
+        self.stdout.write(f"logins/sec: {rate:.1f}, на ядро ({cores}): {rate / cores:.1f}")
+        if latencies:
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.stdout.write(f"latency ms: p50={statistics.median(latencies) * 1000:.1f} p95={p95 * 1000:.1f}")
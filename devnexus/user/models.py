@@ -7,6 +7,8 @@ class User(AbstractUser):
         upload_to="users_images", blank=True, null=True, verbose_name="Аватар"
     )
     description = models.TextField(max_length=150, blank=True)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)  # миниатюры аватара, см. devnexus/images.py
+    token_version = models.PositiveIntegerField(default=0, editable=False)  # растет при смене пароля, см. user/authentication.py
     
     class Meta:
         db_table = "user"
@@ -1,12 +1,14 @@
 from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
+from devnexus.images import ImageVariantField, ImageVariantsSerializerMixin
+from devnexus.instrumentation import InstrumentedSerializerMixin
 from django.contrib.auth import authenticate
 from django.core import exceptions
 from user.models import User
 import re
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(
         write_only=True,
         required=True,
@@ -58,10 +60,12 @@ class UserSerializer(serializers.ModelSerializer):
         return user
     
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(ImageVariantsSerializerMixin, InstrumentedSerializerMixin, serializers.ModelSerializer):
+    avatar = ImageVariantField(required=False, allow_null=True)
+
     class Meta:
         model = User
-        fields = ['username', 'email', 'description']
+        fields = ['username', 'email', 'description', 'avatar']
         extra_kwargs = {
             'username': {'required': False},
             'email': {'required': False},
@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .authentication import invalidate_token_user
+from .lookup import username_index
+from .models import User
+
+
+# Индекс имен меняется только после коммита, иначе в нем останутся имена из откаченных транзакций
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, update_fields, **kwargs):
+    if instance.pk is None or (update_fields is not None and 'username' not in update_fields):
+        return
+    instance._previous_username = User.objects.filter(pk=instance.pk).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def index_username(sender, instance, created, **kwargs):
+    username = instance.username
+    previous = getattr(instance, '_previous_username', None)
+    if created:
+        transaction.on_commit(lambda: username_index().add(username))
+    elif previous is not None and previous != username:
+        transaction.on_commit(lambda: username_index().changed(removed=[previous], added=[username]))
+
+
+@receiver(post_delete, sender=User)
+def unindex_username(sender, instance, **kwargs):
+    username = instance.username
+    transaction.on_commit(lambda: username_index().changed(removed=[username]))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_token_user_state(sender, instance, **kwargs):
+    # username, is_active и token_version в кэше аутентификации
+    invalidate_token_user(instance.pk)
@@ -1,7 +1,28 @@
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
+from django.core.cache import cache
+from django.db import connection
+from django.conf import settings
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from group.models import Card, CardTag, ColumnBoard, Group
 from .models import User
+from rest_framework.throttling import ScopedRateThrottle
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from .lookup import UsernameIndex, username_index
+from .hashing import HashingPool, PasswordHashingBusy, hashing_pool, reject_when_busy
+from .throttling import CacheBucketStore, ShardedMemoryBucketStore, limiter_metrics, take
+from unittest import mock
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+import hashlib
+import io
+import json
+import shutil
+import tempfile
+import threading
 
 class RegisterViewTests(APITestCase):
     def test_register_user_success(self):
@@ -186,3 +207,425 @@ class UserProfileViewTests(APITestCase):
         }
         response = self.client.put(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ProfileQueryCountTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='busyuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+
+    def add_groups(self, count):
+        for i in range(count):
+            group = Group.objects.create(name=f'Group {Group.objects.count()}', admin=self.user)
+            group.members.add(self.user)
+            column = ColumnBoard.objects.create(name='todo', group=group)
+            tag = CardTag.objects.create(name='bug', group=group)
+            for j in range(2):
+                card = Card.objects.create(title=f'{group.name} card {j}', group=group, column=column, assignee=self.user)
+                card.tags.add(tag)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries), response
+
+    def test_query_count_does_not_depend_on_groups(self):
+        for url in (reverse('user:me'), reverse('user:profile', kwargs={'username': 'busyuser'})):
+            with self.subTest(url=url):
+                Group.objects.all().delete()
+                self.add_groups(1)
+                few, _ = self.count_queries(url)
+                self.add_groups(5)
+                many, response = self.count_queries(url)
+                self.assertEqual(few, many)
+                self.assertEqual(len(response.data['groups']), 6)
+
+    def test_cards_are_partitioned_by_group(self):
+        self.add_groups(3)
+        response = self.client.get(reverse('user:me'))
+        for group_data in response.data['groups']:
+            self.assertEqual(len(group_data['cards']), 2)
+            for card in group_data['cards']:
+                self.assertTrue(card['title'].startswith(group_data['name'] + ' '))
+                self.assertEqual(card['tags'][0]['name'], 'bug')
+
+
+class UsernameLookupTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        # Новый индекс на каждый тест: после отката SQLite выдает те же pk
+        self.enterContext(override_settings(USER_LOOKUP={**settings.USER_LOOKUP, 'LIMIT': 3, 'REBUILD_INTERVAL': 600}))
+        self.user = User.objects.create(username='lookupuser')
+        for username in ('alice', 'Alina', 'albert', 'alfred', 'bob'):
+            User.objects.create(username=username)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('user:lookup')
+
+    def lookup(self, prefix, **params):
+        response = self.client.get(self.url, {'prefix': prefix, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['usernames']
+
+    def test_prefix_is_case_insensitive_and_limited(self):
+        self.assertEqual(self.lookup('AL'), ['albert', 'alfred', 'alice'])
+        self.assertEqual(self.lookup('ali', limit=10), ['alice', 'Alina'])
+        self.assertEqual(self.lookup('zz'), [])
+
+    def test_lookup_does_not_scan_users(self):
+        self.lookup('a')
+        with CaptureQueriesContext(connection) as queries:
+            self.lookup('al')
+        user_queries = [q['sql'] for q in queries if 'FROM "user"' in q['sql'] and 'WHERE "user"."id" >' not in q['sql']]
+        self.assertEqual(user_queries, [])
+
+    def test_index_follows_user_changes(self):
+        self.lookup('a')
+        User.objects.create(username='alvin')
+        self.assertIn('alvin', self.lookup('alv'))
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(username='alice').get().delete()
+            alfred = User.objects.get(username='alfred')
+            alfred.username = 'frederick'
+            alfred.save()
+        self.assertEqual(self.lookup('al', limit=10), ['albert', 'Alina', 'alvin'])
+        self.assertEqual(self.lookup('fre'), ['frederick'])
+
+    def test_validation_and_auth(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'prefix': 'a', 'limit': 500}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(self.url, {'prefix': 'a'}).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_rate_limited(self):
+        with mock.patch.object(ScopedRateThrottle, 'THROTTLE_RATES', {'user-lookup': '2/minute'}):
+            for _ in range(2):
+                self.lookup('a')
+            response = self.client.get(self.url, {'prefix': 'a'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+class UsernameIndexRebuildTests(TransactionTestCase):
+    # Фоновый поток читает через свое соединение, поэтому данные должны быть закоммичены
+    def setUp(self):
+        cache.clear()
+        self.enterContext(override_settings(USER_LOOKUP={**settings.USER_LOOKUP, 'REBUILD_INTERVAL': 600}))
+        for username in ('alice', 'albert'):
+            User.objects.create(username=username)
+        self.index = username_index()
+
+    def test_changes_from_other_processes_rebuild_in_background(self):
+        self.assertEqual(self.index.lookup('al', 10), ['albert', 'alice'])
+        # Другой процесс переименовал пользователя: его сигнал меняет только версию в общем кэше
+        User.objects.filter(username='alice').update(username='bob')
+        UsernameIndex().changed()
+
+        # Перестройка ждет, пока запрос не получит ответ, иначе поток мог бы успеть раньше
+        answered = threading.Event()
+        rebuild_now = self.index.rebuild
+
+        def slow_rebuild():
+            answered.wait(5)
+            rebuild_now()
+
+        with mock.patch.object(UsernameIndex, 'rebuild', side_effect=slow_rebuild) as rebuild:
+            # Пока новый индекс строится, запрос отвечает по старому и не ждет
+            self.assertEqual(self.index.lookup('al', 10), ['albert', 'alice'])
+            answered.set()
+            self.index._builder.join()
+        rebuild.assert_called_once()
+        self.assertEqual(self.index.lookup('al', 10), ['albert'])
+        self.assertEqual(self.index.lookup('b', 10), ['bob'])
+        self.assertFalse(self.index.is_stale())
+
+    def test_own_changes_do_not_rebuild(self):
+        self.index.lookup('al', 10)
+        User.objects.get(username='alice').delete()
+        self.assertFalse(self.index.is_stale())
+        self.assertEqual(self.index.lookup('al', 10), ['albert'])
+
+    def test_periodic_rebuild_in_background(self):
+        self.index.lookup('al', 10)
+        self.index._built_at -= 601
+        # update() идет мимо сигналов: такое изменение находит только периодическая перестройка
+        User.objects.filter(username='alice').update(username='bob')
+        self.assertTrue(self.index.is_stale())
+        self.index.lookup('al', 10)
+        self.index._builder.join()
+        self.assertEqual(self.index.lookup('al', 10), ['albert'])
+
+
+def image_upload(name='photo.jpg', size=(400, 300), image_format='JPEG', exif=True):
+    output = io.BytesIO()
+    options = {}
+    if exif:
+        metadata = Image.Exif()
+        metadata[0x010F] = 'SecretCamera'
+        options['exif'] = metadata
+    Image.new('RGB', size, (200, 30, 30)).save(output, image_format, **options)
+    return SimpleUploadedFile(name, output.getvalue(), content_type=f'image/{image_format.lower()}')
+
+
+class AvatarPipelineTests(APITestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        self.enterContext(override_settings(
+            MEDIA_ROOT=media,
+            IMAGE_PIPELINE={**settings.IMAGE_PIPELINE, 'WORKERS': 0},
+        ))
+        self.user = User.objects.create(username='avataruser')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('user:me')
+
+    def upload(self, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.put(self.url, {'avatar': upload}, format='multipart')
+
+    def test_upload_strips_metadata_and_builds_variants(self):
+        response = self.upload(image_upload())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertNotIn('photo', self.user.avatar.name)
+        with default_storage.open(self.user.avatar.name) as stored:
+            self.assertEqual(len(Image.open(stored).getexif()), 0)
+        self.assertEqual(set(self.user.avatar_variants), {'48', '96', '256'})
+        for paths in self.user.avatar_variants.values():
+            for path in paths.values():
+                self.assertTrue(default_storage.exists(path))
+        with default_storage.open(self.user.avatar_variants['48']['webp']) as thumbnail:
+            self.assertEqual(Image.open(thumbnail).size, (48, 48))
+
+    def test_smallest_fitting_variant_is_served(self):
+        self.upload(image_upload())
+        # force_authenticate отдает тот же объект, миниатюры записаны в БД через update()
+        self.user.refresh_from_db()
+        avatar = self.client.get(self.url).data['user']['avatar']
+        self.assertTrue(avatar.endswith('_96.webp'))
+        avatar = self.client.get(self.url, {'image_size': 60, 'image_format': 'jpeg'}).data['user']['avatar']
+        self.assertTrue(avatar.endswith('_96.jpg'))
+        avatar = self.client.get(self.url, {'image_size': 1000}).data['user']['avatar']
+        self.assertTrue(avatar.endswith('_256.webp'))
+
+    def test_original_is_not_in_board_payload(self):
+        group = Group.objects.create(name='Avatar Group', admin=self.user)
+        group.members.add(self.user)
+        self.upload(image_upload())
+        self.user.refresh_from_db()
+        board = self.client.get(reverse('group:group-detail', kwargs={'group_uuid': group.group_uuid}))
+        avatar = json.loads(board.content)['members'][0]['avatar']
+        self.assertTrue(avatar.endswith('_96.webp'))
+        self.assertNotIn(self.user.avatar.name, avatar)
+        # В профиле тот же URL, что и в снимке доски
+        self.assertEqual(self.client.get(self.url).data['user']['avatar'], avatar)
+        self.assertTrue(avatar.startswith(settings.MEDIA_URL))
+
+    def test_replacing_avatar_removes_old_files(self):
+        self.upload(image_upload())
+        self.user.refresh_from_db()
+        old = [self.user.avatar.name] + [path for paths in self.user.avatar_variants.values() for path in paths.values()]
+        self.upload(image_upload(image_format='PNG', name='next.png'))
+        for path in old:
+            self.assertFalse(default_storage.exists(path))
+
+    def test_invalid_uploads_are_rejected(self):
+        response = self.upload(SimpleUploadedFile('fake.jpg', b'not an image', content_type='image/jpeg'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with self.settings(IMAGE_PIPELINE={**settings.IMAGE_PIPELINE, 'WORKERS': 0, 'MAX_PIXELS': 1000}):
+            response = self.upload(image_upload())
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+
+
+class TokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tokenuser', email='token@example.com', password='OldPass123!')
+        self.group = Group.objects.create(name='Token Group', admin=self.user)
+        self.group.members.add(self.user)
+        self.tokens = self.obtain('OldPass123!')
+
+    def obtain(self, password):
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'tokenuser', 'password': password})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def get(self, url, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return self.client.get(url)
+
+    def test_user_row_is_not_loaded_for_group_endpoints(self):
+        url = reverse('group:card-list', kwargs={'group_uuid': self.group.group_uuid})
+        self.get(url, self.tokens['access'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(url, self.tokens['access'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q['sql'] for q in queries if 'FROM "user" WHERE' in q['sql']])
+
+    def test_full_user_is_loaded_on_demand(self):
+        response = self.get(reverse('user:me'), self.tokens['access'])
+        self.assertEqual(response.data['user']['email'], 'token@example.com')
+        response = self.client.post(reverse('group:group-create'), {'name': 'Created'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Group.objects.get(name='Created').members.filter(pk=self.user.pk).exists())
+
+    def test_password_change_revokes_tokens(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+        response = self.client.put(reverse('user:change-password'), {'old_password': 'OldPass123!', 'new_password': 'NewPass456!'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        me = reverse('user:me')
+        self.assertEqual(self.get(me, self.tokens['access']).status_code, status.HTTP_401_UNAUTHORIZED)
+        refreshed = self.client.post(reverse('token_refresh'), {'refresh': self.tokens['refresh']})
+        self.assertEqual(self.get(me, refreshed.data['access']).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.get(me, response.data['access']).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get(me, self.obtain('NewPass456!')['access']).status_code, status.HTTP_200_OK)
+
+    def test_deactivated_user_is_rejected(self):
+        self.user.is_active = False
+        self.user.save()
+        response = self.get(reverse('user:me'), self.tokens['access'])
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PasswordHashingPoolTests(APITestCase):
+    def setUp(self):
+        self.enterContext(override_settings(PASSWORD_HASHING={**settings.PASSWORD_HASHING, 'ITERATIONS': 1000}))
+        self.user = User.objects.create_user(username='hashuser', password='HashPass123!')
+
+    def test_hashes_are_compatible_with_django_pbkdf2(self):
+        encoded = make_password('secret')
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(PBKDF2PasswordHasher().verify('secret', encoded))
+        legacy = PBKDF2PasswordHasher().encode('secret', 'legacysalt', 2000)
+        self.user.password = legacy
+        self.assertTrue(self.user.check_password('secret'))
+        # При входе хэш пересчитывается с текущим числом итераций
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_saturated_pool_rejects_immediately(self):
+        pool = HashingPool(workers=1, queue_size=0)
+        self.addCleanup(pool.shutdown)
+        pool._slots.acquire()
+        with reject_when_busy(), self.assertRaises(PasswordHashingBusy):
+            pool.pbkdf2('sha256', 'secret', 'salt', 1000)
+        pool._slots.release()
+        self.assertEqual(pool.pbkdf2('sha256', 'secret', 'salt', 1000), hashlib.pbkdf2_hmac('sha256', b'secret', b'salt', 1000))
+
+    def test_saturated_pool_waits_outside_views(self):
+        # createsuperuser, админка и т. п. дожидаются места в очереди
+        pool = HashingPool(workers=1, queue_size=0)
+        self.addCleanup(pool.shutdown)
+        pool._slots.acquire()
+        timer = threading.Timer(0.2, pool._slots.release)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        self.assertEqual(pool.pbkdf2('sha256', 'secret', 'salt', 1000), hashlib.pbkdf2_hmac('sha256', b'secret', b'salt', 1000))
+
+    def test_login_returns_429_when_saturated(self):
+        with self.settings(PASSWORD_HASHING={**settings.PASSWORD_HASHING, 'ITERATIONS': 1000, 'WORKERS': 1, 'QUEUE_SIZE': 0}):
+            slots = hashing_pool()._slots
+            slots.acquire()
+            try:
+                response = self.client.post(reverse('user:login'), {'username': 'hashuser', 'password': 'HashPass123!'})
+            finally:
+                slots.release()
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertIn('Retry-After', response)
+            response = self.client.post(reverse('user:login'), {'username': 'hashuser', 'password': 'HashPass123!'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            slots.acquire()
+            try:
+                data = {'username': 'hashuser', 'password': 'HashPass123!'}
+                response = self.client.post(reverse('token_obtain_pair'), data)
+            finally:
+                slots.release()
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+class AuthThrottleTests(APITestCase):
+    def setUp(self):
+        # Новый AUTH_THROTTLE - новое хранилище корзин на каждый тест
+        self.enterContext(override_settings(AUTH_THROTTLE={
+            'STORE': 'user.throttling.ShardedMemoryBucketStore',
+            'OPTIONS': {'shards': 4},
+            'RATES': {
+                'login': {'ip': '100/minute', 'username': '2/minute'},
+                'register': {'ip': '1/hour'},
+            },
+        }))
+        User.objects.create_user(username='victim', password='VictimPass123!')
+
+    def login(self, username, url=None):
+        return self.client.post(url or reverse('user:login'), {'username': username, 'password': 'wrong'})
+
+    def test_bucket_refills_over_period(self):
+        state, allowed, _ = take(None, 2, 60, now=0)
+        state, allowed, _ = take(state, 2, 60, now=0)
+        self.assertTrue(allowed)
+        state, allowed, wait = take(state, 2, 60, now=1)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 29)
+        _, allowed, _ = take(state, 2, 60, now=31)
+        self.assertTrue(allowed)
+
+    def test_username_bucket(self):
+        for _ in range(2):
+            self.assertEqual(self.login('Victim').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.login('victim')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.login('someone').status_code, status.HTTP_400_BAD_REQUEST)
+        # Корзина имени общая для /users/login/ и /api/token/
+        self.assertEqual(self.login('victim', reverse('token_obtain_pair')).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_ip_bucket(self):
+        url = reverse('user:registration')
+        data = {'username': 'newcomer', 'password': 'NewcomerPass123!'}
+        self.assertEqual(self.client.post(url, data).status_code, status.HTTP_201_CREATED)
+        data['username'] = 'second'
+        self.assertEqual(self.client.post(url, data).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.client.post(url, data, REMOTE_ADDR='10.0.0.2').status_code, status.HTTP_201_CREATED)
+
+    def test_spoofed_forwarded_for_does_not_reset_ip_bucket(self):
+        url = reverse('user:registration')
+        data = {'username': 'newcomer', 'password': 'NewcomerPass123!'}
+        self.assertEqual(self.client.post(url, data, HTTP_X_FORWARDED_FOR='1.1.1.1').status_code, status.HTTP_201_CREATED)
+        data['username'] = 'second'
+        response = self.client.post(url, data, HTTP_X_FORWARDED_FOR='2.2.2.2')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_rejected_request_does_not_spend_other_buckets(self):
+        rates = {'login': {'ip': '3/minute', 'username': '1/minute'}}
+        with override_settings(AUTH_THROTTLE={**settings.AUTH_THROTTLE, 'RATES': rates}):
+            self.assertEqual(self.login('victim').status_code, status.HTTP_400_BAD_REQUEST)
+            # Корзина имени пуста: эти попытки не должны тратить корзину IP
+            for _ in range(5):
+                self.assertEqual(self.login('victim').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            for username in ('first', 'second'):
+                self.assertEqual(self.login(username).status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(self.login('third').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_cache_store_takes_all_or_nothing(self):
+        store = CacheBucketStore(prefix='test-throttle')
+        self.assertEqual(store.take('b', 1, 60)[0], True)
+        results = store.take_all([('a', 2, 60), ('b', 1, 60)])
+        self.assertEqual([allowed for allowed, _ in results], [True, False])
+        self.assertEqual(store.take_all([('a', 2, 60)]), [(True, 0)])
+        self.assertEqual(store.take('a', 2, 60)[0], True)
+
+    def test_sharded_store_evicts_idle_buckets(self):
+        store = ShardedMemoryBucketStore(shards=2, max_keys=3)
+        for i in range(20):
+            store.take(f'key{i}', 5, 60)
+        self.assertLessEqual(store.size(), 6)
+
+    def test_metrics(self):
+        for _ in range(3):
+            self.login('victim')
+        lines = limiter_metrics.render()
+        throttled = [line for line in lines if 'scope="login",key="username",result="throttled"' in line]
+        self.assertEqual(len(throttled), 1)
+        self.assertGreaterEqual(int(throttled[0].rsplit(' ', 1)[1]), 1)
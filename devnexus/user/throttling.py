@@ -0,0 +1,217 @@
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+
+# Ограничение попыток входа и регистрации корзинами токенов (AUTH_THROTTLE).
+# У каждого ключа (IP, имя пользователя) своя корзина на capacity попыток,
+# которая равномерно наполняется за period секунд. Проверка - O(1) и без записи в БД.
+# ShardedMemoryBucketStore хранит корзины в памяти процесса (один узел),
+# CacheBucketStore - в общем кэше Django для нескольких узлов.
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'5/minute' -> (5, 60): корзина на 5 попыток, полностью наполняется за минуту"""
+    capacity, period = rate.split('/')
+    return int(capacity), PERIODS[period[0]]
+
+
+def refill(state, capacity, period, now):
+    if state is None:
+        return float(capacity)
+    tokens, updated = state
+    return min(float(capacity), tokens + (now - updated) * capacity / period)
+
+
+def take(state, capacity, period, now):
+    """Возвращает (новое состояние, разрешено, сколько ждать до следующей попытки)"""
+    tokens = refill(state, capacity, period, now)
+    if tokens >= 1:
+        return (tokens - 1, now), True, 0
+    return (tokens, now), False, (1 - tokens) * period / capacity
+
+
+class BaseBucketStore:
+    def take_all(self, buckets):
+        """
+        buckets - [(key, capacity, period)]. Возвращает [(разрешено, сколько ждать)]
+        для каждой корзины; попытка списывается, только если разрешили все
+        """
+        raise NotImplementedError
+
+    def take(self, key, capacity, period):
+        return self.take_all([(key, capacity, period)])[0]
+
+    def size(self):
+        return None
+
+
+class ShardedMemoryBucketStore(BaseBucketStore):
+    """
+    Корзины в памяти процесса, разбитые на shards частей со своими блокировками,
+    чтобы параллельные запросы с разными ключами не ждали друг друга.
+    В каждой части не больше max_keys корзин, давно не использованные вытесняются
+    (такая корзина скорее всего уже полна, и потеря ее состояния ничего не меняет).
+    """
+
+    def __init__(self, shards=16, max_keys=10000):
+        self.max_keys = max_keys
+        self._shards = [(threading.Lock(), OrderedDict()) for _ in range(shards)]
+
+    def shard_index(self, key):
+        return zlib.crc32(key.encode()) % len(self._shards)
+
+    def take_all(self, buckets):
+        # Части блокируются по возрастанию номера, чтобы два запроса не ждали друг друга по кругу
+        indexes = sorted({self.shard_index(key) for key, _, _ in buckets})
+        with ExitStack() as stack:
+            for index in indexes:
+                stack.enter_context(self._shards[index][0])
+            now = time.monotonic()
+            results = [
+                (key, take(self._shards[self.shard_index(key)][1].get(key), capacity, period, now))
+                for key, capacity, period in buckets
+            ]
+            if all(allowed for _, (_, allowed, _) in results):
+                for key, (state, _, _) in results:
+                    shard = self._shards[self.shard_index(key)][1]
+                    shard[key] = state
+                    shard.move_to_end(key)
+                    if len(shard) > self.max_keys:
+                        shard.popitem(last=False)
+        return [(allowed, wait) for _, (_, allowed, wait) in results]
+
+    def size(self):
+        return sum(len(buckets) for _, buckets in self._shards)
+
+
+class CacheBucketStore(BaseBucketStore):
+    """
+    Корзины в кэше Django (Redis, Memcached), общие для всех узлов.
+    Чтение и запись не атомарны: одновременные попытки с одним ключом с разных
+    узлов могут пройти обе, превышение ограничено числом воркеров.
+    """
+
+    def __init__(self, cache_alias='default', prefix='auth-throttle'):
+        self.cache_alias = cache_alias
+        self.prefix = prefix
+
+    def take_all(self, buckets):
+        cache = caches[self.cache_alias]
+        cache_keys = [f'{self.prefix}:{key}' for key, _, _ in buckets]
+        states = cache.get_many(cache_keys)
+        now = time.time()
+        results = [
+            take(states.get(cache_key), capacity, period, now)
+            for cache_key, (_, capacity, period) in zip(cache_keys, buckets)
+        ]
+        if all(allowed for _, allowed, _ in results):
+            for cache_key, (_, _, period), (state, _, _) in zip(cache_keys, buckets, results):
+                # Через period корзина снова полна, хранить ее дольше незачем
+                cache.set(cache_key, state, period)
+        return [(allowed, wait) for _, allowed, wait in results]
+
+
+class LimiterMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(int)
+
+    def observe(self, scope, kind, allowed):
+        with self._lock:
+            self._counts[(scope, kind, 'allowed' if allowed else 'throttled')] += 1
+
+    def render(self, store_size=None):
+        lines = [
+            '# HELP devnexus_auth_throttle_total Проверки ограничителя попыток входа и регистрации',
+            '# TYPE devnexus_auth_throttle_total counter',
+        ]
+        with self._lock:
+            counts = sorted(self._counts.items())
+        for (scope, kind, result), count in counts:
+            lines.append(f'devnexus_auth_throttle_total{{scope="{scope}",key="{kind}",result="{result}"}} {count}')
+        if store_size is not None:
+            lines += [
+                '# HELP devnexus_auth_throttle_buckets Корзины в памяти процесса',
+                '# TYPE devnexus_auth_throttle_buckets gauge',
+                f'devnexus_auth_throttle_buckets {store_size}',
+            ]
+        return lines
+
+
+limiter_metrics = LimiterMetrics()
+
+_bucket_store = None
+
+
+def bucket_store():
+    global _bucket_store
+    if _bucket_store is None:
+        config = settings.AUTH_THROTTLE
+        _bucket_store = import_string(config['STORE'])(**config.get('OPTIONS', {}))
+    return _bucket_store
+
+
+@receiver(setting_changed)
+def reset_bucket_store(setting, **kwargs):
+    global _bucket_store
+    if setting == 'AUTH_THROTTLE':
+        _bucket_store = None
+
+
+def metrics_lines():
+    return limiter_metrics.render(bucket_store().size())
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF-throttle по корзинам AUTH_THROTTLE['RATES'][scope]: {'ip': '20/minute', 'username': '5/minute'}.
+    Запрос проходит, только если нашлась попытка во всех его корзинах; отклоненный
+    запрос не списывает попытки и из тех корзин, что его пропустили.
+    IP берется по REST_FRAMEWORK['NUM_PROXIES']: без доверенных прокси - REMOTE_ADDR,
+    иначе подставной X-Forwarded-For давал бы новую корзину на каждый запрос.
+    """
+
+    scope = None
+    username_field = 'username'
+
+    def get_keys(self, request):
+        keys = {'ip': self.get_ident(request)}
+        username = request.data.get(self.username_field) if hasattr(request.data, 'get') else None
+        if isinstance(username, str) and username:
+            keys['username'] = username.casefold()
+        return keys
+
+    def allow_request(self, request, view):
+        rates = settings.AUTH_THROTTLE['RATES'][self.scope]
+        keys = {kind: key for kind, key in self.get_keys(request).items() if kind in rates}
+        results = bucket_store().take_all([
+            (f'{self.scope}:{kind}:{key}', *parse_rate(rates[kind])) for kind, key in keys.items()
+        ])
+        self.waits = []
+        for kind, (allowed, wait) in zip(keys, results):
+            limiter_metrics.observe(self.scope, kind, allowed)
+            if not allowed:
+                self.waits.append(wait)
+        return not self.waits
+
+    def wait(self):
+        return max(self.waits) if self.waits else None
+
+
+class LoginThrottle(TokenBucketThrottle):
+    scope = 'login'
+
+
+class RegisterThrottle(TokenBucketThrottle):
+    scope = 'register'
@@ -8,6 +8,7 @@ urlpatterns = [
     path("registration/", views.RegisterView.as_view(), name="registration"),
     path("change_password/", views.ChangePasswordView.as_view(), name="change-password"),
     path("me/", views.CurrentUserProfileView.as_view(), name="me"),
+    path("lookup/", views.UsernameLookupView.as_view(), name="lookup"),
     path("<str:username>/", views.UserProfileView.as_view(), name="profile"),
     path("<str:username>/<str:group_uuid>/", views.UserProfileGroupView.as_view(), name="profile_group"),
 ]
@@ -1,21 +1,60 @@
 from rest_framework import generics, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.throttling import ScopedRateThrottle
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework_simplejwt import views as jwt_views
 from rest_framework import mixins, status
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import login
+from django.http import Http404
+from django.shortcuts import aget_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+import hashlib
+from collections import defaultdict
 from .serializers import *
 from group.serializers import CardSerializer, GroupSerializerForProfile, UserTagRelationSerializer
 from .permissions import IsOwnerOrReadOnly
+from .lookup import username_index
+from .authentication import TokenVersionObtainPairSerializer
+from .throttling import LoginThrottle, RegisterThrottle
+from .hashing import PasswordHashingBusy, reject_when_busy
 from user.models import User
 from group.models import Group, Card, UserTagRelation, UserTag
+from group.cache import snapshot_cache, user_version_key
+from devnexus.async_views import AsyncAPIViewMixin
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 
-class RegisterView(generics.CreateAPIView):
+class PasswordHashingViewMixin:
+    """Хэширование пароля в этой view не ждет очереди пула: при заполненной - сразу 429"""
+
+    def dispatch(self, request, *args, **kwargs):
+        with reject_when_busy():
+            return super().dispatch(request, *args, **kwargs)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, PasswordHashingBusy):
+            exc = Throttled(
+                wait=exc.retry_after,
+                detail="Сервер занят проверкой паролей, повторите запрос позже.",
+                code='password_hashing_busy',
+            )
+        return super().handle_exception(exc)
+
+
+class TokenObtainPairView(PasswordHashingViewMixin, jwt_views.TokenObtainPairView):
+    throttle_classes = [LoginThrottle]
+
+
+class RegisterView(PasswordHashingViewMixin, generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [RegisterThrottle]
 
     @swagger_auto_schema(
         operation_summary="Регистрация пользователя",
@@ -73,6 +112,39 @@ class RegisterView(generics.CreateAPIView):
         return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 
+def profile_groups_data(user):
+    """Группы пользователя с его карточками: карточки всех групп одной выборкой"""
+    groups = list(user.group_memberships.all())
+    groups_data = GroupSerializerForProfile(groups, many=True).data
+
+    cards = list(
+        Card.objects.filter(assignee=user, group__in=[group.id for group in groups])
+        .select_related('column', 'assignee')
+        .prefetch_related('tags')
+        .order_by('id')
+    ) if groups else []
+    cards_by_group = defaultdict(list)
+    for card, card_data in zip(cards, CardSerializer(cards, many=True).data):
+        cards_by_group[card.group_id].append(card_data)
+
+    for group, group_data in zip(groups, groups_data):
+        group_data["cards"] = cards_by_group[group.id]
+    return groups_data
+
+
+def profile_etag(request, *args, **kwargs):
+    # Профиль зависит от данных пользователя и от версий всех его групп
+    if not request.user.is_authenticated:
+        return None
+    cache = snapshot_cache()
+    group_uuids = request.user.group_memberships.order_by('id').values_list('group_uuid', flat=True)
+    versions = [cache.version(user_version_key(request.user.pk))]
+    versions += [cache.version(group_uuid) for group_uuid in group_uuids]
+    # Размер и формат миниатюр задаются параметрами запроса
+    versions.append(request.META.get('QUERY_STRING', ''))
+    return "profile-" + hashlib.md5("|".join(versions).encode()).hexdigest()
+
+
 class CurrentUserProfileView(generics.RetrieveAPIView, mixins.UpdateModelMixin):
     serializer_class = UserProfileSerializer
     permission_classes = [IsOwnerOrReadOnly]
@@ -143,26 +215,15 @@ class CurrentUserProfileView(generics.RetrieveAPIView, mixins.UpdateModelMixin):
             )
         }
     )
+    @method_decorator(condition(etag_func=profile_etag))
     def get(self, request, *args, **kwargs):
         try:
             user = self.get_object()
             user_data = self.get_serializer(user).data
             
-            groups = user.group_memberships.all()
-            groups_data = GroupSerializerForProfile(groups, many=True).data
-            
-            # cards = Card.objects.filter(assignee=user)
-            # cards_data = CardSerializer(cards, many=True).data
-
-            for group, group_data in zip(groups, groups_data):
-                # Фильтруем карточки пользователя в текущей группе
-                cards = Card.objects.filter(group=group, assignee=user)
-                # Сериализуем карточки
-                group_data["cards"] = CardSerializer(cards, many=True).data
-            
             response_data = {
                 'user': user_data,
-                'groups': groups_data,
+                'groups': profile_groups_data(user),
             }
 
         except Exception as e:
@@ -282,21 +343,9 @@ class UserProfileView(mixins.RetrieveModelMixin,
             user = self.get_object()
             user_data = self.get_serializer(user).data
             
-            groups = user.group_memberships.all()
-            groups_data = GroupSerializerForProfile(groups, many=True).data
-            
-            # cards = Card.objects.filter(assignee=user)
-            # cards_data = CardSerializer(cards, many=True).data
-
-            for group, group_data in zip(groups, groups_data):
-                # Фильтруем карточки пользователя в текущей группе
-                cards = Card.objects.filter(group=group, assignee=user)
-                # Сериализуем карточки
-                group_data["cards"] = CardSerializer(cards, many=True).data
-            
             response_data = {
                 'user': user_data,
-                'groups': groups_data,
+                'groups': profile_groups_data(user),
             }
 
         except Exception as e:
@@ -355,7 +404,49 @@ class UserProfileView(mixins.RetrieveModelMixin,
         return self.update(request, *args, **kwargs)
     
 
-class ChangePasswordView(APIView):
+class UsernameLookupView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'user-lookup'
+
+    @swagger_auto_schema(
+        operation_summary="Автодополнение имени пользователя",
+        operation_description="""
+        Возвращает до limit имен пользователей, начинающихся с prefix (без учета регистра),
+        в алфавитном порядке. Число запросов ограничено (USER_LOOKUP_RATE).
+        """,
+        manual_parameters=[
+            openapi.Parameter('prefix', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        ],
+        responses={
+            200: openapi.Response(
+                description="Найденные имена",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'usernames': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING))
+                    }
+                )
+            )
+        }
+    )
+    def get(self, request):
+        config = settings.USER_LOOKUP
+        prefix = request.query_params.get('prefix', '')
+        if not prefix:
+            return Response({"error": "Укажите prefix."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', config['LIMIT']))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= config['MAX_LIMIT']:
+            return Response({"error": f"limit - целое число от 1 до {config['MAX_LIMIT']}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"usernames": username_index().lookup(prefix, limit)})
+
+
+class ChangePasswordView(PasswordHashingViewMixin, APIView):
     permission_classes = [IsOwnerOrReadOnly]
     
     @swagger_auto_schema(
@@ -387,10 +478,14 @@ class ChangePasswordView(APIView):
         ),
         responses={
             200: openapi.Response(
-                description="Пароль успешно изменен",
+                description="Пароль успешно изменен, старые токены отозваны",
                 schema=openapi.Schema(
                     type=openapi.TYPE_OBJECT,
-                    properties={'status': openapi.Schema(type=openapi.TYPE_STRING)}
+                    properties={
+                        'status': openapi.Schema(type=openapi.TYPE_STRING),
+                        'refresh': openapi.Schema(type=openapi.TYPE_STRING),
+                        'access': openapi.Schema(type=openapi.TYPE_STRING),
+                    }
                 )
             ),
             400: openapi.Response(
@@ -419,18 +514,25 @@ class ChangePasswordView(APIView):
         if serializer.is_valid():
             user = request.user
             user.set_password(serializer.validated_data['new_password'])
+            # Все ранее выданные токены перестают приниматься (user/authentication.py)
+            user.token_version += 1
             user.save()
             
             # update_session_auth_hash(request, user)
             
+            refresh = TokenVersionObtainPairSerializer.get_token(user)
             return Response(
-                {"status": "Пароль успешно изменен"},
+                {
+                    "status": "Пароль успешно изменен",
+                    "refresh": str(refresh),
+                    "access": str(refresh.access_token),
+                },
                 status=status.HTTP_200_OK
             )
         return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserProfileGroupView(mixins.RetrieveModelMixin,generics.GenericAPIView):
+class UserProfileGroupView(AsyncAPIViewMixin, mixins.RetrieveModelMixin, generics.GenericAPIView):
     queryset = User.objects.all()
     serializer_class = UserProfileSerializer
     # permission_classes = [permissions.IsAuthenticated]
@@ -440,14 +542,16 @@ class UserProfileGroupView(mixins.RetrieveModelMixin,generics.GenericAPIView):
         operation_summary="Получение профиля пользователя по конкретной группе",
         operation_description="""
         Получает данные профиля пользователя по конкретной группе.""")
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
         try:
-            user = self.get_object()
+            user = await aget_object_or_404(self.get_queryset(), username=self.kwargs['username'])
+            await sync_to_async(self.check_object_permissions)(request, user)
 
-            group_uuid = self.kwargs['group_uuid']
-            group = Group.objects.get(group_uuid=group_uuid)
+            group = await aget_object_or_404(Group, group_uuid=self.kwargs['group_uuid'])
 
-            cards = Card.objects.filter(group=group, assignee=user)
+            cards = Card.objects.filter(group=group, assignee=user)\
+                .select_related('column', 'assignee').prefetch_related('tags')
+            cards = [card async for card in cards]
             cards_data = CardSerializer(cards, many=True).data
 
             # Вручную сериализуем теги пользователя, я не знаю почему не работает
@@ -462,7 +566,7 @@ class UserProfileGroupView(mixins.RetrieveModelMixin,generics.GenericAPIView):
                     "tag_name": ut.tag.name,
                     "tag_color": ut.tag.color
                 }
-                for ut in user_tags
+                async for ut in user_tags
             ]
 
             return Response({
@@ -470,13 +574,17 @@ class UserProfileGroupView(mixins.RetrieveModelMixin,generics.GenericAPIView):
                 "user_tags": user_tags_data,
                 "cards": cards_data
             })
+        except (Http404, APIException):
+            # 404 и ошибки прав обрабатывает handle_exception
+            raise
         except Exception as e:
             return Response({"error": str(e)}, status=400)
 
 
-class LoginView(generics.GenericAPIView):
+class LoginView(PasswordHashingViewMixin, generics.GenericAPIView):
     serializer_class = LoginSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [LoginThrottle]
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)